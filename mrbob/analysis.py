@@ -0,0 +1,188 @@
+"""Static analysis of the variables a template uses.
+
+Variables are found without rendering: in ``+variable+`` tokens of file and
+directory names, and with :mod:`jinja2.meta` in ``.bob`` files rendered by
+:func:`mrbob.rendering.jinja2_renderer`. Attribute access is followed, so
+``{{{author.name}}}`` uses variable ``author.name``, while ``{{{author}}}``
+uses every variable of the ``author`` namespace.
+
+The analysis is conservative: a variable read only in a branch that is never
+taken still counts as used.
+"""
+
+import hashlib
+import os
+from os import path
+
+from .caching import ensure_directory, read_pickle, write_pickle
+
+# changes whenever the analysis finds different variables, so analyses
+# stored in cache directories by earlier versions are not used
+ANALYSIS_VERSION = 2
+
+# variables used by template files, keyed by their paths, together with the
+# size and modification time of the file they were found in
+analyzed_files = {}
+
+# template roots whose analyses were loaded from a cache directory
+loaded_analyses = set()
+
+
+def find_used_variables(text, environment=None):
+    """Return the variables used by Jinja2 template `text` as a frozenset
+    of dotted names.
+    """
+    from jinja2 import meta, nodes
+
+    if environment is None:
+        from .rendering import jinja2_env as environment
+
+    ast = environment.parse(text)
+    undeclared = meta.find_undeclared_variables(ast)
+    used = set()
+
+    def visit(node):
+        callee = getattr(node, "node", None)
+        if isinstance(node, nodes.Call) and is_chain(callee):
+            # calling a method reads its object, like `author` for
+            # `author.items()`, not a variable named after the method
+            visit(callee.node)
+            if isinstance(callee, nodes.Getitem):
+                visit(callee.arg)
+            for child in node.iter_child_nodes(exclude=("node",)):
+                visit(child)
+            return
+        chain = []
+        base = node
+        while True:
+            if isinstance(base, nodes.Getattr):
+                chain.append(base.attr)
+            elif isinstance(base, nodes.Getitem) and constant_key(base.arg):
+                chain.append(base.arg.value)
+            else:
+                break
+            base = base.node
+        if isinstance(base, nodes.Name) and base.name in undeclared:
+            used.add(".".join([base.name] + chain[::-1]))
+            return
+        for child in node.iter_child_nodes():
+            visit(child)
+
+    def is_chain(node):
+        return isinstance(node, (nodes.Getattr, nodes.Getitem))
+
+    def constant_key(node):
+        return isinstance(node, nodes.Const) and isinstance(node.value, str)
+
+    visit(ast)
+    return frozenset(used)
+
+
+def file_variables(source, fs_path):
+    """Variables used by the template file at `fs_path` of `source`,
+    analyzed again only when its size or modification time changed.
+    """
+    st = source.stat(fs_path)
+    stamp = (st.size, st.mtime_ns)
+    cached = analyzed_files.get(fs_path)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, find_used_variables(source.read_text(fs_path)))
+        analyzed_files[fs_path] = cached
+    return cached[1]
+
+
+def analysis_path(root, cache_dir):
+    key = "%s:%s" % (ANALYSIS_VERSION, root)
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return path.join(cache_dir, digest + ".pickle")
+
+
+def load_analysis(root, cache_dir):
+    """Load analyses of the files below `root` stored in `cache_dir`."""
+    if root in loaded_analyses:
+        return
+    loaded_analyses.add(root)
+    stored = read_pickle(analysis_path(root, cache_dir))
+    if stored is None:
+        return
+    for fs_path, cached in stored.items():
+        analyzed_files.setdefault(fs_path, cached)
+
+
+def save_analysis(root, cache_dir):
+    prefix = path.join(root, "")
+    stored = dict(
+        (fs_path, cached)
+        for fs_path, cached in analyzed_files.items()
+        if fs_path.startswith(prefix)
+    )
+    write_pickle(analysis_path(root, ensure_directory(cache_dir)), stored)
+
+
+def template_dependencies(
+    fs_source_root,
+    ignored_files,
+    ignored_directories,
+    cache_dir=None,
+    analysis_dir=None,
+):
+    """Map each operation source of the :class:`mrbob.rendering.RenderPlan`
+    of the template to the frozenset of variables its target depends on:
+    the ``+variable+`` tokens of its name and of its parent directories and,
+    for ``.bob`` files, the variables used by their content.
+
+    The plan is cached in `cache_dir` as by
+    :func:`mrbob.rendering.get_render_plan`, analyses of template files in
+    `analysis_dir`.
+    """
+    from .rendering import get_render_plan, tokenize_filename
+    from .sources import open_source
+
+    source = open_source(fs_source_root)
+    root = source.root
+    if analysis_dir is not None:
+        load_analysis(root, analysis_dir)
+    plan = get_render_plan(source, ignored_files, ignored_directories, cache_dir)
+
+    dependencies = {"": frozenset()}
+    changed = False
+    for operation in plan.operations:
+        names = set(dependencies[operation.directory])
+        names.update(
+            text
+            for is_variable, text in tokenize_filename(operation.name, os.sep)
+            if is_variable
+        )
+        if operation.action == "render":
+            fs_path = path.join(root, operation.source)
+            before = analyzed_files.get(fs_path)
+            names.update(file_variables(source, fs_path))
+            changed = changed or analyzed_files[fs_path] is not before
+        dependencies[operation.source] = frozenset(names)
+    del dependencies[""]
+    if changed and analysis_dir is not None:
+        save_analysis(root, analysis_dir)
+    return dependencies
+
+
+def variable_index(dependencies):
+    """Map each variable of `dependencies`, as returned by
+    :func:`template_dependencies`, to the sorted sources depending on it.
+    """
+    index = {}
+    for source, names in dependencies.items():
+        for name in names:
+            index.setdefault(name, []).append(source)
+    return dict((name, sorted(sources)) for name, sources in index.items())
+
+
+def uses_variable(used, name):
+    """Whether variable `name` is needed by a template using `used`
+    variables, directly, through its namespace or as a namespace itself.
+    """
+    parts = name.split(".")
+    for i in range(1, len(parts) + 1):
+        if ".".join(parts[:i]) in used:
+            return True
+    prefix = name + "."
+    return any(u.startswith(prefix) for u in used)
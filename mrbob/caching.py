@@ -0,0 +1,132 @@
+"""Helpers shared by the on-disk caches of mr.bob."""
+
+import json
+import os
+import re
+import shutil
+import tempfile
+
+DEFAULT_CACHE_MAX_SIZE = 100 * 1024 * 1024
+
+SIZE_REGEX = re.compile(r"^\s*(\d+)\s*([kmg]?)b?\s*$", re.IGNORECASE)
+SIZE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+
+def parse_size(value):
+    """Convert `value` such as ``512``, ``64K`` or ``100M`` into bytes."""
+    if isinstance(value, int):
+        return value
+    match = SIZE_REGEX.match(value)
+    if not match:
+        raise ValueError("Not a size: %s" % value)
+    number, unit = match.groups()
+    return int(number) * SIZE_UNITS[unit.lower()]
+
+
+def ensure_directory(directory):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return directory
+
+
+def touch(fs_path):
+    """Mark `fs_path` as recently used for :func:`prune_directory`."""
+    try:
+        os.utime(fs_path, None)
+    except OSError:  # pragma: no cover
+        pass
+
+
+def read_metadata(fs_meta):
+    """Load the JSON file `fs_meta`, or return `None` if it is unusable."""
+    try:
+        with open(fs_meta) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_metadata(fs_meta, metadata):
+    fd, fs_tmp = tempfile.mkstemp(dir=os.path.dirname(fs_meta))
+    with os.fdopen(fd, "w") as f:
+        json.dump(metadata, f)
+    os.replace(fs_tmp, fs_meta)
+
+
+def read_pickle(fs_path):
+    """Load the pickle `fs_path`, or return `None` if it is missing, half
+    written by another process or refers to code that changed since.
+    """
+    import pickle
+
+    try:
+        with open(fs_path, "rb") as f:
+            return pickle.load(f)
+    except (
+        OSError,
+        EOFError,
+        pickle.UnpicklingError,
+        AttributeError,
+        ValueError,
+        ImportError,
+    ):
+        return None
+
+
+def write_pickle(fs_path, obj):
+    """Replace `fs_path` with `obj` pickled, so that concurrent readers
+    see either the old or the new file.
+    """
+    import pickle
+
+    fd, fs_tmp = tempfile.mkstemp(dir=os.path.dirname(fs_path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(fs_tmp, fs_path)
+    except BaseException:
+        os.unlink(fs_tmp)
+        raise
+
+
+def entry_size(fs_path):
+    if not os.path.isdir(fs_path) or os.path.islink(fs_path):
+        return os.lstat(fs_path).st_size
+    total = 0
+    for fs_dir, _, files in os.walk(fs_path):
+        for name in files:
+            total += os.lstat(os.path.join(fs_dir, name)).st_size
+    return total
+
+
+def prune_directory(directory, max_size, keep=()):
+    """Remove least recently used entries of `directory` until the entries
+    take at most `max_size` bytes. Entries named in `keep` are never removed.
+    """
+    entries = []
+    total = 0
+    for name in os.listdir(directory):
+        fs_path = os.path.join(directory, name)
+        try:
+            size = entry_size(fs_path)
+            mtime = os.lstat(fs_path).st_mtime
+        except OSError:  # pragma: no cover
+            # removed by a concurrent run
+            continue
+        entries.append((mtime, name, fs_path, size))
+        total += size
+
+    for mtime, name, fs_path, size in sorted(entries):
+        if total <= max_size:
+            break
+        if name in keep:
+            continue
+        if os.path.isdir(fs_path) and not os.path.islink(fs_path):
+            shutil.rmtree(fs_path, ignore_errors=True)
+        else:
+            try:
+                os.remove(fs_path)
+            except OSError:  # pragma: no cover
+                continue
+        total -= size
+    return total
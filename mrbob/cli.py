@@ -1,7 +1,7 @@
 """Command line interface to mr.bob"""
 
 import argparse
-import importlib.metadata
+import json
 import os
 import shutil
 import sys
@@ -9,8 +9,8 @@ import sys
 import six
 
 from .bobexceptions import ConfigurationError, TemplateConfigurationError
-from .configurator import Configurator, maybe_bool
-from .parsing import parse_config, pretty_format_config, update_config
+from .configurator import Configurator, config_cache_dir, maybe_bool
+from .parsing import LayeredConfig, parse_config, pretty_format_config
 
 # http://docs.python.org/library/argparse.html
 parser = argparse.ArgumentParser(description="Filesystem template renderer")
@@ -53,6 +53,12 @@ parser.add_argument(
     default=False,
     help="List all questions needed for the template",
 )
+parser.add_argument(
+    "--list-templates",
+    action="store_true",
+    default=False,
+    help="List templates registered by installed packages",
+)
 parser.add_argument(
     "-w",
     "--remember-answers",
@@ -60,6 +66,14 @@ parser.add_argument(
     default=False,
     help="Remember answers to .mrbob.ini file inside output directory",
 )
+parser.add_argument(
+    "-u",
+    "--update",
+    action="store_true",
+    default=False,
+    help="Update a structure rendered with --remember-answers, "
+    "rendering again only what depends on changed answers",
+)
 parser.add_argument(
     "-n",
     "--non-interactive",
@@ -68,6 +82,37 @@ parser.add_argument(
     default=False,
     help="Don't prompt for input. Fail if questions are required but not answered",
 )
+parser.add_argument(
+    "--batch",
+    metavar="FILE",
+    help="Render the template once per line of a JSON lines FILE, "
+    'each line being {"target": "...", "variables": {...}}',
+)
+parser.add_argument(
+    "--dry-run",
+    action="store_true",
+    default=False,
+    help="Print the files that would be rendered as JSON without writing them",
+)
+parser.add_argument(
+    "--dry-run-content",
+    action="store_true",
+    default=False,
+    help="Like --dry-run, but render templates in memory to report output sizes",
+)
+parser.add_argument(
+    "-j",
+    "--jobs",
+    type=int,
+    default=None,
+    help="Number of files to render in parallel, 0 for one per CPU",
+)
+parser.add_argument(
+    "--refresh-template",
+    action="store_true",
+    default=False,
+    help="Download a remote template again, " "even if it is in the cache_dir",
+)
 parser.add_argument(
     "-q",
     "--quiet",
@@ -77,15 +122,38 @@ parser.add_argument(
 )
 
 
+def parse_batch(fs_batch):
+    """Read ``(target, variables)`` pairs from a JSON lines file."""
+    targets = []
+    try:
+        with open(fs_batch) as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    targets.append((entry["target"], entry.get("variables", {})))
+                except (ValueError, KeyError, TypeError):
+                    raise ConfigurationError(
+                        "%s:%s: expected an object with target and variables"
+                        % (fs_batch, number)
+                    )
+    except IOError as e:
+        raise ConfigurationError("Can not read batch file: %s" % e)
+    return targets
+
+
 def main(args=sys.argv[1:]):
     """Main function called by `mrbob` command."""
     options = parser.parse_args(args=args)
 
     if options.version:
+        import importlib.metadata
+
         version = importlib.metadata.version("mr.bob")
         return version
 
-    if not options.template:
+    if not options.template and not options.list_templates:
         parser.error("You must specify what template to use.")
 
     userconfig = os.path.expanduser("~/.mrbob")
@@ -99,13 +167,27 @@ def main(args=sys.argv[1:]):
         global_variables = {}
         global_defaults = {}
 
-    original_global_bobconfig = dict(global_bobconfig)
-    original_global_variables = dict(global_variables)
-    original_global_defaults = dict(global_defaults)
+    if options.list_templates:
+        from .registry import format_templates, load_registry
+
+        templates = load_registry(config_cache_dir(global_bobconfig, "registry"))
+        for line in format_templates(templates):
+            print(line)
+        return
 
     if options.config:
         try:
-            file_config = parse_config(options.config)
+            max_age = int(global_bobconfig.get("http_max_age", 0))
+        except ValueError:
+            parser.error(
+                "http_max_age must be a number: %s" % global_bobconfig["http_max_age"]
+            )
+        try:
+            file_config = parse_config(
+                options.config,
+                cache_dir=config_cache_dir(global_bobconfig),
+                max_age=max_age,
+            )
         except ConfigurationError as e:
             parser.error(e)
         file_bobconfig = file_config["mr.bob"]
@@ -125,15 +207,20 @@ def main(args=sys.argv[1:]):
         "remember_answers": options.remember_answers,
         "non_interactive": options.non_interactive,
     }
+    if options.jobs is not None:
+        cli_bobconfig["jobs"] = options.jobs
+    if options.refresh_template:
+        cli_bobconfig["refresh_template"] = True
 
-    bobconfig = update_config(
-        update_config(global_bobconfig, file_bobconfig), cli_bobconfig
+    layers = ["~/.mrbob", "--config file", "command line interface"]
+    bobconfig = LayeredConfig(
+        zip(layers, [global_bobconfig, file_bobconfig, cli_bobconfig])
     )
-    variables = update_config(
-        update_config(global_variables, file_variables), cli_variables
+    variables = LayeredConfig(
+        zip(layers, [global_variables, file_variables, cli_variables])
     )
-    defaults = update_config(
-        update_config(global_defaults, file_defaults), cli_defaults
+    defaults = LayeredConfig(
+        zip(layers, [global_defaults, file_defaults, cli_defaults])
     )
 
     c = None
@@ -141,35 +228,14 @@ def main(args=sys.argv[1:]):
         print("")
         print("Configuration provided:")
         print("")
-        print("[variables] from ~/.mrbob")
-        for line in pretty_format_config(original_global_variables):
-            print(line)
-        print("[variables] from --config file")
-        for line in pretty_format_config(file_variables):
-            print(line)
-        # TODO: implement variables on cli
-        # print('[variables] from command line interface')
-        # for line in pretty_format_config(file_variables):
-        #     print(line)
-        print("[defaults] from ~/.mrbob")
-        for line in pretty_format_config(original_global_defaults):
-            print(line)
-        print("[defaults] from --config file")
-        for line in pretty_format_config(file_defaults):
-            print(line)
-        # TODO: implement defaults on cli
-        # print('[defaults] from command line interface')
-        # for line in pretty_format_config(file_defaults):
-        #     print(line)
-        print("[mr.bob] from ~/.mrbob")
-        for line in pretty_format_config(original_global_bobconfig):
-            print(line)
-        print("[mr.bob] from --config file")
-        for line in pretty_format_config(file_bobconfig):
-            print(line)
-        print("[mr.bob] from command line interface")
-        for line in pretty_format_config(cli_bobconfig):
-            print(line)
+        for section, config in [
+            ("variables", variables),
+            ("defaults", defaults),
+            ("mr.bob", bobconfig),
+        ]:
+            print("[%s]" % section)
+            for line in pretty_format_config(config, sources=True):
+                print(line)
 
     try:
         c = Configurator(
@@ -183,33 +249,64 @@ def main(args=sys.argv[1:]):
         if options.list_questions:
             return c.print_questions()
 
-        if c.questions and not maybe_bool(bobconfig["quiet"]):
-            if options.non_interactive:
+        if options.batch:
+            targets = parse_batch(options.batch)
+            rendered = c.render_many(targets)
+            if not maybe_bool(bobconfig["quiet"]):
+                for r in rendered:
+                    print("Generated file structure at %s" % r.target_directory)
                 print("")
-                print(
-                    "Welcome to mr.bob non-interactive mode. Questions will be answered by default values or hooks."
-                )
-                print("")
-            else:
-                print("")
-                print(
-                    "Welcome to mr.bob interactive mode. Before we generate directory structure, some questions need to be answered."
-                )
-                print("")
-                print("Answer with a question mark to display help.")
-                print(
-                    "Values in square brackets at the end of the questions show the default value if there is no answer."
-                )
-                print("\n")
+            return
+
+        if options.update:
+            c.load_answers()
+
+        dry_run = options.dry_run or options.dry_run_content
+        if c.questions and not maybe_bool(bobconfig["quiet"]):
+            if not dry_run:
+                if options.non_interactive:
+                    print("")
+                    print(
+                        "Welcome to mr.bob non-interactive mode. Questions will be answered by default values or hooks."
+                    )
+                    print("")
+                else:
+                    print("")
+                    print(
+                        "Welcome to mr.bob interactive mode. Before we generate directory structure, some questions need to be answered."
+                    )
+                    print("")
+                    print("Answer with a question mark to display help.")
+                    print(
+                        "Values in square brackets at the end of the questions show the default value if there is no answer."
+                    )
+                    print("\n")
             c.ask_questions()
-            if not options.non_interactive:
+            if not options.non_interactive and not dry_run:
                 print("")
-        c.render()
+        if dry_run:
+            plan = c.plan(render_content=options.dry_run_content)
+            print(json.dumps(plan, indent=2))
+            return
+        if options.update:
+            c.update()
+        else:
+            c.render()
         if not maybe_bool(bobconfig["quiet"]):
             print(
                 "Generated file structure at %s"
                 % os.path.realpath(options.target_directory)
             )
+            if options.update:
+                print(
+                    "%(renamed)s renamed, %(created)s files created, "
+                    "%(written)s written, %(kept)s kept" % c.render_stats
+                )
+            elif c.skip_unchanged:
+                print(
+                    "%(created)s files created, %(written)s written, "
+                    "%(unchanged)s unchanged" % c.render_stats
+                )
             print("")
         return
     except TemplateConfigurationError as e:
@@ -218,7 +315,7 @@ def main(args=sys.argv[1:]):
         parser.error(six.u("ConfigurationError: %s") % e.args[0])
     finally:
         if c and c.is_tempdir:
-            shutil.rmtree(c.template_dir)
+            shutil.rmtree(c.tempdir)
 
 
 if __name__ == "__main__":  # pragma: nocover
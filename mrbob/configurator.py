@@ -1,53 +1,71 @@
 """"""
 
+import collections
+import contextlib
+import copy
 import os
 import re
-import readline
+import shutil
 import sys
+import types
 from importlib import import_module
 
 import six
 
+from .analysis import uses_variable
 from .bobexceptions import (
     ConfigurationError,
     SkipQuestion,
     TemplateConfigurationError,
     ValidationError,
 )
+from .caching import DEFAULT_CACHE_MAX_SIZE, parse_size, prune_directory
+from .copying import COPY_MODES
 from .parsing import (
+    layered_config,
     parse_config,
     pretty_format_config,
-    update_config,
+    read_config,
     write_config,
 )
-from .rendering import render_structure
+from .registry import find_package_dir, resolve_template
+from .sources import find_archive, find_file, is_tar_name, open_source
 
-try:  # pragma: no cover
-    from urllib import urlretrieve  # noqa
-except ImportError:  # pragma: no cover
-    # PY3K
-    from urllib.request import urlretrieve  # noqa
-import tempfile
-from zipfile import ZipFile, is_zipfile
+# Modules needed only to download or render templates, or to ask questions
+# (readline, jinja2 through mrbob.rendering, urllib through
+# mrbob.downloading), are imported where they are used, to keep startup of
+# the mrbob command fast. See mrbob.tests.test_cli.ImportTimeTest.
 
-# make pyflakes happy, readline makes interactive mode keep history
-readline  # noqa
+# keys of :data:`mrbob.rendering.EXECUTORS`
+EXECUTOR_NAMES = ("process", "thread")
 
 
 DOTTED_REGEX = re.compile(r"^[a-zA-Z_.]+:[a-zA-Z_.]+$")
+REGISTERED_REGEX = re.compile(r"^[\w.-]+$")
 
 
 def resolve_dotted_path(name):
     module_name, dir_name = name.rsplit(":", 1)
-    module = import_module(module_name)
-    return os.path.join(os.path.dirname(module.__file__), dir_name)
+    # importing a package just to find it can pull in heavy dependencies
+    package_dir = find_package_dir(module_name)
+    if package_dir is None:
+        package_dir = os.path.dirname(import_module(module_name).__file__)
+    return os.path.join(package_dir, dir_name)
+
+
+# functions resolved from dotted names, shared by all configurators
+resolved_funcs = {}
 
 
 def resolve_dotted_func(name):
+    func = resolved_funcs.get(name)
+    if func is not None:
+        return func
     module_name, func_name = name.split(":")
     module = import_module(module_name)
     func = getattr(module, func_name, None)
     if func:
+        resolved_funcs[name] = func
         return func
     else:
         raise ConfigurationError(
@@ -55,6 +73,46 @@ def resolve_dotted_func(name):
         )
 
 
+class dotted_funcs(object):
+    """Attribute holding the functions named in ``hook_names[attr]``, a
+    space separated list of dotted names. They are resolved on first
+    access, so hook modules are only imported when the hooks are used.
+    Assigning to the attribute replaces the functions.
+
+    With `compile`, plain functions offering a ``compile`` function are replaced
+    by what it returns for the instance, see :mod:`mrbob.hooks`.
+    """
+
+    def __init__(self, attr, single=False, compile=False):
+        self.attr = attr
+        self.single = single
+        self.compile = compile
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        names = instance.hook_names.get(self.attr, "").split()
+        funcs = [resolve_dotted_func(name) for name in names]
+        if self.compile:
+            funcs = [compile_hook(func, instance) for func in funcs]
+        if self.single:
+            funcs = funcs[0]
+        # the instance attribute now shadows this descriptor
+        instance.__dict__[self.attr] = funcs
+        return funcs
+
+
+def compile_hook(func, instance):
+    if isinstance(func, types.FunctionType) and hasattr(func, "compile"):
+        return func.compile(instance)
+    return func
+
+
+def is_prefetchable(func):
+    """Whether `func` is a :ref:`pre-question-hook` declaring ``prefetch``."""
+    return isinstance(func, types.FunctionType) and getattr(func, "prefetch", False)
+
+
 def maybe_resolve_dotted_func(name):
     if isinstance(name, six.string_types) and DOTTED_REGEX.match(name):
         return resolve_dotted_func(name)
@@ -71,36 +129,131 @@ def maybe_bool(value):
         return value
 
 
-def parse_template(template_name):
+def parse_template(
+    template_name,
+    cache_dir=None,
+    max_age=0,
+    refresh=False,
+    max_size=DEFAULT_CACHE_MAX_SIZE,
+    registry_dir=None,
+):
     """Resolve template name into absolute path to the template
-    and boolean if absolute path is temporary directory.
+    and boolean if absolute path is inside a temporary directory.
+
+    A name that is neither a path nor a dotted name is looked up in the
+    templates registered by installed distributions, see
+    :mod:`mrbob.registry`, whose index is kept in `registry_dir`.
+
+    Zip files are not extracted: the path then points into the archive,
+    as in ``/path/to/template.zip/some/dir``, see :mod:`mrbob.sources`.
+    Tar files, compressed or not, are extracted while they are read.
+    Given `cache_dir`, remote zip files and extracted tar files are kept
+    there and reused by later runs, up to `max_size` bytes. `refresh`
+    downloads the template again.
     """
     if template_name.startswith("http"):
+        import tempfile
+        from zipfile import is_zipfile
+
+        from .downloading import (
+            cache_path,
+            cached_download,
+            cached_untar,
+            download_tar,
+            urlretrieve,
+        )
+
         if "#" in template_name:
             url, subpath = template_name.rsplit("#", 1)
         else:
             url = template_name
             subpath = ""
-        with tempfile.NamedTemporaryFile() as tmpfile:
-            urlretrieve(url, tmpfile.name)
-            if not is_zipfile(tmpfile.name):
-                raise ConfigurationError("Not a zip file: %s" % tmpfile)
-            zf = ZipFile(tmpfile)
-            try:
-                path = tempfile.mkdtemp()
-                zf.extractall(path)
-                return os.path.join(path, subpath), True
-            finally:
-                zf.close()
-
+        is_tempdir = cache_dir is None
+        if is_tar_name(url.split("?", 1)[0]):
+            if is_tempdir:
+                fs_root = os.path.join(tempfile.mkdtemp(), "template")
+                with cleanup_on_error(fs_root):
+                    download_tar(url, fs_root)
+            else:
+                fs_root = cached_untar(url, cache_dir, max_age, refresh=refresh)
+        else:
+            if is_tempdir:
+                fs_root = os.path.join(tempfile.mkdtemp(), "template.zip")
+                with cleanup_on_error(fs_root):
+                    urlretrieve(url, fs_root)
+            else:
+                fs_root = cached_download(url, cache_dir, max_age, refresh=refresh)
+            if not is_zipfile(fs_root):
+                if is_tempdir:
+                    shutil.rmtree(os.path.dirname(fs_root))
+                raise ConfigurationError("Not a zip file: %s" % url)
+        if not is_tempdir:
+            fs_base = cache_path(url, cache_dir)
+            keep = [os.path.basename(fs_root), os.path.basename(fs_base) + ".json"]
+            prune_directory(cache_dir, max_size, keep=keep)
+        return join_subpath(fs_root, subpath), is_tempdir
+
+    if REGISTERED_REGEX.match(template_name) and not os.path.exists(template_name):
+        template_name = resolve_template(template_name, registry_dir) or template_name
     if ":" in template_name:
         path = resolve_dotted_path(template_name)
     else:
         path = os.path.realpath(template_name)
 
-    if not os.path.isdir(path):
-        raise ConfigurationError("Template directory does not exist: %s" % path)
-    return path, False
+    if os.path.isdir(path) or find_archive(path) is not None:
+        return path, False
+    found = find_file(path)
+    if found is not None and is_tar_name(found[0]):
+        import tempfile
+
+        from .downloading import extract_tar
+
+        fs_root = os.path.join(tempfile.mkdtemp(), "template")
+        with cleanup_on_error(fs_root):
+            with open(found[0], "rb") as f:
+                extract_tar(f, fs_root)
+        return join_subpath(fs_root, found[1]), True
+    raise ConfigurationError("Template directory does not exist: %s" % path)
+
+
+def join_subpath(fs_root, subpath):
+    """Join `subpath`, separated by ``/``, to `fs_root`."""
+    subpath = subpath.strip("/")
+    if subpath:
+        return os.path.join(fs_root, *subpath.split("/"))
+    return fs_root
+
+
+@contextlib.contextmanager
+def cleanup_on_error(fs_path):
+    """Remove the temporary directory holding `fs_path` on errors."""
+    try:
+        yield
+    except BaseException:
+        shutil.rmtree(os.path.dirname(fs_path), ignore_errors=True)
+        raise
+
+
+def temporary_root(fs_path):
+    """Directory made by :func:`tempfile.mkdtemp` that holds `fs_path`."""
+    import tempfile
+
+    tmpdir = tempfile.gettempdir()
+    relpath = os.path.relpath(fs_path, tmpdir)
+    return os.path.join(tmpdir, relpath.split(os.sep)[0])
+
+
+def check_target_directory(template_dir, target_directory):
+    if template_dir in os.path.commonprefix([target_directory, template_dir]):
+        raise ConfigurationError("You can not use target directory inside the template")
+
+
+def config_cache_dir(bobconfig, name="configs"):
+    """Directory `name` inside ``cache_dir`` of `bobconfig`, if any."""
+    cache_dir = (bobconfig or {}).get("cache_dir")
+    if cache_dir:
+        return os.path.join(os.path.expanduser(cache_dir), name)
+    return None
 
 
 class Configurator(object):
@@ -116,10 +269,22 @@ class Configurator(object):
     Additional to above settings, `Configurator` exposes following attributes:
 
     - :attr:`template_dir` is root directory of the template
-    - :attr:`is_tempdir` if template directory is temporary (when using zipfile)
+    - :attr:`is_tempdir` if template is in a temporary directory (when
+      downloading a zipfile), which is then :attr:`tempdir`
+    - :attr:`is_extracted` if template was extracted from a tar file
+    - :attr:`template_source` reads files from the template directory or
+      the zipfile, see :mod:`mrbob.sources`
     - :attr:`templateconfig` dictionary parsed from `template` section
     - :attr:`questions` ordered list of `Question instances to be asked
-    - :attr:`bobconfig` dictionary parsed from `mrbob` section of the config
+    - :attr:`bobconfig` read-only :class:`mrbob.parsing.LayeredConfig` of
+      the given `bobconfig` overridden by the `mr.bob` section of the
+      template config
+    - :attr:`variables` given `variables` with the answers to questions on
+      top, in a :class:`collections.ChainMap`
+    - :attr:`render_stats` counts of ``created``, ``written`` and ``unchanged``
+      files after :meth:`render`
+    - :attr:`previous_variables` answers remembered in the target directory,
+      once read by :meth:`load_answers`
 
     """
 
@@ -132,29 +297,55 @@ class Configurator(object):
             variables = {}
         if not defaults:
             defaults = {}
-        self.variables = variables
+        # answers are stored on top of the given variables, which may be
+        # a read-only LayeredConfig
+        self.variables = collections.ChainMap({}, variables)
+        self.previous_variables = None
         self.defaults = defaults
         self.target_directory = os.path.realpath(target_directory)
 
         # figure out template directory
-        self.template_dir, self.is_tempdir = parse_template(template)
-
-        # check if user is trying to specify output dir into template dir
-        if self.template_dir in os.path.commonprefix(
-            [self.target_directory, self.template_dir]
-        ):
+        try:
+            http_max_age = int(bobconfig.get("http_max_age", 0))
+        except ValueError:
             raise ConfigurationError(
-                "You can not use target directory inside the template"
+                "http_max_age must be a number: %s" % bobconfig["http_max_age"]
             )
+        self.template_dir, self.is_tempdir = parse_template(
+            template,
+            cache_dir=config_cache_dir(bobconfig, "templates"),
+            max_age=http_max_age,
+            refresh=maybe_bool(bobconfig.get("refresh_template", False)),
+            max_size=parse_size(
+                bobconfig.get("cache_max_size", DEFAULT_CACHE_MAX_SIZE)
+            ),
+            registry_dir=config_cache_dir(bobconfig, "registry"),
+        )
 
-        if not os.path.isdir(self.target_directory):
-            os.makedirs(self.target_directory)
+        self.template_source = open_source(self.template_dir)
+        # tar files are extracted into temporary or evictable directories
+        self.is_extracted = self.template_source.local and (
+            self.is_tempdir or template.startswith("http")
+        )
+        self.tempdir = None
+        if self.is_tempdir:
+            self.tempdir = temporary_root(self.template_dir)
+
+        # check if user is trying to specify output dir into template dir
+        check_target_directory(self.template_dir, self.target_directory)
 
         # parse template configuration file
         template_config = os.path.join(self.template_dir, ".mrbob.ini")
-        if not os.path.exists(template_config):
+        if not self.template_source.isfile(template_config):
             raise TemplateConfigurationError("Config not found: %s" % template_config)
-        self.config = parse_config(template_config)
+        if self.template_source.local:
+            self.config = parse_config(
+                template_config, cache_dir=config_cache_dir(bobconfig)
+            )
+        else:
+            self.config = read_config(
+                template_config, self.template_source.read_text(template_config)
+            )
 
         # parse questions from template configuration file
         self.raw_questions = self.config["questions"]
@@ -166,8 +357,9 @@ class Configurator(object):
             self.questions = []
 
         # parse bobconfig settings
-        # TODO: move config resolution inside this function from cli.py
-        self.bobconfig = update_config(bobconfig, self.config["mr.bob"])
+        self.bobconfig = layered_config(bobconfig).new_child(
+            self.config["mr.bob"], "template"
+        )
         self.verbose = maybe_bool(self.bobconfig.get("verbose", False))
         self.quiet = maybe_bool(self.bobconfig.get("quiet", False))
         self.remember_answers = maybe_bool(
@@ -175,44 +367,99 @@ class Configurator(object):
         )
         self.ignored_files = self.bobconfig.get("ignored_files", "").split()
         self.ignored_directories = self.bobconfig.get("ignored_directories", "").split()
+        self.stream_output = maybe_bool(self.bobconfig.get("stream_output", False))
+        self.skip_unchanged = maybe_bool(self.bobconfig.get("skip_unchanged", False))
+        self.copy_mode = self.bobconfig.get("copy_mode", "copy")
+        if self.copy_mode not in COPY_MODES:
+            raise ConfigurationError(
+                "copy_mode must be one of %s: %s"
+                % (", ".join(COPY_MODES), self.copy_mode)
+            )
+        if self.copy_mode == "symlink" and self.is_extracted:
+            # links would dangle once the extracted template is removed
+            self.copy_mode = "copy"
+        try:
+            self.jobs = int(self.bobconfig.get("jobs", 1))
+        except ValueError:
+            raise ConfigurationError(
+                "jobs must be a number: %s" % self.bobconfig["jobs"]
+            )
+        if self.jobs < 0:
+            raise ConfigurationError("jobs must not be negative: %s" % self.jobs)
+        self.executor = self.bobconfig.get("executor", "thread")
+        if self.executor not in EXECUTOR_NAMES:
+            raise ConfigurationError(
+                "executor must be one of %s: %s"
+                % (", ".join(EXECUTOR_NAMES), self.executor)
+            )
+        self.cache_dir = self.bobconfig.get("cache_dir") or None
+        if self.cache_dir:
+            self.cache_dir = os.path.expanduser(self.cache_dir)
+        self.cache_max_size = parse_size(
+            self.bobconfig.get("cache_max_size", DEFAULT_CACHE_MAX_SIZE)
+        )
+        self.plan_cache_dir = None
+        self.analysis_cache_dir = None
+        if self.cache_dir:
+            self.plan_cache_dir = os.path.join(self.cache_dir, "plans")
+            self.analysis_cache_dir = os.path.join(self.cache_dir, "analysis")
+        self.skip_unused_questions = maybe_bool(
+            self.bobconfig.get("skip_unused_questions", False)
+        )
 
-        # parse template settings
+        # parse template settings, hooks are resolved on first use
         self.templateconfig = self.config["template"]
-        self.post_render = [
-            resolve_dotted_func(f)
-            for f in self.templateconfig.get("post_render", "").split()
-        ]
-        self.pre_render = [
-            resolve_dotted_func(f)
-            for f in self.templateconfig.get("pre_render", "").split()
-        ]
-        self.post_ask = [
-            resolve_dotted_func(f)
-            for f in self.templateconfig.get("post_ask", "").split()
-        ]
-        self.pre_ask = [
-            resolve_dotted_func(f)
-            for f in self.templateconfig.get("pre_ask", "").split()
-        ]
-        self.renderer = resolve_dotted_func(
-            self.templateconfig.get("renderer", "mrbob.rendering:jinja2_renderer")
+        self.hook_names = dict(
+            (name, self.templateconfig.get(name, ""))
+            for name in ("pre_render", "post_render", "pre_ask", "post_ask")
+        )
+        self.hook_names["renderer"] = self.templateconfig.get(
+            "renderer", "mrbob.rendering:jinja2_renderer"
         )
 
+    pre_render = dotted_funcs("pre_render")
+    post_render = dotted_funcs("post_render")
+    pre_ask = dotted_funcs("pre_ask")
+    post_ask = dotted_funcs("post_ask")
+    renderer = dotted_funcs("renderer", single=True)
+
+    def validate_hooks(self):
+        """Resolve all hooks and the renderer of the template and of its
+        questions now, raising :exc:`ImportError` or
+        :exc:`mrbob.bobexceptions.ConfigurationError` for invalid ones.
+        Otherwise they are resolved when first used.
+        """
+        for name in self.hook_names:
+            getattr(self, name)
+        for question in self.questions:
+            question.validate_hooks()
+
     def render(self):
         """Render file structure given instance configuration. Basically calls
         :func:`mrbob.rendering.render_structure`.
         """
+        from .rendering import render_structure
+
+        if not os.path.isdir(self.target_directory):
+            os.makedirs(self.target_directory)
         if self.pre_render:
             for f in self.pre_render:
                 f(self)
-        render_structure(
-            self.template_dir,
+        self.configure_caches()
+        self.render_stats = render_structure(
+            self.template_source,
             self.target_directory,
             self.variables,
             self.verbose,
             self.renderer,
             self.ignored_files,
             self.ignored_directories,
+            jobs=self.jobs,
+            executor=self.executor,
+            cache_dir=self.plan_cache_dir,
+            stream=self.stream_output,
+            copy_mode=self.copy_mode,
+            skip_unchanged=self.skip_unchanged,
         )
         if self.remember_answers:
             write_config(
@@ -224,6 +471,184 @@ class Configurator(object):
             for f in self.post_render:
                 f(self)
 
+    def load_answers(self):
+        """Read the answers remembered in ``.mrbob.ini`` of the target
+        directory into :attr:`previous_variables` and use them for
+        variables that are not given, so only new questions are asked.
+
+        Remembered answers are strings; answers to questions are converted
+        again with :meth:`Question.restore_answer`.
+        """
+        fs_config = os.path.join(self.target_directory, ".mrbob.ini")
+        if not os.path.isfile(fs_config):
+            raise ConfigurationError("No remembered answers to update: %s" % fs_config)
+        self.previous_variables = read_config(fs_config)["variables"]
+        answers = dict(self.previous_variables)
+        for question in self.questions:
+            if question.name not in answers:
+                continue
+            try:
+                value = question.restore_answer(self, answers[question.name])
+            except ValidationError:
+                # no longer valid, so the question is asked again
+                del answers[question.name]
+            else:
+                answers[question.name] = value
+                self.previous_variables[question.name] = value
+        self.variables = collections.ChainMap(self.variables, answers)
+
+    def update(self):
+        """Update the file structure rendered with the answers read by
+        :meth:`load_answers`, renaming and rendering again only what
+        depends on changed variables, and remember the new answers.
+        Basically calls :func:`mrbob.rendering.update_structure`.
+
+        Without a template analysis, see :meth:`template_dependencies`,
+        the whole structure is rendered again.
+        """
+        from .rendering import update_structure
+
+        if self.previous_variables is None:
+            self.load_answers()
+        dependencies = self.template_dependencies()
+        if dependencies is None:
+            self.remember_answers = True
+            return self.render()
+        if self.pre_render:
+            for f in self.pre_render:
+                f(self)
+        self.configure_caches()
+        self.render_stats = update_structure(
+            self.template_source,
+            self.target_directory,
+            self.variables,
+            self.previous_variables,
+            dependencies,
+            self.verbose,
+            self.renderer,
+            self.ignored_files,
+            self.ignored_directories,
+            jobs=self.jobs,
+            executor=self.executor,
+            cache_dir=self.plan_cache_dir,
+            stream=self.stream_output,
+            copy_mode=self.copy_mode,
+            skip_unchanged=self.skip_unchanged,
+        )
+        write_config(
+            os.path.join(self.target_directory, ".mrbob.ini"),
+            "variables",
+            self.variables,
+        )
+        if self.post_render:
+            for f in self.post_render:
+                f(self)
+
+    def plan(self, render_content=False):
+        """Compute the file structure :meth:`render` would create without
+        writing anything or running render hooks. Basically calls
+        :func:`mrbob.rendering.plan_structure`.
+
+        :param render_content: render templates in memory to report the
+                               size of their output
+        """
+        from .rendering import plan_structure
+
+        self.configure_caches()
+        return plan_structure(
+            self.template_source,
+            self.target_directory,
+            self.variables,
+            self.renderer,
+            self.ignored_files,
+            self.ignored_directories,
+            cache_dir=self.plan_cache_dir,
+            render_content=render_content,
+        )
+
+    def template_dependencies(self):
+        """Map sources of the template to the variables their targets
+        depend on, or return `None` if the renderer is not understood.
+        Basically calls :func:`mrbob.analysis.template_dependencies`.
+        """
+        from .analysis import template_dependencies
+        from .rendering import jinja2_renderer
+
+        if self.renderer is not jinja2_renderer:
+            return None
+        return template_dependencies(
+            self.template_source,
+            self.ignored_files,
+            self.ignored_directories,
+            cache_dir=self.plan_cache_dir,
+            analysis_dir=self.analysis_cache_dir,
+        )
+
+    def used_variables(self):
+        """Frozenset of the variables used by the template, or `None` if
+        they are not known, see :meth:`template_dependencies`.
+        """
+        dependencies = self.template_dependencies()
+        if dependencies is None:
+            return None
+        return frozenset().union(*dependencies.values())
+
+    def render_many(self, targets, jobs=None):
+        """Render the template once for every ``(target_directory, variables)``
+        pair in `targets`, reusing the parsed configuration, render plan and
+        compiled templates of this instance.
+
+        Each render works on a copy of the configurator whose variables are
+        updated with the given ones; remaining questions are answered
+        non-interactively. Up to `jobs` targets (:attr:`jobs` by default)
+        are rendered in parallel threads. Returns the copies, in order.
+
+        :param targets: iterable of ``(target_directory, variables)``
+        :param jobs: number of targets rendered at the same time
+        """
+        if jobs is None:
+            jobs = self.jobs
+        targets = list(targets)
+        for target_directory, variables in targets:
+            check_target_directory(
+                self.template_dir, os.path.realpath(target_directory)
+            )
+
+        def render_one(target):
+            target_directory, variables = target
+            c = copy.copy(self)
+            c.target_directory = os.path.realpath(target_directory)
+            c.variables = collections.ChainMap({}, variables, self.variables)
+            c.bobconfig = self.bobconfig.new_child({"non_interactive": True}, "batch")
+            c.questions = [copy.copy(q) for q in self.questions]
+            if jobs != 1:
+                # targets are already rendered in parallel
+                c.jobs = 1
+            c.ask_questions()
+            c.render()
+            return c
+
+        if jobs == 1 or len(targets) < 2:
+            return [render_one(target) for target in targets]
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=jobs or None) as pool:
+            futures = [pool.submit(render_one, target) for target in targets]
+            try:
+                return [future.result() for future in futures]
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def configure_caches(self):
+        if self.cache_dir:
+            from .rendering import configure_bytecode_cache
+
+            configure_bytecode_cache(
+                os.path.join(self.cache_dir, "bytecode"), self.cache_max_size
+            )
+
     def parse_questions(self, config, order):
         q = []
 
@@ -245,20 +670,105 @@ class Configurator(object):
             # TODO: seperate questions with a newline
             # TODO: keep order
 
+    @contextlib.contextmanager
+    def prefetch_questions(self, questions):
+        """Start the prefetchable :ref:`pre-question-hook` functions of
+        `questions` not answered yet concurrently on a thread pool, yielding
+        their futures as returned by :meth:`Question.prefetch` keyed by
+        question name.
+        """
+        pending = []
+        for question in questions:
+            if question.name in self.variables:
+                continue
+            if any(is_prefetchable(f) for f in question.pre_ask_question):
+                pending.append(question)
+        if not pending:
+            yield {}
+            return
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=min(len(pending), 32))
+        try:
+            yield dict((q.name, q.prefetch(self, executor)) for q in pending)
+        finally:
+            # hooks of questions that were not asked are not waited for
+            executor.shutdown(wait=False, cancel_futures=True)
+
     def ask_questions(self):
-        """Loops through questions and asks for input if variable is not yet set."""
+        """Loops through questions and asks for input if variable is not yet set.
+
+        In non-interactive mode with ``skip_unused_questions``, questions
+        whose variable no template file or name uses are skipped, see
+        :meth:`used_variables`. Prefetchable :ref:`pre-question-hook`
+        functions all start before the first question is asked, see
+        :meth:`prefetch_questions`.
+        """
+        # readline makes interactive mode keep history
+        import readline  # noqa: F401
+
         if self.pre_ask:
             for f in self.pre_ask:
                 f(self)
+        questions = self.questions
+        if self.skip_unused_questions and maybe_bool(
+            self.bobconfig.get("non_interactive", False)
+        ):
+            used = self.used_variables()
+            # without an analysis of the renderer, every question is asked
+            if used is not None:
+                questions = [q for q in questions if uses_variable(used, q.name)]
         # TODO: if users want to manipulate questions order, this is curently not possible.
-        for question in self.questions:
-            if question.name not in self.variables:
-                self.variables[question.name] = question.ask(self)
+        with self.prefetch_questions(questions) as prefetched:
+            for question in questions:
+                if question.name in self.variables:
+                    continue
+                self.variables[question.name] = question.ask(
+                    self, prefetched.get(question.name)
+                )
         if self.post_ask:
             for f in self.post_ask:
                 f(self)
 
 
+@contextlib.contextmanager
+def readline_completion(complete):
+    """Complete input read by :func:`input` with :mod:`readline` within the
+    context, using `complete` to return the completions of a prefix.
+    """
+    try:
+        import readline
+    except ImportError:  # pragma: no cover
+        readline = None
+    if complete is None or readline is None:
+        yield
+        return
+
+    matches = []
+
+    def completer(text, state):
+        if state == 0:
+            matches[:] = complete(text)
+        if state < len(matches):
+            return matches[state]
+        return None
+
+    previous = readline.get_completer(), readline.get_completer_delims()
+    if "libedit" in (readline.__doc__ or ""):  # pragma: no cover
+        readline.parse_and_bind("bind ^I rl_complete")
+    else:
+        readline.parse_and_bind("tab: complete")
+    readline.set_completer(completer)
+    # choices may contain whitespace and punctuation
+    readline.set_completer_delims("")
+    try:
+        yield
+    finally:
+        readline.set_completer(previous[0])
+        readline.set_completer_delims(previous[1])
+
+
 class Question(object):
     """Question configuration. Parameters are used to configure questioning
     and possible validation of the answer.
@@ -296,14 +806,22 @@ class Question(object):
         self.required = maybe_bool(required)
         self.command_prompt = maybe_resolve_dotted_func(command_prompt)
         self.help = help
-        self.pre_ask_question = [
-            resolve_dotted_func(f) for f in pre_ask_question.split()
-        ]
-        self.post_ask_question = [
-            resolve_dotted_func(f) for f in post_ask_question.split()
-        ]
+        self.hook_names = dict(
+            pre_ask_question=pre_ask_question, post_ask_question=post_ask_question
+        )
         self.extra = extra
 
+    pre_ask_question = dotted_funcs("pre_ask_question")
+    # validators compiled once per question, see mrbob.hooks
+    post_ask_question = dotted_funcs("post_ask_question", compile=True)
+
+    def validate_hooks(self):
+        """Resolve the hooks of this question now, see
+        :meth:`Configurator.validate_hooks`.
+        """
+        for name in self.hook_names:
+            getattr(self, name)
+
     def __repr__(self):
         return (
             six.u(
@@ -313,26 +831,65 @@ class Question(object):
             % self.__dict__
         )
 
-    def ask(self, configurator):
+    def restore_answer(self, configurator, answer):
+        """Convert remembered `answer` as when it was given: with the
+        :attr:`post_ask_question` hooks or, without hooks, like a default.
+
+        :raises: :exc:`mrbob.bobexceptions.ValidationError` if the answer
+                 is no longer valid
+        """
+        if not self.post_ask_question:
+            return maybe_bool(answer)
+        for f in self.post_ask_question:
+            answer = f(configurator, self, answer)
+        return answer
+
+    def prefetch(self, configurator, executor):
+        """Submit the prefetchable :attr:`pre_ask_question` hooks to
+        `executor`, returning their futures keyed by hook.
+
+        The default of the question is set beforehand, as when asking it.
+        """
+        self.default = configurator.defaults.get(self.name, self.default)
+        return dict(
+            (f, executor.submit(f, configurator, self))
+            for f in self.pre_ask_question
+            if is_prefetchable(f)
+        )
+
+    def ask(self, configurator, prefetched=None):
         """Eventually, ask the question.
 
         :param configurator: :class:`mrbob.configurator.Configurator` instance
+        :param prefetched: futures of hooks returned by :meth:`prefetch`,
+                           whose results are waited for instead of calling them
 
         """
         correct_answer = None
-        self.default = configurator.defaults.get(self.name, self.default)
+        if prefetched is None:
+            prefetched = {}
+            self.default = configurator.defaults.get(self.name, self.default)
         non_interactive = maybe_bool(
             configurator.bobconfig.get("non_interactive", False)
         )
         if non_interactive:
             self.command_prompt = lambda x: ""
+            complete = None
+        else:
+            from .hooks import question_choices
+
+            choices = question_choices(configurator, self)
+            complete = choices and choices.complete
 
         try:
             while correct_answer is None:
                 # hook: pre ask question
                 for f in self.pre_ask_question:
                     try:
-                        f(configurator, self)
+                        if f in prefetched:
+                            prefetched[f].result()
+                        else:
+                            f(configurator, self)
                     except SkipQuestion:
                         return
 
@@ -342,15 +899,16 @@ class Question(object):
                 else:
                     question = six.u("--> %s: ") % self.question
 
-                # ask question
-                if six.PY3:  # pragma: no cover
-                    answer = self.command_prompt(question).strip()
-                else:  # pragma: no cover
-                    answer = (
-                        self.command_prompt(question.encode("utf-8"))
-                        .strip()
-                        .decode("utf-8")
-                    )
+                # ask question, completing choices
+                with readline_completion(complete):
+                    if six.PY3:  # pragma: no cover
+                        answer = self.command_prompt(question).strip()
+                    else:  # pragma: no cover
+                        answer = (
+                            self.command_prompt(question.encode("utf-8"))
+                            .strip()
+                            .decode("utf-8")
+                        )
 
                 # display additional help
                 if answer == "?":
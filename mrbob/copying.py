@@ -0,0 +1,157 @@
+"""Copying of static (non `.bob`) template files."""
+
+import errno
+import hashlib
+import os
+import shutil
+import stat
+
+try:  # pragma: no cover
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Windows
+    fcntl = None
+
+COPY_MODES = ("copy", "hardlink", "symlink")
+
+# ioctl sharing the data blocks of two files on CoW filesystems (btrfs, xfs)
+FICLONE = 0x40049409
+
+# errors meaning the fast path is not supported for these files
+UNSUPPORTED_ERRNOS = set(
+    [errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY]
+)
+
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def reflink(fsrc, fdst):
+    if fcntl is None:  # pragma: no cover
+        return False
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        return False
+    return True
+
+
+def copy_file_range(fsrc, fdst):
+    """Copy the file in kernel space with :func:`os.copy_file_range`,
+    falling back to :func:`os.sendfile`. Returns name of the method used
+    or `None` if neither is supported.
+    """
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    for method in ("copy_file_range", "sendfile"):
+        func = getattr(os, method, None)
+        if func is None:  # pragma: no cover
+            continue
+        offset = 0
+        try:
+            while True:
+                if method == "copy_file_range":
+                    sent = func(infd, outfd, COPY_CHUNK_SIZE, offset, offset)
+                else:
+                    sent = func(outfd, infd, offset, COPY_CHUNK_SIZE)
+                if sent == 0:
+                    return method
+                offset += sent
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS or offset:
+                raise
+    return None
+
+
+def copy_data(fs_source, fs_target):
+    with open(fs_source, "rb") as fsrc, open(fs_target, "wb") as fdst:
+        if reflink(fsrc, fdst):
+            return "reflink"
+        method = copy_file_range(fsrc, fdst)
+        if method is None:  # pragma: no cover
+            shutil.copyfileobj(fsrc, fdst)
+            method = "copy"
+        return method
+
+
+def remove_link(fs_target):
+    """Remove `fs_target` if writing to it would change another file."""
+    try:
+        st = os.lstat(fs_target)
+    except OSError:
+        return
+    if os.path.islink(fs_target) or st.st_nlink > 1:
+        os.remove(fs_target)
+
+
+def copy_file(fs_source, fs_target, mode="copy"):
+    """Copy `fs_source` to `fs_target` like :func:`shutil.copy2` and return
+    the method used.
+
+    In ``copy`` mode the data is cloned with a reflink on copy-on-write
+    filesystems and otherwise copied in the kernel. ``hardlink`` and
+    ``symlink`` modes link the target to the source instead, so the source
+    must outlive the target and must not be modified.
+    """
+    if mode not in COPY_MODES:
+        raise ValueError("Unknown copy mode: %s" % mode)
+    remove_link(fs_target)
+    if mode == "hardlink":
+        if os.path.exists(fs_target):
+            os.remove(fs_target)
+        try:
+            os.link(fs_source, fs_target)
+            return mode
+        except OSError:
+            # different filesystem, fall back to copying
+            pass
+    elif mode == "symlink":
+        if os.path.exists(fs_target):
+            os.remove(fs_target)
+        os.symlink(os.path.abspath(fs_source), fs_target)
+        return mode
+
+    method = copy_data(fs_source, fs_target)
+    shutil.copystat(fs_source, fs_target)
+    return method
+
+
+def stream_digest(f):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    return digest.digest()
+
+
+def file_digest(fs_path):
+    with open(fs_path, "rb") as f:
+        return stream_digest(f)
+
+
+def same_content(fs_target, fs_other=None, data=None):
+    """Whether regular file `fs_target` holds the same bytes as the file
+    `fs_other` or as `data`. Sizes are compared first, then hashes.
+    """
+    try:
+        st = os.lstat(fs_target)
+    except OSError:
+        return False
+    if not stat.S_ISREG(st.st_mode) or st.st_nlink > 1:
+        return False
+    if data is not None:
+        if st.st_size != len(data):
+            return False
+        return file_digest(fs_target) == hashlib.sha256(data).digest()
+    if st.st_size != os.stat(fs_other).st_size:
+        return False
+    return file_digest(fs_target) == file_digest(fs_other)
+
+
+def is_copied(fs_source, fs_target, mode="copy"):
+    """Whether `fs_target` already is what :func:`copy_file` would create."""
+    if mode == "symlink":
+        return os.path.islink(fs_target) and os.readlink(fs_target) == os.path.abspath(
+            fs_source
+        )
+    if mode == "hardlink" and os.path.exists(fs_target):
+        if os.path.samefile(fs_source, fs_target):
+            return True
+    return same_content(fs_target, fs_other=fs_source)
@@ -0,0 +1,253 @@
+"""Downloads of remote configs and templates through a local HTTP cache,
+and streaming extraction of tar templates.
+"""
+
+import hashlib
+import os
+import queue
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+
+from six.moves.urllib.error import HTTPError
+from six.moves.urllib.request import Request, urlopen, urlretrieve  # noqa
+
+from .bobexceptions import ConfigurationError
+from .caching import ensure_directory, read_metadata, touch, write_metadata
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# refuse members outside of the target directory, links to them and devices
+if hasattr(tarfile, "data_filter"):  # pragma: no cover
+    TAR_FILTER = {"filter": "data"}
+else:  # pragma: no cover
+    TAR_FILTER = {}
+
+
+def cache_path(url, cache_dir):
+    """Path in `cache_dir` that files cached for `url` start with."""
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, digest)
+
+
+def revalidate(url, fs_meta, fs_cached, max_age=0, refresh=False):
+    """Return the response to a request for `url`, or `None` if `fs_cached`
+    can be used as it is.
+
+    A copy younger than `max_age` seconds is used without a request, an
+    older one is revalidated with ``If-None-Match`` and
+    ``If-Modified-Since``. With `refresh` the content is always requested.
+    """
+    metadata = read_metadata(fs_meta)
+    if refresh or (metadata is not None and not os.path.exists(fs_cached)):
+        metadata = None
+
+    if metadata is not None and time.time() - metadata["fetched"] < max_age:
+        touch(fs_cached)
+        return None
+
+    request = Request(url)
+    if metadata is not None:
+        if metadata.get("etag"):
+            request.add_header("If-None-Match", metadata["etag"])
+        if metadata.get("last_modified"):
+            request.add_header("If-Modified-Since", metadata["last_modified"])
+
+    try:
+        return urlopen(request)
+    except HTTPError as e:
+        if e.code != 304 or metadata is None:
+            raise
+        metadata["fetched"] = time.time()
+        write_metadata(fs_meta, metadata)
+        touch(fs_cached)
+        return None
+
+
+def save_metadata(fs_meta, url, headers):
+    write_metadata(
+        fs_meta,
+        {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "fetched": time.time(),
+        },
+    )
+
+
+def cached_download(url, cache_dir, max_age=0, refresh=False):
+    """Download `url` into `cache_dir` and return path to the cached body.
+
+    The body is stored together with its ``ETag`` and ``Last-Modified``
+    headers and revalidated as described in :func:`revalidate`.
+    """
+    ensure_directory(cache_dir)
+    fs_base = cache_path(url, cache_dir)
+    fs_body, fs_meta = fs_base + ".body", fs_base + ".json"
+    response = revalidate(url, fs_meta, fs_body, max_age, refresh)
+    if response is None:
+        return fs_body
+
+    fs_tmp = None
+    try:
+        fd, fs_tmp = tempfile.mkstemp(dir=cache_dir)
+        with os.fdopen(fd, "wb") as f:
+            shutil.copyfileobj(response, f, DOWNLOAD_CHUNK_SIZE)
+        headers = response.info()
+        os.replace(fs_tmp, fs_body)
+    except BaseException:
+        # an interrupted download must not stay in the cache
+        if fs_tmp is not None and os.path.exists(fs_tmp):
+            os.unlink(fs_tmp)
+        raise
+    finally:
+        response.close()
+    save_metadata(fs_meta, url, headers)
+    return fs_body
+
+
+class PrefetchReader(object):
+    """Read-only file object over `fileobj` that reads ahead up to
+    `max_chunks` chunks in a thread, so a download goes on while the
+    chunks already received are decompressed and extracted.
+    """
+
+    # seconds :meth:`close` waits for the thread, which may be stuck
+    # reading a stalled connection; it is a daemon thread anyway
+    join_timeout = 1.0
+
+    def __init__(self, fileobj, chunk_size=DOWNLOAD_CHUNK_SIZE, max_chunks=16):
+        self.fileobj = fileobj
+        self.queue = queue.Queue(max_chunks)
+        self.closed = threading.Event()
+        self.chunk = b""
+        self.offset = 0
+        self.done = False
+        self.thread = threading.Thread(target=self.prefetch, args=(fileobj, chunk_size))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def prefetch(self, fileobj, chunk_size):
+        # read1 returns what has arrived instead of waiting for chunk_size
+        read = getattr(fileobj, "read1", fileobj.read)
+        try:
+            for chunk in iter(lambda: read(chunk_size), b""):
+                if not self.put(chunk):
+                    return
+            self.put(b"")
+        except Exception as e:
+            self.put(e)
+
+    def put(self, item):
+        while not self.closed.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read(self, size=-1):
+        """Read up to `size` bytes, without waiting for more chunks once
+        some data is returned, like reading from a socket.
+        """
+        parts = []
+        while size != 0:
+            if self.offset >= len(self.chunk):
+                if self.done or (parts and size > 0 and self.queue.empty()):
+                    break
+                chunk = self.queue.get()
+                if isinstance(chunk, Exception):
+                    self.done = True
+                    raise chunk
+                if not chunk:
+                    self.done = True
+                    break
+                self.chunk, self.offset = chunk, 0
+            start, end = self.offset, len(self.chunk)
+            if size > 0:
+                end = min(end, start + size)
+                size -= end - start
+            parts.append(self.chunk[start:end])
+            self.offset = end
+        return b"".join(parts)
+
+    def close(self):
+        """Stop reading ahead, closing `fileobj` so that a download still
+        in progress is aborted.
+        """
+        self.closed.set()
+        try:
+            self.fileobj.close()
+        except Exception:  # pragma: no cover
+            pass
+        self.thread.join(self.join_timeout)
+
+
+def check_tar_member(member, directory):  # pragma: no cover
+    """Refuse members escaping `directory` where tarfile has no filters."""
+    name = os.path.normpath(member.name)
+    if os.path.isabs(name) or name.split(os.sep)[0] == os.pardir:
+        raise ConfigurationError("Unsafe path in tar file: %s" % member.name)
+    if member.issym() or member.islnk() or member.isdev():
+        raise ConfigurationError("Unsupported member in tar file: %s" % member.name)
+
+
+def extract_tar(fileobj, directory):
+    """Extract the tar stream `fileobj`, compressed or not, into
+    `directory` member by member while it is read.
+    """
+    reader = PrefetchReader(fileobj)
+    try:
+        with tarfile.open(fileobj=reader, mode="r|*") as tar:
+            for member in tar:
+                if not TAR_FILTER:  # pragma: no cover
+                    check_tar_member(member, directory)
+                tar.extract(member, directory, **TAR_FILTER)
+    except (tarfile.ReadError, tarfile.CompressionError) as e:
+        raise ConfigurationError("Not a tar file: %s" % e)
+    except tarfile.TarError as e:
+        raise ConfigurationError("Can not extract tar file: %s" % e)
+    finally:
+        reader.close()
+
+
+def download_tar(url, directory):
+    """Extract tar file at `url` into `directory` while it downloads."""
+    response = urlopen(url)
+    try:
+        extract_tar(response, directory)
+    finally:
+        response.close()
+
+
+def cached_untar(url, cache_dir, max_age=0, refresh=False):
+    """Extract the tar file at `url` into `cache_dir` while it downloads,
+    and return path to the extracted tree. The tree is revalidated like a
+    download, see :func:`revalidate`, and replaced when it changed.
+    """
+    ensure_directory(cache_dir)
+    fs_base = cache_path(url, cache_dir)
+    fs_tree, fs_meta = fs_base + ".tree", fs_base + ".json"
+    response = revalidate(url, fs_meta, fs_tree, max_age, refresh)
+    if response is None:
+        return fs_tree
+
+    fs_tmp = tempfile.mkdtemp(dir=cache_dir)
+    try:
+        try:
+            extract_tar(response, fs_tmp)
+            headers = response.info()
+        finally:
+            response.close()
+        if os.path.isdir(fs_tree):
+            shutil.rmtree(fs_tree)
+        os.rename(fs_tmp, fs_tree)
+    finally:
+        if os.path.isdir(fs_tmp):
+            shutil.rmtree(fs_tmp)
+    save_metadata(fs_meta, url, headers)
+    return fs_tree
@@ -1,10 +1,23 @@
-"""Use any of hooks below or write your own. You are welcome to contribute them!"""
-
+"""Use any of hooks below or write your own. You are welcome to contribute them!
+
+A :ref:`post-question-hook` may offer a ``compile`` function, called once
+per question with the :class:`mrbob.configurator.Question`, returning the
+hook to validate its answers with. Settings of the question, such as
+regular expressions or choices, are then parsed once instead of for every
+answer.
+"""
+
+import bisect
+import functools
+import os
 import re
 import time
 
 from .bobexceptions import ValidationError
 
+TRUE_VALUES = frozenset(["y", "yes", "true", "1"])
+FALSE_VALUES = frozenset(["n", "no", "false", "0"])
+
 
 def to_boolean(configurator, question, answer):
     """
@@ -20,9 +33,9 @@ def to_boolean(configurator, question, answer):
     Following variables can be converted to a boolean: **y, n, yes, no, true, false, 1, 0**
     """
     value = answer.lower()
-    if value in ["y", "yes", "true", "1"]:
+    if value in TRUE_VALUES:
         return True
-    elif value in ["n", "no", "false", "0"]:
+    elif value in FALSE_VALUES:
         return False
     else:
         raise ValidationError("Value must be a boolean (y/n)")
@@ -82,36 +95,158 @@ def validate_choices(configurator, question, answer):
     have whitespace within each choice, you may specify a custom delimiter
     which will be used to split the choices.
 
+    Long lists of choices may be read from a file instead, with one choice
+    per line, ignoring empty lines and lines starting with ``#``:
+
+    .. code-block:: ini
+
+        [questions]
+        license.choices_file = licenses.txt
+
+    Relative paths are looked up in the template directory, paths in
+    dotted notation such as ``bobtemplates.example:licenses.txt`` in the
+    package. Each file is read once per process and shared by all
+    questions using it. In interactive mode, choices are completed with
+    the Tab key.
+
     This hook may be set to validate the choices in a case sensitive manner.
     However, this behaviour is disabled by default.
     """
-    delimiter = question.extra.get("choices_delimiter")
-    choices = question.extra.get("choices", "").split(delimiter)
+    return compile_choices(question)(configurator, question, answer)
+
+
+class Choices(object):
+    """Choices indexed to validate answers with a hash lookup and to
+    complete prefixes with a binary search in their sorted keys.
+
+    Unless `case_sensitive`, keys of choices are lowercased.
+    """
+
+    def __init__(self, choices, case_sensitive=False):
+        self.choices = tuple(choices)
+        self.case_sensitive = case_sensitive
+        ordered = sorted((self.key(choice), choice) for choice in self.choices)
+        self.keys = [key for key, choice in ordered]
+        self.ordered = [choice for key, choice in ordered]
+        self.lookup = frozenset(self.keys)
+
+    def key(self, value):
+        return value if self.case_sensitive else value.lower()
+
+    def __contains__(self, answer):
+        return self.key(answer) in self.lookup
+
+    def __len__(self):
+        return len(self.choices)
+
+    def complete(self, prefix):
+        """Choices starting with `prefix`, in sorted order."""
+        prefix = self.key(prefix)
+        start = bisect.bisect_left(self.keys, prefix)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(prefix):
+            end += 1
+        return self.ordered[start:end]
+
+    @property
+    def message(self):
+        if len(self.choices) > 10:
+            return "Value must be one of %d choices" % len(self.choices)
+        return (
+            "Value must be " + ", ".join(self.choices[:-1]) + " or " + self.choices[-1]
+        )
+
+
+# choices read from files, keyed by path and case sensitivity
+loaded_choices = {}
+
+
+@functools.lru_cache(maxsize=256)
+def parse_choices(choices, delimiter, case_sensitive):
+    """Split `choices` into indexed :class:`Choices`."""
+    return Choices(choices.split(delimiter), case_sensitive)
+
+
+def choices_path(configurator, choices_file):
+    """Path of `choices_file`, in dotted notation or relative to the
+    template directory.
+    """
+    from .configurator import DOTTED_REGEX, resolve_dotted_path
+
+    if os.path.isabs(choices_file):
+        return choices_file
+    if DOTTED_REGEX.match(choices_file):
+        return resolve_dotted_path(choices_file)
+    return os.path.join(configurator.template_dir, choices_file)
+
+
+def load_choices(configurator, choices_file, case_sensitive):
+    """Indexed :class:`Choices` read from `choices_file`, once per process."""
+    from .sources import DirectorySource
+
+    fs_path = choices_path(configurator, choices_file)
+    key = (fs_path, case_sensitive)
+    choices = loaded_choices.get(key)
+    if choices is None:
+        source = getattr(configurator, "template_source", None)
+        if source is None or not fs_path.startswith(os.path.join(source.root, "")):
+            source = DirectorySource(os.path.dirname(fs_path))
+        lines = [line.strip() for line in source.read_text(fs_path).splitlines()]
+        choices = Choices(
+            [line for line in lines if line and not line.startswith("#")],
+            case_sensitive,
+        )
+        loaded_choices[key] = choices
+    return choices
+
+
+def question_choices(configurator, question):
+    """Indexed :class:`Choices` of `question`, `None` if it has none."""
+    case_sensitive = is_case_sensitive(question)
+    choices_file = question.extra.get("choices_file")
+    if choices_file:
+        choices = load_choices(configurator, choices_file, case_sensitive)
+    else:
+        choices = parse_choices(
+            question.extra.get("choices", ""),
+            question.extra.get("choices_delimiter"),
+            case_sensitive,
+        )
+    return choices or None
 
-    # If no choices are defined, then we assume the provided answer is correct
-    if not choices:
-        return answer
 
-    # Determine case sensitivity
+def compile_choices(question):
+    choices = []
+    if not question.extra.get("choices_file"):
+        # inline choices are parsed now, files are read on the first answer
+        choices.append(question_choices(None, question))
+
+    def validate(configurator, question, answer):
+        if not choices:
+            choices.append(question_choices(configurator, question))
+        # If no choices are defined, then we assume the provided answer is correct
+        if choices[0] is None or answer in choices[0]:
+            return answer
+        raise ValidationError(choices[0].message)
+
+    return validate
+
+
+validate_choices.compile = compile_choices
+
+
+def is_case_sensitive(question):
     case_sensitive_config = question.extra.get("choices_case_sensitive")
-    case_sensitive = False
     if case_sensitive_config:
         try:
-            case_sensitive = to_boolean(None, None, case_sensitive_config)
+            return to_boolean(None, None, case_sensitive_config)
         except ValidationError:
             pass
+    return False
 
-    if case_sensitive:
-        valid = answer in choices
-    else:
-        valid = answer.lower() in [c.lower() for c in choices]
 
-    if valid:
-        return answer
-    else:
-        raise ValidationError(
-            "Value must be " + ", ".join(choices[:-1]) + " or " + choices[-1]
-        )
+def accept(configurator, question, answer):
+    return answer
 
 
 def validate_regex(configurator, question, answer):
@@ -127,16 +262,28 @@ def validate_regex(configurator, question, answer):
         project.regex = ^[a-z]+$
 
     """
+    return compile_regex(question)(configurator, question, answer)
+
+
+def compile_regex(question):
     regex = question.extra.get("regex")
 
     # If no regex is defined, then we assume the provided answer is correct
     if not regex:
-        return answer
+        return accept
 
-    if re.match(regex, answer):
-        return answer
-    else:
-        raise ValidationError("Value was not of the expected format (%s)" % regex)
+    match = re.compile(regex).match
+    message = "Value was not of the expected format (%s)" % regex
+
+    def validate(configurator, question, answer):
+        if match(answer):
+            return answer
+        raise ValidationError(message)
+
+    return validate
+
+
+validate_regex.compile = compile_regex
 
 
 def set_current_datetime(configurator, question):
@@ -185,12 +332,25 @@ def validate_datetime(configurator, question, answer):
     See the following URL for more information:
     http://docs.python.org/2/library/datetime.html#strftime-and-strptime-behavior
     """
+    return compile_datetime(question)(configurator, question, answer)
+
+
+def compile_datetime(question):
+    # time.strptime keeps the regular expressions of recent formats cached
     datetime_format = question.extra.get("datetime_format", "%Y-%m-%d")
-    try:
-        time.strptime(answer, datetime_format)
-        return answer
-    except ValueError:
-        raise ValidationError("Value was not a date in the format " + datetime_format)
+    message = "Value was not a date in the format " + datetime_format
+
+    def validate(configurator, question, answer):
+        try:
+            time.strptime(answer, datetime_format)
+            return answer
+        except ValueError:
+            raise ValidationError(message)
+
+    return validate
+
+
+validate_datetime.compile = compile_datetime
 
 
 def show_message(configurator):
@@ -0,0 +1,117 @@
+"""Matching of `ignored_files` and `ignored_directories` patterns."""
+
+import functools
+import os
+import re
+
+
+def translate_segment(pattern):
+    """Translate Unix shell-style `pattern` to a regular expression that
+    does not match across ``/``.
+    """
+    i, n = 0, len(pattern)
+    result = []
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == "*":
+            if not result or result[-1] != "[^/]*":
+                result.append("[^/]*")
+        elif c == "?":
+            result.append("[^/]")
+        elif c == "[":
+            j = i
+            if j < n and pattern[j] == "!":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            while j < n and pattern[j] != "]":
+                j += 1
+            if j >= n:
+                result.append("\\[")
+            else:
+                stuff = pattern[i:j].replace("\\", "\\\\")
+                i = j + 1
+                if stuff[0] == "!":
+                    stuff = "^" + stuff[1:]
+                elif stuff[0] == "^":
+                    stuff = "\\" + stuff
+                result.append("[%s]" % stuff)
+        else:
+            result.append(re.escape(c))
+    return "".join(result)
+
+
+def translate(pattern):
+    """Translate an ignore pattern to a regular expression matching paths
+    relative to the template root, with ``/`` as separator.
+
+    Patterns without ``/`` match the name in any directory. Patterns with
+    ``/`` match the whole relative path, where ``**`` stands for any number
+    of directories.
+    """
+    pattern = pattern.rstrip("/")
+    if "/" not in pattern:
+        return "(?:.*/)?" + translate_segment(pattern)
+
+    segments = pattern.lstrip("/").split("/")
+    result = []
+    for i, segment in enumerate(segments):
+        last = i == len(segments) - 1
+        if segment == "**":
+            result.append(".*" if last else "(?:.*/)?")
+        else:
+            result.append(translate_segment(segment) + ("" if last else "/"))
+    return "".join(result)
+
+
+class IgnoreMatcher(object):
+    """All `patterns` compiled into a single regular expression.
+
+    Patterns are Unix shell-style patterns matched against the name of a
+    file or directory, like :func:`fnmatch.fnmatch`. Patterns containing
+    ``/`` are matched against the path relative to the template root, for
+    example ``docs/**/*.png``. A pattern starting with ``!`` includes again
+    what earlier patterns ignored; as in `.gitignore`, the last matching
+    pattern wins.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = tuple(patterns)
+        self.has_negations = any(p.startswith("!") for p in self.patterns)
+        if self.has_negations:
+            self.rules = []
+            for p in reversed(self.patterns):
+                negated = p.startswith("!")
+                if negated:
+                    p = p[1:]
+                regex = re.compile(translate(self.normcase(p)) + r"\Z")
+                self.rules.append((negated, regex))
+        else:
+            alternatives = [
+                "(?:%s)\\Z" % translate(self.normcase(p)) for p in self.patterns
+            ]
+            # an empty alternation would match everything
+            self.regex = re.compile("|".join(alternatives) or "(?!)")
+
+    @staticmethod
+    def normcase(name):
+        return os.path.normcase(name).replace(os.sep, "/")
+
+    def __call__(self, relpath):
+        """Whether `relpath`, a name or a path relative to the template
+        root, is ignored.
+        """
+        relpath = self.normcase(relpath)
+        if not self.has_negations:
+            return self.regex.match(relpath) is not None
+        for negated, regex in self.rules:
+            if regex.match(relpath):
+                return not negated
+        return False
+
+
+@functools.lru_cache(maxsize=256)
+def compile_patterns(patterns):
+    """Return cached :class:`IgnoreMatcher` for a tuple of `patterns`."""
+    return IgnoreMatcher(patterns)
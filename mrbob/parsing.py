@@ -1,22 +1,19 @@
 import collections
+import copy
+import hashlib
 import os
-import tempfile
 
 try:  # pragma: no cover
     from collections import OrderedDict  # noqa
 except ImportError:  # pragma: no cover
     from ordereddict import OrderedDict  # noqa
+
 import configparser
 
 import six
 
-try:  # pragma: no cover
-    from urllib import urlretrieve  # noqa
-except ImportError:  # pragma: no cover
-    # PY3K
-    from urllib.request import urlretrieve  # noqa
-
 from .bobexceptions import ConfigurationError
+from .caching import ensure_directory, read_pickle, write_pickle
 
 
 def nest_variables(variables):
@@ -47,18 +44,65 @@ def nest_variables(variables):
     return nested
 
 
-def parse_config(configname):
-    tmpfile = None
-    if configname.startswith("http"):
+# parsed configs kept in memory, keyed by path
+parsed_configs = {}
+
+
+def parse_config(configname, cache_dir=None, max_age=0):
+    """Parse `configname` into a dictionary of its sections.
+
+    Local files are parsed once per process while their size and
+    modification time stay the same and, given `cache_dir`, the parsed
+    structure is also stored on disk for later runs. Remote configs are
+    then downloaded into ``http`` inside `cache_dir` and revalidated once
+    they are older than `max_age` seconds.
+    """
+    if configname.startswith("http") and cache_dir is not None:
+        from .downloading import cached_download
+
+        configname = cached_download(
+            configname, os.path.join(cache_dir, "http"), max_age
+        )
+    elif configname.startswith("http"):
+        import tempfile
+
+        from .downloading import urlretrieve
+
         tmpfile = tempfile.NamedTemporaryFile()
-        urlretrieve(configname, tmpfile.name)
-        configname = tmpfile.name
+        try:
+            urlretrieve(configname, tmpfile.name)
+            return read_config(tmpfile.name)
+        finally:
+            tmpfile.close()
 
     if not os.path.exists(configname):
         raise ConfigurationError("config file does not exist: %s" % configname)
 
+    fs_config = os.path.realpath(configname)
+    st = os.stat(fs_config)
+    stamp = (st.st_size, st.st_mtime_ns)
+    cached = parsed_configs.get(fs_config)
+    fs_cached = None
+    if cached is None and cache_dir is not None:
+        digest = hashlib.sha256(fs_config.encode("utf-8")).hexdigest()
+        fs_cached = os.path.join(ensure_directory(cache_dir), digest + ".pickle")
+        cached = read_pickle(fs_cached)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, read_config(fs_config))
+        if fs_cached is not None:
+            write_pickle(fs_cached, cached)
+    parsed_configs[fs_config] = cached
+    # callers update the returned dictionaries in place
+    return copy.deepcopy(cached[1])
+
+
+def read_config(configname, text=None):
+    """Parse file `configname`, or its already read `text`, without caching."""
     parser = configparser.ConfigParser(dict_type=OrderedDict)
-    parser.read(configname)
+    if text is None:
+        parser.read(configname)
+    else:
+        parser.read_string(text, configname)
     config = dict()
     for section in ["variables", "defaults", "mr.bob", "questions", "template"]:
         if parser.has_section(section):
@@ -78,10 +122,6 @@ def parse_config(configname):
                 config[section] = nest_variables(dict(items))
         else:
             config[section] = {}
-
-    if tmpfile:
-        tmpfile.close()
-
     return config
 
 
@@ -109,7 +149,79 @@ def update_config(first_config, second_config):
     return first_config
 
 
-def pretty_format_config(config):
+class LayeredConfig(collections.abc.Mapping):
+    """Read-only view of configuration `layers`, ``(name, mapping)`` pairs
+    ordered from lowest to highest precedence, like
+    :class:`collections.ChainMap` in reverse.
+
+    Lookups go through the layers when made, so nothing is copied and the
+    layers are never changed. Nested mappings are merged the same way,
+    as :func:`update_config` does. :meth:`source` tells which layer a
+    value comes from.
+    """
+
+    def __init__(self, layers=()):
+        self.layers = list(layers)
+
+    def lookup(self, key):
+        """Return the value of `key` and the name of its layer."""
+        for name, layer in reversed(self.layers):
+            if key in layer:
+                value = layer[key]
+                if isinstance(value, collections.abc.Mapping):
+                    value = LayeredConfig(
+                        [
+                            (n, lyr[key])
+                            for n, lyr in self.layers
+                            if isinstance(lyr.get(key), collections.abc.Mapping)
+                        ]
+                    )
+                return value, name
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        return self.lookup(key)[0]
+
+    def __contains__(self, key):
+        return any(key in layer for _, layer in self.layers)
+
+    def __iter__(self):
+        seen = set()
+        for _, layer in self.layers:
+            for key in layer:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+    def __len__(self):
+        return len(set().union(*[layer.keys() for _, layer in self.layers]))
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.layers)
+
+    def source(self, key):
+        """Name of the layer the value of `key` comes from."""
+        return self.lookup(key)[1]
+
+    def new_child(self, mapping, name):
+        """Return a new view with layer `mapping` on top of these layers."""
+        return LayeredConfig(self.layers + [(name, mapping)])
+
+
+def layered_config(config, name="given"):
+    """Return `config` as a :class:`LayeredConfig`, as its only layer
+    called `name` unless it is one already.
+    """
+    if isinstance(config, LayeredConfig):
+        return config
+    return LayeredConfig([(name, config or {})])
+
+
+def pretty_format_config(config, sources=False):
+    """Sorted ``key = value`` lines of `config`, with nested keys joined by
+    dots. With `sources`, `config` is a :class:`LayeredConfig` and each
+    line tells which layer the value comes from.
+    """
     item_list = []
 
     def format_config(dict_, namespace=""):
@@ -118,8 +230,12 @@ def pretty_format_config(config):
                 namespace_new = namespace + ".%s" % key
             else:
                 namespace_new = key
-            if isinstance(value, dict):
+            if isinstance(value, collections.abc.Mapping):
                 format_config(value, namespace=namespace_new)
+            elif sources:
+                item_list.append(
+                    "%s = %s (from %s)" % (namespace_new, value, dict_.source(key))
+                )
             else:
                 item_list.append("%s = %s" % (namespace_new, value))
 
@@ -0,0 +1,133 @@
+"""Templates registered by installed distributions, found without importing
+the packages that hold them.
+
+A distribution registers its templates in the ``mrbob.templates`` entry
+point group, each entry pointing to a directory of a package the same way
+as a dotted template name::
+
+    [options.entry_points]
+    mrbob.templates =
+        addon = bobtemplates.example:addon
+
+Scanning the metadata of all installed distributions is slow, so with a
+cache directory the registry is stored in an index file there, which is
+used until distributions are installed or removed.
+"""
+
+import hashlib
+import json
+import os
+import sys
+from os import path
+
+from .caching import ensure_directory, read_metadata, write_metadata
+
+ENTRY_POINT_GROUP = "mrbob.templates"
+
+INDEX_NAME = "templates.json"
+
+
+def find_package_dir(module_name):
+    """Directory of the package or module `module_name`, found on the
+    filesystem without importing it or its parents, or `None` if it can
+    not be found that way.
+    """
+    from importlib.util import find_spec
+
+    parts = module_name.split(".")
+    try:
+        spec = find_spec(parts[0])
+    except (ImportError, ValueError):
+        return None
+    if spec is None:
+        return None
+    if not spec.submodule_search_locations:
+        if len(parts) > 1 or not spec.origin or not path.isfile(spec.origin):
+            return None
+        return path.dirname(spec.origin)
+    locations = list(spec.submodule_search_locations)
+    for part in parts[1:]:
+        for location in locations:
+            if path.isfile(path.join(location, part + ".py")):
+                if part != parts[-1]:
+                    return None
+                return location
+        locations = [
+            path.join(location, part)
+            for location in locations
+            if path.isdir(path.join(location, part))
+        ]
+        if not locations:
+            return None
+    return locations[0]
+
+
+def registry_key():
+    """Value that changes when distributions are installed or removed.
+
+    Installing, upgrading or removing a distribution adds or removes its
+    ``.dist-info`` directory, which changes the modification time of the
+    :data:`sys.path` entry holding it.
+    """
+    entries = []
+    for entry in sys.path:
+        try:
+            entries.append([entry, os.stat(entry or os.curdir).st_mtime_ns])
+        except OSError:
+            continue
+    return hashlib.sha256(json.dumps(entries).encode("utf-8")).hexdigest()
+
+
+def scan_templates():
+    """Map names of templates registered by installed distributions to
+    their dotted template names and distributions.
+    """
+    from importlib.metadata import entry_points
+
+    templates = {}
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        dist = entry_point.dist
+        templates.setdefault(
+            entry_point.name,
+            {"target": entry_point.value, "distribution": dist and dist.name},
+        )
+    return templates
+
+
+def load_registry(cache_dir=None):
+    """Return registered templates as :func:`scan_templates` does, reading
+    them from the index file in `cache_dir` if it is up to date and
+    updating it otherwise.
+    """
+    if cache_dir is None:
+        return scan_templates()
+
+    key = registry_key()
+    fs_index = path.join(cache_dir, INDEX_NAME)
+    index = read_metadata(fs_index)
+    if index is not None and index.get("key") == key:
+        return index["templates"]
+    templates = scan_templates()
+    ensure_directory(cache_dir)
+    write_metadata(fs_index, {"key": key, "templates": templates})
+    return templates
+
+
+def resolve_template(name, cache_dir=None):
+    """Dotted template name of the registered template `name`, or `None`."""
+    entry = load_registry(cache_dir).get(name)
+    if entry is None:
+        return None
+    return entry["target"]
+
+
+def format_templates(templates):
+    """Lines listing `templates` as returned by :func:`load_registry`."""
+    width = max([len(name) for name in templates] or [0])
+    lines = []
+    for name, entry in sorted(templates.items()):
+        line = "%s  %s" % (name.ljust(width), entry["target"])
+        if entry["distribution"]:
+            line += " (%s)" % entry["distribution"]
+        lines.append(line)
+    return lines
@@ -1,13 +1,33 @@
 import codecs
-import fnmatch
+import collections
+import collections.abc
+import functools
+import hashlib
 import os
 import re
-import stat
+import tempfile
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from os import path
-from shutil import copy2
 
+import jinja2
 import six
 from jinja2 import Environment, StrictUndefined
+from jinja2.bccache import Bucket, FileSystemBytecodeCache
+
+from .caching import (
+    DEFAULT_CACHE_MAX_SIZE,
+    ensure_directory,
+    prune_directory,
+    read_pickle,
+    touch,
+    write_pickle,
+)
+from .copying import same_content
+from .matching import compile_patterns
+from .parsing import nest_variables
+from .sources import DirectorySource, open_source
 
 jinja2_env = Environment(
     block_start_string="{{%",
@@ -22,15 +42,192 @@ jinja2_env = Environment(
 DEFAULT_IGNORED_FILES = [".mrbob.ini", ".DS_Store"]
 DEFAULT_IGNORED_DIRECTORIES = []
 
+EXECUTORS = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+# share of `max_size` a full bytecode cache is pruned down to
+PRUNE_RATIO = 0.75
+
+# compiled templates kept in memory, keyed by :func:`template_cache_key`
+TEMPLATE_MEMORY_CACHE_SIZE = 1024
+compiled_templates = {}
+# guards eviction from `compiled_templates` by parallel render jobs
+compiled_templates_lock = threading.Lock()
+
+
+class BoundedBytecodeCache(FileSystemBytecodeCache):
+    """Jinja2 bytecode cache in `directory` that evicts the least recently
+    used entries once the cache grows over `max_size` bytes.
+
+    The directory is scanned once; afterwards the size of written entries
+    is added up and the cache is only pruned when the total crosses
+    `max_size`, then down to :data:`PRUNE_RATIO` of it, so that a full
+    cache is not scanned again for every template compiled.
+    """
+
+    pattern = "__mrbob_%s.cache"
+
+    def __init__(self, directory, max_size=DEFAULT_CACHE_MAX_SIZE):
+        FileSystemBytecodeCache.__init__(
+            self, ensure_directory(directory), self.pattern
+        )
+        self.max_size = max_size
+        # total size of the entries, unknown until the first write
+        self.size = None
+        self.size_lock = threading.Lock()
+
+    def load_bytecode(self, bucket):
+        FileSystemBytecodeCache.load_bytecode(self, bucket)
+        if bucket.code is not None:
+            touch(self._get_cache_filename(bucket))
+
+    def dump_bytecode(self, bucket):
+        FileSystemBytecodeCache.dump_bytecode(self, bucket)
+        try:
+            written = os.path.getsize(self._get_cache_filename(bucket))
+        except OSError:  # pragma: no cover
+            written = 0
+        with self.size_lock:
+            if self.size is None:
+                self.size = prune_directory(self.directory, self.max_size)
+            else:
+                self.size += written
+            if self.size > self.max_size:
+                self.size = prune_directory(
+                    self.directory, int(self.max_size * PRUNE_RATIO)
+                )
+
+
+def configure_bytecode_cache(directory, max_size=DEFAULT_CACHE_MAX_SIZE):
+    """Store compiled templates of :data:`jinja2_env` in `directory`.
+    Passing `None` disables the on-disk cache.
+    """
+    if directory is None:
+        jinja2_env.bytecode_cache = None
+    else:
+        jinja2_env.bytecode_cache = BoundedBytecodeCache(directory, max_size)
+
+
+def template_cache_key(source, environment):
+    """Hash of the template source and of environment settings that
+    influence the compiled code.
+    """
+    settings = (
+        jinja2.__version__,
+        environment.block_start_string,
+        environment.block_end_string,
+        environment.variable_start_string,
+        environment.variable_end_string,
+        environment.comment_start_string,
+        environment.comment_end_string,
+        environment.line_statement_prefix,
+        environment.line_comment_prefix,
+        environment.trim_blocks,
+        environment.lstrip_blocks,
+        environment.newline_sequence,
+        environment.keep_trailing_newline,
+        environment.optimized,
+        environment.autoescape,
+        environment.undefined.__name__,
+        tuple(sorted(environment.extensions)),
+    )
+    digest = hashlib.sha256(repr(settings).encode("utf-8"))
+    digest.update(source.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def compile_template(source, environment=jinja2_env):
+    """Return compiled :class:`jinja2.Template` for `source`, reusing
+    templates compiled earlier in this process or stored in the
+    bytecode cache of `environment`.
+    """
+    key = template_cache_key(source, environment)
+    template = compiled_templates.get(key)
+    if template is not None:
+        return template
+
+    bytecode_cache = environment.bytecode_cache
+    if bytecode_cache is None:
+        template = environment.from_string(source)
+    else:
+        bucket = Bucket(environment, key, key)
+        bytecode_cache.load_bytecode(bucket)
+        if bucket.code is None:
+            bucket.code = environment.compile(source)
+            bytecode_cache.dump_bytecode(bucket)
+        template = environment.template_class.from_code(
+            environment, bucket.code, environment.globals
+        )
+
+    with compiled_templates_lock:
+        while len(compiled_templates) >= TEMPLATE_MEMORY_CACHE_SIZE:
+            compiled_templates.pop(next(iter(compiled_templates)), None)
+        compiled_templates[key] = template
+    return template
+
 
 def jinja2_renderer(s, v):
-    return jinja2_env.from_string(s).render(parse_variables(v))
+    return compile_template(s).render(nested_variables(v))
+
+
+def jinja2_generate(s, v):
+    return compile_template(s).generate(nested_variables(v))
+
+
+# renderers may offer a `generate` function returning the output in chunks,
+# used by :func:`render_file` with ``stream=True``
+jinja2_renderer.generate = jinja2_generate
 
 
 def python_formatting_renderer(s, v):
     return s % v
 
 
+def freeze(nested):
+    return types.MappingProxyType(
+        dict((k, freeze(v) if isinstance(v, dict) else v) for k, v in nested.items())
+    )
+
+
+class RenderContext(collections.abc.Mapping):
+    """Variables of a single render.
+
+    Behaves as the given mapping of flat, dotted `variables`, so renderers
+    with the ``(source, variables)`` signature keep working. The nested
+    form is built with :func:`mrbob.parsing.nest_variables`, which also
+    validates the namespaces, and frozen as :attr:`nested` once a renderer
+    first reads it; renderers using flat variables never build it.
+    """
+
+    def __init__(self, variables):
+        self.variables = dict(variables)
+
+    @functools.cached_property
+    def nested(self):
+        return freeze(nest_variables(self.variables))
+
+    def __getitem__(self, key):
+        return self.variables[key]
+
+    def __iter__(self):
+        return iter(self.variables)
+
+    def __len__(self):
+        return len(self.variables)
+
+    def __repr__(self):
+        return repr(self.variables)
+
+    def __reduce__(self):
+        # mapping proxies can not be pickled for process pools
+        return (RenderContext, (self.variables,))
+
+
+def nested_variables(variables):
+    if isinstance(variables, RenderContext):
+        return variables.nested
+    return parse_variables(variables)
+
+
 def parse_variables(variables):
     d = dict()
 
@@ -54,8 +251,164 @@ def parse_variables(variables):
 
 
 def matches_any(filename, patterns):
-    result = any(fnmatch.fnmatch(filename, pat) for pat in patterns)
-    return result
+    """Whether `filename` matches any of the ignore `patterns`, see
+    :class:`mrbob.matching.IgnoreMatcher`.
+    """
+    return compile_patterns(tuple(patterns))(filename)
+
+
+Operation = collections.namedtuple(
+    "Operation", "action source directory name mode size has_variables"
+)
+Operation.__doc__ = """Single step of a :class:`RenderPlan`.
+
+:param action: ``mkdir``, ``render`` or ``copy``
+:param source: path of the source relative to the template root
+:param directory: `source` of the parent directory, ``""`` for the root
+:param name: target name, before ``+variable+`` substitution
+:param mode: permission bits of the source
+:param size: size of the source in bytes
+:param has_variables: if `name` or any parent name contains variables
+"""
+
+
+class RenderPlan(object):
+    """Immutable, ordered list of operations needed to render the template
+    at `root`, as built by :func:`scan_template`.
+
+    The plan does not depend on variables, so it is reused by every render
+    of an unchanged template. It stays fresh while modification times of
+    the template directories do not change or, when the template was
+    scanned with a `fingerprint`, while the fingerprint is the same.
+    """
+
+    def __init__(self, root, operations, directories, fingerprint=None):
+        self.root = root
+        self.operations = tuple(operations)
+        self.directories = tuple(directories)
+        self.fingerprint = fingerprint
+
+    def is_fresh(self, fingerprint=None):
+        if fingerprint is not None or self.fingerprint is not None:
+            return fingerprint == self.fingerprint
+        try:
+            return all(
+                os.stat(path.join(self.root, d)).st_mtime_ns == mtime
+                for d, mtime in self.directories
+            )
+        except OSError:
+            return False
+
+    def resolve(self, fs_target_root, variables):
+        """Yield each operation together with its absolute target path.
+        Directory names are rendered once and reused by their children.
+        """
+        fs_target_dirs = {"": path.abspath(fs_target_root)}
+        for operation in self.operations:
+            fs_target_path = path.join(
+                fs_target_dirs[operation.directory],
+                render_filename(operation.name, variables),
+            )
+            if operation.action == "mkdir":
+                fs_target_dirs[operation.source] = fs_target_path
+            yield operation, fs_target_path
+
+
+def target_name(filename):
+    if filename.endswith(".bob"):
+        return filename.split(".bob")[0]
+    return filename
+
+
+def scan_template(fs_source_root, ignored_files, ignored_directories, fingerprint=None):
+    """Walk the template once and return its :class:`RenderPlan`. Entries
+    of each directory are sorted by name, so plans are reproducible.
+
+    `fs_source_root` is a directory, a path into a zip file or a source
+    returned by :func:`mrbob.sources.open_source`.
+    """
+    template = open_source(fs_source_root)
+    fs_source_root = template.root
+    is_ignored_file = compile_patterns(tuple(ignored_files))
+    is_ignored_directory = compile_patterns(tuple(ignored_directories))
+    operations = []
+    directories = []
+    variable_dirs = set()
+    for directory, local_directories, local_files in template.walk():
+        fs_source_dir = path.join(fs_source_root, directory)
+        directories.append((directory, template.stat(fs_source_dir).mtime_ns))
+        # ignored directories are pruned before descending into them
+        local_directories[:] = [
+            d
+            for d in sorted(local_directories)
+            if not is_ignored_directory(path.join(directory, d))
+        ]
+        entries = [
+            (f, target_name(f), "render" if f.endswith(".bob") else "copy")
+            for f in sorted(local_files)
+            if not is_ignored_file(path.join(directory, f))
+        ]
+        entries.extend((d, d, "mkdir") for d in local_directories)
+        for local_name, name, action in entries:
+            source = path.join(directory, local_name)
+            st = template.stat(path.join(fs_source_dir, local_name))
+            has_variables = directory in variable_dirs or any(
+                is_variable for is_variable, _ in tokenize_filename(name, os.sep)
+            )
+            if action == "mkdir" and has_variables:
+                variable_dirs.add(source)
+            operations.append(
+                Operation(
+                    action,
+                    source,
+                    directory,
+                    name,
+                    st.mode,
+                    st.size if action != "mkdir" else 0,
+                    has_variables,
+                )
+            )
+    return RenderPlan(fs_source_root, operations, directories, fingerprint)
+
+
+# render plans kept in memory, keyed by template root and ignore patterns
+render_plans = {}
+
+
+def get_render_plan(
+    fs_source_root,
+    ignored_files,
+    ignored_directories,
+    cache_dir=None,
+    fingerprint=None,
+):
+    """Return :class:`RenderPlan` of the template, scanning it only if no
+    fresh plan is cached in memory or, given `cache_dir`, on disk.
+    :data:`DEFAULT_IGNORED_FILES` and :data:`DEFAULT_IGNORED_DIRECTORIES`
+    are always ignored.
+    """
+    source = open_source(fs_source_root)
+    fs_source_root = source.root
+    if fingerprint is None:
+        fingerprint = source.fingerprint()
+    ignored_files = list(ignored_files) + DEFAULT_IGNORED_FILES
+    ignored_directories = list(ignored_directories) + DEFAULT_IGNORED_DIRECTORIES
+    key = (fs_source_root, tuple(ignored_files), tuple(ignored_directories))
+    plan = render_plans.get(key)
+    fs_plan = None
+    if plan is None and cache_dir is not None:
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        fs_plan = path.join(ensure_directory(cache_dir), digest + ".pickle")
+        plan = read_pickle(fs_plan)
+    if plan is not None and plan.is_fresh(fingerprint):
+        render_plans[key] = plan
+        return plan
+
+    plan = scan_template(source, ignored_files, ignored_directories, fingerprint)
+    render_plans[key] = plan
+    if fs_plan is not None:
+        write_pickle(fs_plan, plan)
+    return plan
 
 
 def render_structure(
@@ -66,6 +419,10 @@ def render_structure(
     renderer,
     ignored_files,
     ignored_directories,
+    jobs=1,
+    executor="thread",
+    cache_dir=None,
+    **options,
 ):
     """Recursively copies the given filesystem path `fs_source_root_ to a target directory `fs_target_root`.
 
@@ -75,76 +432,459 @@ def render_structure(
     strings wrapped in `+` signs in file- or directory names will be replaced
     with values from the variables, i.e. a file named `+name+.py.bob` given a
     dictionary {'name': 'bar'} would be rendered as `bar.py`.
+
+    Directories are created first, in template order. Files are then
+    rendered and copied by `jobs` workers of the given `executor`
+    (see :data:`EXECUTORS`); errors are raised in template order.
+
+    `variables` are wrapped in a :class:`RenderContext` once for all files.
+
+    Returns a :class:`collections.Counter` of files by the status returned
+    from :func:`create_file`.
+
+    The template is scanned once into a :class:`RenderPlan`, cached in
+    memory and, given `cache_dir`, on disk. Remaining `options` are passed
+    to :func:`render_file`.
+
+    `fs_source_root` may also be a path into a zip file, whose members are
+    then read directly from the archive, see :mod:`mrbob.sources`.
     """
-    ignored_files.extend(DEFAULT_IGNORED_FILES)
-    ignored_directories.extend(DEFAULT_IGNORED_DIRECTORIES)
     if not isinstance(fs_source_root, six.text_type):  # pragma: no cover
         fs_source_root = six.u(fs_source_root)
-    for fs_source_dir, local_directories, local_files in os.walk(
-        fs_source_root, topdown=True
-    ):
-        fs_target_dir = path.abspath(
-            path.join(fs_target_root, path.relpath(fs_source_dir, fs_source_root))
+    if not isinstance(variables, RenderContext):
+        variables = RenderContext(variables)
+    source = open_source(fs_source_root)
+    fs_source_root = source.root
+    plan = get_render_plan(source, ignored_files, ignored_directories, cache_dir)
+    stats = collections.Counter()
+    files = []
+    for operation, fs_target_path in plan.resolve(fs_target_root, variables):
+        if operation.action != "mkdir":
+            files.append((path.join(fs_source_root, operation.source), fs_target_path))
+        elif not path.exists(fs_target_path):
+            if verbose:
+                print(six.u("mkdir %s") % fs_target_path)
+            os.mkdir(fs_target_path)
+
+    if jobs == 1 or len(files) < 2:
+        for fs_source, fs_target_path in files:
+            render_file(
+                fs_source,
+                fs_target_path,
+                variables,
+                verbose,
+                renderer,
+                stats=stats,
+                source=source,
+                **options,
+            )
+    else:
+        render_parallel(
+            files,
+            variables,
+            verbose,
+            renderer,
+            jobs,
+            executor,
+            stats,
+            source=source,
+            **options,
         )
-        local_directories[:] = [
-            d for d in local_directories if not matches_any(d, ignored_directories)
-        ]
-        for local_file in local_files:
-            if matches_any(local_file, ignored_files):
-                continue
-            render_template(
-                path.join(fs_source_dir, local_file),
-                render_filename(fs_target_dir, variables),
+    return stats
+
+
+def update_structure(
+    fs_source_root,
+    fs_target_root,
+    variables,
+    previous_variables,
+    dependencies,
+    verbose,
+    renderer,
+    ignored_files,
+    ignored_directories,
+    jobs=1,
+    executor="thread",
+    cache_dir=None,
+    **options,
+):
+    """Update the structure rendered to `fs_target_root` with
+    `previous_variables` so it matches a render with `variables`,
+    touching only what depends on the variables that changed.
+
+    `dependencies` maps operation sources to the variables they depend on,
+    as returned by :func:`mrbob.analysis.template_dependencies`. Files and
+    directories whose ``+variable+`` names changed are renamed, templates
+    depending on a changed variable are rendered again, and missing files
+    are created. An existing file at a new name is not replaced by the
+    renamed one.
+
+    Returns a :class:`collections.Counter` of files by status, as
+    :func:`render_structure` does, with ``renamed`` entries and ``kept``
+    files that did not need to be rendered again.
+    """
+    from .analysis import uses_variable
+
+    if not isinstance(variables, RenderContext):
+        variables = RenderContext(variables)
+    if not isinstance(previous_variables, RenderContext):
+        previous_variables = RenderContext(previous_variables)
+    changed = changed_variables(previous_variables, variables)
+    source = open_source(fs_source_root)
+    fs_source_root = source.root
+    plan = get_render_plan(source, ignored_files, ignored_directories, cache_dir)
+    stats = collections.Counter()
+    files = []
+    # directories as they are on disk while renaming, and as they should be
+    fs_current_dirs = {"": path.abspath(fs_target_root)}
+    fs_target_dirs = {"": path.abspath(fs_target_root)}
+    for operation in plan.operations:
+        fs_target_path = path.join(
+            fs_target_dirs[operation.directory],
+            render_filename(operation.name, variables),
+        )
+        try:
+            fs_current_path = path.join(
+                fs_current_dirs[operation.directory],
+                render_filename(operation.name, previous_variables),
+            )
+        except KeyError:
+            # the name uses a variable that was not set before
+            fs_current_path = fs_target_path
+        if fs_current_path != fs_target_path and path.lexists(fs_current_path):
+            if not path.lexists(fs_target_path):
+                if verbose:
+                    print(
+                        six.u("Renaming %s to %s") % (fs_current_path, fs_target_path)
+                    )
+                os.rename(fs_current_path, fs_target_path)
+                stats["renamed"] += 1
+                fs_current_path = fs_target_path
+        else:
+            fs_current_path = fs_target_path
+
+        if operation.action == "mkdir":
+            fs_target_dirs[operation.source] = fs_target_path
+            fs_current_dirs[operation.source] = fs_current_path
+            if not path.exists(fs_target_path):
+                if verbose:
+                    print(six.u("mkdir %s") % fs_target_path)
+                os.mkdir(fs_target_path)
+            continue
+
+        needs_render = not path.lexists(fs_target_path)
+        if operation.action == "render" and not needs_render:
+            used = dependencies.get(operation.source, ())
+            needs_render = any(uses_variable(used, name) for name in changed)
+        if needs_render:
+            files.append((path.join(fs_source_root, operation.source), fs_target_path))
+        else:
+            stats["kept"] += 1
+
+    if jobs == 1 or len(files) < 2:
+        for fs_source, fs_target_path in files:
+            render_file(
+                fs_source,
+                fs_target_path,
                 variables,
                 verbose,
                 renderer,
+                stats=stats,
+                source=source,
+                **options,
+            )
+    else:
+        render_parallel(
+            files,
+            variables,
+            verbose,
+            renderer,
+            jobs,
+            executor,
+            stats,
+            source=source,
+            **options,
+        )
+    return stats
+
+
+def changed_variables(previous_variables, variables):
+    """Names of variables that differ between `previous_variables`, as
+    remembered in a ``.mrbob.ini``, and `variables`, compared as strings.
+    """
+    changed = set()
+    for name in set(previous_variables) | set(variables):
+        if name not in previous_variables or name not in variables:
+            changed.add(name)
+        elif six.text_type(previous_variables[name]) != six.text_type(variables[name]):
+            changed.add(name)
+    return frozenset(changed)
+
+
+def plan_structure(
+    fs_source_root,
+    fs_target_root,
+    variables,
+    renderer,
+    ignored_files,
+    ignored_directories,
+    cache_dir=None,
+    render_content=False,
+):
+    """Compute what :func:`render_structure` would do without writing
+    anything. Returns a dictionary with the list of ``operations`` (action,
+    source, target, size, whether the target exists) and ``collisions``,
+    targets produced by more than one source.
+
+    Sizes are those of the sources, unless `render_content` renders the
+    templates in memory to count the bytes of their output.
+    """
+    if not isinstance(variables, RenderContext):
+        variables = RenderContext(variables)
+    source = open_source(fs_source_root)
+    fs_source_root = source.root
+    plan = get_render_plan(source, ignored_files, ignored_directories, cache_dir)
+    operations = []
+    sources_by_target = collections.defaultdict(list)
+    for operation, fs_target_path in plan.resolve(fs_target_root, variables):
+        size = operation.size
+        if render_content and operation.action == "render":
+            output = render_source(
+                path.join(fs_source_root, operation.source),
+                variables,
+                renderer,
+                source=source,
             )
-        for local_directory in local_directories:
-            abs_dir = render_filename(
-                path.join(fs_target_dir, local_directory), variables
+            size = len(output.encode("utf-8"))
+        operations.append(
+            dict(
+                action=operation.action,
+                source=operation.source,
+                target=fs_target_path,
+                size=size,
+                exists=path.lexists(fs_target_path),
             )
-            if not path.exists(abs_dir):
+        )
+        sources_by_target[fs_target_path].append(operation.source)
+    collisions = [
+        dict(target=target, sources=sources)
+        for target, sources in sources_by_target.items()
+        if len(sources) > 1
+    ]
+    return dict(operations=operations, collisions=collisions)
+
+
+def render_parallel(
+    files, variables, verbose, renderer, jobs, executor, stats=None, **options
+):
+    """Render `files`, a list of ``(fs_source, fs_target_path)``, in a pool
+    of `jobs` workers. ``jobs = 0`` uses one worker per CPU.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError("Unknown executor: %s" % executor)
+    kwargs = dict(max_workers=jobs or None)
+    if executor == "process" and jinja2_env.bytecode_cache is not None:
+        # workers of a spawned process pool start with an empty environment
+        kwargs["initializer"] = configure_bytecode_cache
+        kwargs["initargs"] = (
+            jinja2_env.bytecode_cache.directory,
+            jinja2_env.bytecode_cache.max_size,
+        )
+
+    with EXECUTORS[executor](**kwargs) as pool:
+        futures = [
+            pool.submit(
+                create_file,
+                fs_source,
+                fs_target_path,
+                variables,
+                False,
+                renderer,
+                **options,
+            )
+            for fs_source, fs_target_path in files
+        ]
+        try:
+            for (fs_source, fs_target_path), future in zip(files, futures):
+                status = future.result()
+                if stats is not None:
+                    stats[status] += 1
                 if verbose:
-                    print(six.u("mkdir %s") % abs_dir)
-                os.mkdir(abs_dir)
+                    if fs_source.endswith(".bob"):
+                        message = six.u("Rendering %s to %s")
+                    else:
+                        message = six.u("Copying %s to %s")
+                    print(message % (fs_source, fs_target_path))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
 
 
-def render_template(fs_source, fs_target_dir, variables, verbose, renderer):
-    filename = path.split(fs_source)[1]
-    if filename.endswith(".bob"):
-        filename = filename.split(".bob")[0]
-        fs_target_path = path.join(fs_target_dir, render_filename(filename, variables))
+def render_template(fs_source, fs_target_dir, variables, verbose, renderer, **options):
+    filename = target_name(path.split(fs_source)[1])
+    fs_target_path = path.join(fs_target_dir, render_filename(filename, variables))
+    return render_file(
+        fs_source, fs_target_path, variables, verbose, renderer, **options
+    )
+
+
+def render_file(
+    fs_source, fs_target_path, variables, verbose, renderer, stats=None, **options
+):
+    """Render `fs_source` to `fs_target_path` with :func:`create_file`,
+    counting the outcome in `stats`.
+    """
+    status = create_file(
+        fs_source, fs_target_path, variables, verbose, renderer, **options
+    )
+    if stats is not None:
+        stats[status] += 1
+    return fs_target_path
+
+
+def create_file(
+    fs_source,
+    fs_target_path,
+    variables,
+    verbose,
+    renderer,
+    stream=False,
+    copy_mode="copy",
+    skip_unchanged=False,
+    source=None,
+):
+    """Render `fs_source` to `fs_target_path` if it is a `.bob` template,
+    otherwise copy it with :func:`mrbob.copying.copy_file` in `copy_mode`.
+
+    `fs_source` is read from `source`, see :mod:`mrbob.sources`, or from
+    the filesystem if not given.
+
+    With `stream` and a renderer that has a `generate` function, output is
+    written chunk by chunk instead of being built as one string.
+
+    With `skip_unchanged`, an existing target with identical content is
+    left untouched, including its mode and modification time.
+
+    Returns ``created``, ``written`` (an existing file was replaced) or
+    ``unchanged``.
+    """
+    if source is None:
+        source = DirectorySource(path.dirname(fs_source))
+    status = "written" if path.lexists(fs_target_path) else "created"
+    if fs_source.endswith(".bob"):
         if verbose:
             print(six.u("Rendering %s to %s") % (fs_source, fs_target_path))
-        fs_source_mode = stat.S_IMODE(os.stat(fs_source).st_mode)
-        with codecs.open(fs_source, "r", "utf-8") as f:
-            source_output = f.read()
-            output = renderer(source_output, variables)
-            # append newline due to jinja2 bug, see https://github.com/iElectric/mr.bob/issues/30
-            if source_output.endswith("\n") and not output.endswith("\n"):
-                output += "\n"
-        with codecs.open(fs_target_path, "w", "utf-8") as fs_target:
-            fs_target.write(output)
+        fs_source_mode = source.stat(fs_source).mode
+        generate = getattr(renderer, "generate", None)
+        if stream and generate is not None:
+            source_output = source.read_text(fs_source)
+            # stream into a temporary file, so a failing render leaves an
+            # existing target untouched
+            fd, fs_output = tempfile.mkstemp(
+                dir=path.dirname(fs_target_path), prefix=".mrbob-"
+            )
+            os.close(fd)
+            try:
+                write_chunks(
+                    fs_output,
+                    generate(source_output, variables),
+                    source_output.endswith("\n"),
+                )
+                if skip_unchanged and status == "written":
+                    if same_content(fs_target_path, fs_other=fs_output):
+                        os.remove(fs_output)
+                        return "unchanged"
+                # replaces links too, leaving the files they point to alone
+                os.replace(fs_output, fs_target_path)
+            except BaseException:
+                # do not leave temporary files in the target directory
+                if path.exists(fs_output):
+                    os.remove(fs_output)
+                raise
+        else:
+            output = render_source(fs_source, variables, renderer, source)
+            if skip_unchanged and status == "written":
+                if same_content(fs_target_path, data=output.encode("utf-8")):
+                    return "unchanged"
+            with codecs.open(fs_target_path, "w", "utf-8") as fs_target:
+                fs_target.write(output)
         os.chmod(fs_target_path, fs_source_mode)
     else:
-        fs_target_path = path.join(fs_target_dir, render_filename(filename, variables))
         if verbose:
             print(six.u("Copying %s to %s") % (fs_source, fs_target_path))
-        copy2(fs_source, fs_target_path)
-    return path.join(fs_target_dir, filename)
+        if skip_unchanged and status == "written":
+            if source.is_copied(fs_source, fs_target_path, copy_mode):
+                return "unchanged"
+        source.copy(fs_source, fs_target_path, copy_mode)
+    return status
+
+
+def render_source(fs_source, variables, renderer, source=None):
+    """Return the rendered output of template `fs_source`, read from
+    `source` if given.
+    """
+    if source is None:
+        source = DirectorySource(path.dirname(fs_source))
+    source_output = source.read_text(fs_source)
+    output = renderer(source_output, variables)
+    # append newline due to jinja2 bug, see https://github.com/iElectric/mr.bob/issues/30
+    if source_output.endswith("\n") and not output.endswith("\n"):
+        output += "\n"
+    return output
+
+
+def write_chunks(fs_target_path, chunks, trailing_newline):
+    """Write `chunks` of text to `fs_target_path` as they are produced,
+    appending a newline if `trailing_newline` and the output lacks it.
+    """
+    last_chunk = ""
+    with codecs.open(fs_target_path, "w", "utf-8") as fs_target:
+        for chunk in chunks:
+            if chunk:
+                fs_target.write(chunk)
+                last_chunk = chunk
+        if trailing_newline and not last_chunk.endswith("\n"):
+            fs_target.write("\n")
+
+
+@functools.lru_cache(maxsize=None)
+def variables_regex(sep):
+    return re.compile(r"\+[^+%s]+\+" % re.escape(sep))
+
+
+@functools.lru_cache(maxsize=4096)
+def tokenize_filename(filename, sep):
+    """Split `filename` into a tuple of ``(is_variable, text)`` segments,
+    where variable segments hold the variable name without the `+` signs.
+    """
+    tokens = []
+    position = 0
+    for match in variables_regex(sep).finditer(filename):
+        start = match.start()
+        if start > position:
+            tokens.append((False, filename[position:start]))
+        tokens.append((True, match.group()[1:-1]))
+        position = match.end()
+    if position < len(filename):
+        tokens.append((False, filename[position:]))
+    return tuple(tokens)
 
 
 def render_filename(filename, variables):
-    variables_regex = re.compile(r"\+[^+%s]+\+" % re.escape(os.sep))
+    tokens = tokenize_filename(filename, os.sep)
+    if len(tokens) == 1 and not tokens[0][0]:
+        return filename
 
-    replaceables = variables_regex.findall(filename)
-    for replaceable in replaceables:
-        actual_replaceable = replaceable.replace("+", "")
-        if actual_replaceable in variables:
-            filename = filename.replace(replaceable, variables[actual_replaceable])
+    parts = []
+    for is_variable, text in tokens:
+        if not is_variable:
+            parts.append(text)
+        elif text in variables:
+            parts.append(variables[text])
         else:
             raise KeyError(
                 "%s key part of filename %s was not found in variables %s"
-                % (actual_replaceable, filename, variables)
+                % (text, filename, variables)
             )
-    return filename
+    return "".join(parts)
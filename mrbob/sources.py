@@ -0,0 +1,282 @@
+"""Sources that template files are read from during rendering."""
+
+import codecs
+import collections
+import ntpath
+import os
+import shutil
+import stat
+import threading
+import time
+from os import path
+
+from .bobexceptions import ConfigurationError
+from .copying import (
+    COPY_CHUNK_SIZE,
+    copy_file,
+    file_digest,
+    is_copied,
+    remove_link,
+    stream_digest,
+)
+
+# template archives read with tarfile, compressed or not
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+SourceStat = collections.namedtuple("SourceStat", "mode size mtime_ns")
+SourceStat.__doc__ = """Permission bits, size and modification time of a
+template file or directory.
+"""
+
+
+class DirectorySource(object):
+    """Template stored as a directory `root` on the filesystem.
+
+    Files are addressed by their filesystem paths below `root`.
+    """
+
+    local = True
+
+    def __init__(self, root):
+        self.root = root
+
+    def fingerprint(self):
+        """Value that changes with the template, `None` if freshness is
+        checked by modification times of the directories.
+        """
+        return None
+
+    def walk(self):
+        """Like :func:`os.walk`, but yields directories relative to
+        :attr:`root`, with ``""`` for the root itself.
+        """
+        for fs_dir, directories, files in os.walk(self.root, topdown=True):
+            directory = path.relpath(fs_dir, self.root)
+            yield ("" if directory == os.curdir else directory), directories, files
+
+    def isfile(self, fs_path):
+        return path.isfile(fs_path)
+
+    def stat(self, fs_path):
+        st = os.stat(fs_path)
+        return SourceStat(stat.S_IMODE(st.st_mode), st.st_size, st.st_mtime_ns)
+
+    def open(self, fs_path):
+        return open(fs_path, "rb")
+
+    def read_text(self, fs_path):
+        with codecs.open(fs_path, "r", "utf-8") as f:
+            return f.read()
+
+    def copy(self, fs_path, fs_target, mode="copy"):
+        return copy_file(fs_path, fs_target, mode)
+
+    def is_copied(self, fs_path, fs_target, mode="copy"):
+        return is_copied(fs_path, fs_target, mode)
+
+
+class ZipSource(DirectorySource):
+    """Template stored in zip file `archive`, optionally in directory
+    `subpath` of it.
+
+    Files are addressed by paths below :attr:`root`, the archive path
+    joined with `subpath`, as :mod:`zipimport` does. Members are only
+    decompressed when read, chunk by chunk, and keep the Unix permission
+    bits stored in the archive. There is nothing to link to, so all copy
+    modes copy the data.
+    """
+
+    local = False
+
+    def __init__(self, archive, subpath=""):
+        self.archive = archive
+        self.subpath = subpath.strip("/")
+        self.root = archive
+        if self.subpath:
+            self.root = path.join(archive, *self.subpath.split("/"))
+        self.lock = threading.Lock()
+        self.zipfile = None
+        self.members = None
+        self.directories = None
+
+    def __getstate__(self):
+        # open zip files and locks can not be pickled for process pools
+        return dict(archive=self.archive, subpath=self.subpath)
+
+    def __setstate__(self, state):
+        self.__init__(state["archive"], state["subpath"])
+
+    def open_archive(self):
+        with self.lock:
+            if self.zipfile is None:
+                from zipfile import ZipFile
+
+                zf = ZipFile(self.archive)
+                self.members, self.directories = index_archive(zf)
+                self.zipfile = zf
+        return self.zipfile
+
+    def fingerprint(self):
+        st = os.stat(self.archive)
+        return (st.st_size, st.st_mtime_ns)
+
+    def member(self, fs_path):
+        """Name inside the archive of the file at `fs_path`."""
+        relpath = path.relpath(fs_path, self.root)
+        parts = [] if relpath == os.curdir else relpath.split(os.sep)
+        if self.subpath:
+            parts.insert(0, self.subpath)
+        return "/".join(parts)
+
+    def walk(self):
+        self.open_archive()
+        if self.subpath not in self.directories:
+            return
+        pending = [(self.subpath, "")]
+        while pending:
+            name, directory = pending.pop()
+            subdirs, files = self.directories[name]
+            directories = sorted(subdirs)
+            yield directory, directories, sorted(files)
+            # pruned `directories` are not visited, as with os.walk
+            for d in reversed(directories):
+                child = name + "/" + d if name else d
+                pending.append((child, path.join(directory, d)))
+
+    def isfile(self, fs_path):
+        self.open_archive()
+        name = self.member(fs_path)
+        return name in self.members and name not in self.directories
+
+    def info(self, fs_path):
+        self.open_archive()
+        try:
+            return self.members[self.member(fs_path)]
+        except KeyError:
+            raise OSError("No such file in %s: %s" % (self.archive, fs_path))
+
+    def stat(self, fs_path):
+        name = self.member(fs_path)
+        self.open_archive()
+        if name in self.directories:
+            info = self.members.get(name)
+            mode = (info.external_attr >> 16) if info is not None else 0
+            return SourceStat(stat.S_IMODE(mode) or 0o755, 0, 0)
+        info = self.info(fs_path)
+        mode = stat.S_IMODE(info.external_attr >> 16) or 0o644
+        return SourceStat(mode, info.file_size, zip_mtime_ns(info))
+
+    def open(self, fs_path):
+        return self.open_archive().open(self.info(fs_path))
+
+    def read_text(self, fs_path):
+        with self.open(fs_path) as f:
+            return f.read().decode("utf-8")
+
+    def copy(self, fs_path, fs_target, mode="copy"):
+        st = self.stat(fs_path)
+        remove_link(fs_target)
+        with self.open(fs_path) as fsrc, open(fs_target, "wb") as fdst:
+            shutil.copyfileobj(fsrc, fdst, COPY_CHUNK_SIZE)
+        os.chmod(fs_target, st.mode)
+        mtime = st.mtime_ns / 1e9
+        os.utime(fs_target, (mtime, mtime))
+        return "copy"
+
+    def is_copied(self, fs_path, fs_target, mode="copy"):
+        try:
+            st = os.lstat(fs_target)
+        except OSError:
+            return False
+        if not stat.S_ISREG(st.st_mode) or st.st_nlink > 1:
+            return False
+        if st.st_size != self.stat(fs_path).size:
+            return False
+        with self.open(fs_path) as f:
+            return file_digest(fs_target) == stream_digest(f)
+
+
+def index_archive(zf):
+    """Map member names of `zf`, without trailing ``/``, to their infos,
+    and directory names to the names of their subdirectories and files.
+    Directories without an entry of their own are included.
+    """
+    members = {}
+    directories = {"": (set(), [])}
+    for info in zf.infolist():
+        name = info.filename.rstrip("/")
+        if not name:
+            continue
+        check_zip_member(name)
+        members[name] = info
+        parts = name.split("/")
+        parent = ""
+        for i, part in enumerate(parts[:-1]):
+            directories[parent][0].add(part)
+            parent = "/".join(parts[: i + 1])
+            directories.setdefault(parent, (set(), []))
+        if info.is_dir():
+            directories[parent][0].add(parts[-1])
+            directories.setdefault(name, (set(), []))
+        else:
+            directories[parent][1].append(parts[-1])
+    return members, directories
+
+
+def check_zip_member(name):
+    """Refuse member `name` that could escape the target directory:
+    absolute paths, drive letters and empty or ``..`` segments.
+    """
+    parts = name.replace("\\", "/").split("/")
+    if ntpath.splitdrive(name)[0] or "" in parts or os.pardir in parts:
+        raise ConfigurationError("Unsafe path in zip file: %s" % name)
+
+
+def zip_mtime_ns(info):
+    return int(time.mktime(info.date_time + (0, 0, -1)) * 1e9)
+
+
+def find_file(fs_path):
+    """Split `fs_path` into an existing file and the path inside it,
+    separated by ``/``, or return `None` if no part of `fs_path` is a file.
+    """
+    fs_file = path.normpath(fs_path)
+    subpath = []
+    while fs_file and not path.exists(fs_file):
+        fs_file, name = path.split(fs_file)
+        if not name:
+            return None
+        subpath.insert(0, name)
+    if path.isfile(fs_file):
+        return fs_file, "/".join(subpath)
+    return None
+
+
+def find_archive(fs_path):
+    """Split `fs_path` into a zip file and the directory inside it, or
+    return `None` if no part of `fs_path` is a zip file.
+    """
+    from zipfile import is_zipfile
+
+    found = find_file(fs_path)
+    if found is not None and is_zipfile(found[0]):
+        return found
+    return None
+
+
+def is_tar_name(name):
+    return name.lower().endswith(TAR_SUFFIXES)
+
+
+def open_source(fs_root):
+    """Return the source of the template at `fs_root`, a directory or a
+    path into a zip file. Sources are returned unchanged.
+    """
+    if isinstance(fs_root, DirectorySource):
+        return fs_root
+    if path.isdir(fs_root):
+        return DirectorySource(fs_root)
+    archive = find_archive(fs_root)
+    if archive is None:
+        raise ConfigurationError("Template directory does not exist: %s" % fs_root)
+    return ZipSource(*archive)
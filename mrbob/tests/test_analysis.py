@@ -0,0 +1,213 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+
+class find_used_variablesTest(unittest.TestCase):
+    def call_FUT(self, text):
+        from ..analysis import find_used_variables
+
+        return find_used_variables(text)
+
+    def test_names(self):
+        self.assertEqual(self.call_FUT("{{{foo}}} and {{{bar}}}"), set(["foo", "bar"]))
+
+    def test_attributes(self):
+        self.assertEqual(
+            self.call_FUT("{{{author.name}}} {{{author['email']}}}"),
+            set(["author.name", "author.email"]),
+        )
+
+    def test_calls_and_filters(self):
+        self.assertEqual(
+            self.call_FUT("{{{author.name.upper()}}} {{{a.b|default(c)}}}"),
+            set(["author.name", "a.b", "c"]),
+        )
+
+    def test_method_calls(self):
+        self.assertEqual(self.call_FUT("{{{author.items()}}}"), set(["author"]))
+        self.assertEqual(
+            self.call_FUT("{{% for k, v in author.items() %}}{{{v}}}{{% endfor %}}"),
+            set(["author"]),
+        )
+        self.assertEqual(
+            self.call_FUT("{{{author.get('name', default)}}}"),
+            set(["author", "default"]),
+        )
+        self.assertEqual(self.call_FUT("{{{a['b'].keys()}}}"), set(["a.b"]))
+        self.assertEqual(self.call_FUT("{{{a[key].keys()}}}"), set(["a", "key"]))
+
+    def test_method_calls_use_namespace(self):
+        from ..analysis import uses_variable
+
+        used = self.call_FUT("{{% for k, v in author.items() %}}{{{v}}}{{% endfor %}}")
+        self.assertTrue(uses_variable(used, "author.name"))
+
+    def test_dynamic_item(self):
+        self.assertEqual(self.call_FUT("{{{a.b[key].c}}}"), set(["a.b", "key"]))
+
+    def test_conditions(self):
+        self.assertEqual(
+            self.call_FUT("{{% if flag %}}{{{value}}}{{% endif %}}"),
+            set(["flag", "value"]),
+        )
+
+    def test_local_names(self):
+        self.assertEqual(
+            self.call_FUT(
+                "{{% for item in items %}}{{{item.name}}}{{% endfor %}}"
+                "{{% set x = 1 %}}{{{x}}}"
+            ),
+            set(["items"]),
+        )
+
+
+class uses_variableTest(unittest.TestCase):
+    def call_FUT(self, used, name):
+        from ..analysis import uses_variable
+
+        return uses_variable(frozenset(used), name)
+
+    def test_direct(self):
+        self.assertTrue(self.call_FUT(["author.name"], "author.name"))
+        self.assertFalse(self.call_FUT(["author.name"], "author.email"))
+
+    def test_namespace_used(self):
+        self.assertTrue(self.call_FUT(["author"], "author.name"))
+
+    def test_attribute_of_variable(self):
+        self.assertTrue(self.call_FUT(["author.name.upper"], "author.name"))
+        self.assertFalse(self.call_FUT(["author.names"], "author.name"))
+
+
+class template_dependenciesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.template = os.path.join(self.tmpdir, "template")
+        self.cache_dir = os.path.join(self.tmpdir, "cache")
+        self.write("+package+/module.py.bob", "# {{{author.name}}}\n")
+        self.write("+package+/static.txt", "{{{not_rendered}}}\n")
+        self.write("README.bob", "{{{description}}}\n")
+        self.write("ignored.bob", "{{{ignored}}}\n")
+
+    def write(self, name, content):
+        fs_path = os.path.join(self.template, name)
+        if not os.path.isdir(os.path.dirname(fs_path)):
+            os.makedirs(os.path.dirname(fs_path))
+        with open(fs_path, "w") as f:
+            f.write(content)
+
+    def call_FUT(self, analysis_dir=None):
+        from ..analysis import template_dependencies
+
+        return template_dependencies(
+            self.template, ["ignored.bob"], [], analysis_dir=analysis_dir
+        )
+
+    def test_dependencies(self):
+        self.assertEqual(
+            self.call_FUT(),
+            {
+                "+package+": set(["package"]),
+                os.path.join("+package+", "module.py.bob"): set(
+                    ["package", "author.name"]
+                ),
+                os.path.join("+package+", "static.txt"): set(["package"]),
+                "README.bob": set(["description"]),
+            },
+        )
+
+    def test_variable_index(self):
+        from ..analysis import variable_index
+
+        index = variable_index(self.call_FUT())
+        self.assertEqual(index["description"], ["README.bob"])
+        self.assertEqual(len(index["package"]), 3)
+        self.assertFalse("ignored" in index)
+
+    def test_changed_file(self):
+        self.call_FUT()
+        self.write("README.bob", "{{{title}}} and more\n")
+        self.assertEqual(self.call_FUT()["README.bob"], set(["title"]))
+
+    def test_analysis_dir(self):
+        from .. import analysis
+
+        self.call_FUT(self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        with mock.patch.object(analysis, "analyzed_files", {}):
+            with mock.patch.object(analysis, "loaded_analyses", set()):
+                with mock.patch(
+                    "mrbob.analysis.find_used_variables"
+                ) as find_used_variables:
+                    dependencies = self.call_FUT(self.cache_dir)
+        self.assertFalse(find_used_variables.called)
+        self.assertEqual(dependencies["README.bob"], set(["description"]))
+
+
+class skip_unused_questionsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.template = os.path.join(self.tmpdir, "template")
+        os.mkdir(self.template)
+        with open(os.path.join(self.template, ".mrbob.ini"), "w") as f:
+            f.write(
+                "[questions]\n"
+                "name.question = Name\n"
+                "name.required = True\n"
+                "unused.question = Unused\n"
+                "unused.required = True\n"
+            )
+        with open(os.path.join(self.template, "+name+.txt.bob"), "w") as f:
+            f.write("{{{name}}}\n")
+
+    def make_one(self, **bobconfig):
+        from ..configurator import Configurator
+
+        bobconfig.setdefault("non_interactive", True)
+        return Configurator(
+            self.template,
+            os.path.join(self.tmpdir, "out"),
+            bobconfig=bobconfig,
+            variables={"name": "bob"},
+        )
+
+    def test_skipped(self):
+        c = self.make_one(skip_unused_questions="yes")
+        self.assertEqual(c.used_variables(), set(["name"]))
+        c.ask_questions()
+        self.assertFalse("unused" in c.variables)
+        c.render()
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, "out", "bob.txt")))
+
+    def test_not_skipped_by_default(self):
+        from ..bobexceptions import ConfigurationError
+
+        c = self.make_one()
+        self.assertRaises(ConfigurationError, c.ask_questions)
+
+    def test_interactive(self):
+        c = self.make_one(skip_unused_questions="yes", non_interactive=False)
+        c.questions[1].command_prompt = lambda question: "answer"
+        c.ask_questions()
+        self.assertEqual(c.variables["unused"], "answer")
+
+    def test_other_renderer(self):
+        from ..rendering import python_formatting_renderer
+
+        c = self.make_one(skip_unused_questions="yes")
+        c.renderer = python_formatting_renderer
+        self.assertEqual(c.used_variables(), None)
+
+    def test_other_renderer_asks_all(self):
+        from ..rendering import python_formatting_renderer
+
+        c = self.make_one(skip_unused_questions="yes")
+        c.renderer = python_formatting_renderer
+        c.questions[1].default = "fallback"
+        c.ask_questions()
+        self.assertEqual(c.variables["unused"], "fallback")
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class parse_sizeTest(unittest.TestCase):
+    def call_FUT(self, value):
+        from ..caching import parse_size
+
+        return parse_size(value)
+
+    def test_bytes(self):
+        self.assertEqual(self.call_FUT("512"), 512)
+        self.assertEqual(self.call_FUT(512), 512)
+
+    def test_units(self):
+        self.assertEqual(self.call_FUT("64K"), 64 * 1024)
+        self.assertEqual(self.call_FUT("2mb"), 2 * 1024 * 1024)
+        self.assertEqual(self.call_FUT("1G"), 1024**3)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, self.call_FUT, "lots")
+
+
+class picklesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.fs_pickle = os.path.join(self.directory, "cached.pickle")
+
+    def test_roundtrip(self):
+        from ..caching import read_pickle, write_pickle
+
+        write_pickle(self.fs_pickle, {"foo": ("bar", 1)})
+        self.assertEqual(read_pickle(self.fs_pickle), {"foo": ("bar", 1)})
+        self.assertEqual(os.listdir(self.directory), ["cached.pickle"])
+
+    def test_unusable(self):
+        from ..caching import read_pickle
+
+        self.assertEqual(read_pickle(self.fs_pickle), None)
+        for content in [
+            b"",
+            b"garbage",
+            # half written
+            b"\x80\x05\x95\x10\x00",
+            # refers to a name that no longer exists
+            b"cmrbob.caching\nno_such_name\n.",
+            b"cmrbob.no_such_module\nname\n.",
+        ]:
+            with open(self.fs_pickle, "wb") as f:
+                f.write(content)
+            self.assertEqual(read_pickle(self.fs_pickle), None, content)
+
+    def test_failed_write(self):
+        from ..caching import write_pickle
+
+        self.assertRaises(Exception, write_pickle, self.fs_pickle, lambda: None)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class prune_directoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make(self, name, size, mtime):
+        fs_path = os.path.join(self.directory, name)
+        with open(fs_path, "wb") as f:
+            f.write(b"x" * size)
+        os.utime(fs_path, (mtime, mtime))
+
+    def call_FUT(self, max_size, keep=()):
+        from ..caching import prune_directory
+
+        return prune_directory(self.directory, max_size, keep)
+
+    def test_removes_least_recently_used(self):
+        self.make("old", 10, 1000)
+        self.make("new", 10, 2000)
+        self.assertEqual(self.call_FUT(15), 10)
+        self.assertEqual(os.listdir(self.directory), ["new"])
+
+    def test_keep(self):
+        self.make("old", 10, 1000)
+        self.make("new", 10, 2000)
+        self.call_FUT(15, keep=("old",))
+        self.assertEqual(os.listdir(self.directory), ["old"])
+
+    def test_directories(self):
+        os.mkdir(os.path.join(self.directory, "tree"))
+        with open(os.path.join(self.directory, "tree", "file"), "wb") as f:
+            f.write(b"x" * 10)
+        os.utime(os.path.join(self.directory, "tree"), (1000, 1000))
+        self.make("new", 10, 2000)
+        self.call_FUT(15)
+        self.assertEqual(os.listdir(self.directory), ["new"])
@@ -37,7 +37,7 @@ class TestCLI(unittest.TestCase):
     def test_cleanup_tempdir(self, mock_Configurator):
         template_dir = tempfile.mkdtemp()
         mock_Configurator().is_tempdir.return_value = True
-        mock_Configurator().template_dir = template_dir
+        mock_Configurator().tempdir = template_dir
         self.call_FUT(template_dir)
         self.assertFalse(os.path.exists(template_dir))
 
@@ -46,6 +46,107 @@ class TestCLI(unittest.TestCase):
         self.call_FUT("-O", os.path.join(self.output_dir, "notexist"), template_dir)
         self.assertTrue(os.path.isdir(self.output_dir))
 
+    def test_jobs(self):
+        template_dir = os.path.join(os.path.dirname(__file__), "templates", "empty")
+        self.call_FUT("-j", "2", "-O", self.output_dir, template_dir)
+        self.assertRaises(
+            SystemExit, self.call_FUT, "-j", "-1", "-O", self.output_dir, template_dir
+        )
+
+    def test_dry_run(self):
+        import json
+
+        from six import StringIO
+
+        template_dir = os.path.join(
+            os.path.dirname(__file__), "templates", "multiconfig"
+        )
+        target_dir = os.path.join(self.output_dir, "new")
+        config = os.path.join(self.output_dir, "config.ini")
+        with open(config, "w") as f:
+            f.write("[variables]\n")
+            for name in ["only_global", "only_file", "overriden_by_file"]:
+                f.write("%s = 1\n" % name)
+            for name in ["only_global_2", "only_file_2", "overriden_by_file_2"]:
+                f.write("%s = 22\n" % name)
+        with mock.patch("sys.stdout", StringIO()) as stdout:
+            self.call_FUT(
+                "--dry-run-content", "-n", "-c", config, "-O", target_dir, template_dir
+            )
+        plan = json.loads(stdout.getvalue())
+        self.assertEqual(
+            plan["operations"],
+            [
+                dict(
+                    action="render",
+                    source="vars.bob",
+                    target=os.path.join(target_dir, "vars"),
+                    size=15,
+                    exists=False,
+                )
+            ],
+        )
+        self.assertFalse(os.path.exists(target_dir))
+
+    def test_batch(self):
+        import json
+
+        template_dir = os.path.join(
+            os.path.dirname(__file__), "templates", "multiconfig"
+        )
+        batch = os.path.join(self.output_dir, "batch.jsonl")
+        with open(batch, "w") as f:
+            for name in ["one", "two"]:
+                target = os.path.join(self.output_dir, name)
+                variables = dict(only_global="g", only_file=name, overriden_by_file="o")
+                f.write(json.dumps(dict(target=target, variables=variables)))
+                f.write("\n\n")
+        self.call_FUT("-q", "--batch", batch, template_dir)
+        for name in ["one", "two"]:
+            with open(os.path.join(self.output_dir, name, "vars")) as f:
+                self.assertEqual(f.read().splitlines()[1], name)
+
+    def test_batch_invalid(self):
+        template_dir = os.path.join(
+            os.path.dirname(__file__), "templates", "multiconfig"
+        )
+        batch = os.path.join(self.output_dir, "batch.jsonl")
+        with open(batch, "w") as f:
+            f.write('{"variables": {}}\n')
+        self.assertRaises(SystemExit, self.call_FUT, "--batch", batch, template_dir)
+        self.assertRaises(
+            SystemExit, self.call_FUT, "--batch", batch + ".missing", template_dir
+        )
+
+    def test_update(self):
+        template_dir = os.path.join(
+            os.path.dirname(__file__), "templates", "multiconfig"
+        )
+        config = os.path.join(self.output_dir, "config.ini")
+        target_dir = os.path.join(self.output_dir, "new")
+
+        def render(value, *args):
+            with open(config, "w") as f:
+                f.write("[variables]\n")
+                for name in ["only_global", "only_file", "overriden_by_file"]:
+                    f.write("%s = %s\n" % (name, value))
+                for name in ["only_global_2", "only_file_2", "overriden_by_file_2"]:
+                    f.write("%s = 22\n" % name)
+            self.call_FUT("-q", "-n", "-c", config, "-O", target_dir, *args)
+
+        render("1", "-w", template_dir)
+        render("2", "--update", template_dir)
+        with open(os.path.join(target_dir, "vars")) as f:
+            self.assertEqual(f.read().splitlines()[:3], ["2", "2", "2"])
+        with open(os.path.join(target_dir, ".mrbob.ini")) as f:
+            self.assertTrue("only_file = 2" in f.read())
+
+    def test_update_without_answers(self):
+        template_dir = os.path.join(os.path.dirname(__file__), "templates", "empty")
+        self.assertRaises(
+            SystemExit, self.call_FUT, "-u", "-O", self.output_dir, template_dir
+        )
+
     def test_list_questions(self):
         template_dir = os.path.join(os.path.dirname(__file__), "templates", "empty")
         self.call_FUT("--list-questions", template_dir)
@@ -106,10 +207,73 @@ overriden_by_file_2 = file2
         template_dir = os.path.join(
             os.path.dirname(__file__), "templates", "multiconfig"
         )
-        self.call_FUT("-v", "-n", "-O", self.output_dir, "-c", tempconfig, template_dir)
+        from six import StringIO
+
+        with mock.patch("sys.stdout", StringIO()) as stdout:
+            self.call_FUT(
+                "-v", "-n", "-O", self.output_dir, "-c", tempconfig, template_dir
+            )
         with open(os.path.join(self.output_dir, "vars")) as f:
             output = f.read()
             self.assertEqual(output, "glob\nfile\nfile1\nglob2\nfile1\nfile2\n")
+        lines = stdout.getvalue().splitlines()
+        self.assertTrue("only_global = glob (from ~/.mrbob)" in lines)
+        self.assertTrue("overriden_by_file = file1 (from --config file)" in lines)
+        self.assertTrue("verbose = True (from command line interface)" in lines)
 
         # cleanup
         os.remove(tempconfig)
+
+
+class ImportTimeTest(unittest.TestCase):
+    """``mrbob`` is often started as a subprocess, so importing
+    :mod:`mrbob.cli` must stay cheap. Modules only needed to download,
+    render or ask questions are imported where they are used.
+    """
+
+    heavy_modules = [
+        "concurrent.futures",
+        "importlib.metadata",
+        "jinja2",
+        "readline",
+        "tarfile",
+        "urllib.request",
+        "zipfile",
+    ]
+    # microseconds, generous to leave room for slow machines
+    budget = 250000
+
+    def import_times(self, module):
+        import subprocess
+        import sys
+
+        import mrbob
+
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.path.dirname(os.path.dirname(mrbob.__file__))
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import %s" % module],
+            env=env,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            check=True,
+        )
+        times = {}
+        for line in process.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+        return times
+
+    def test_no_heavy_modules(self):
+        times = self.import_times("mrbob.cli")
+        self.assertEqual([m for m in self.heavy_modules if m in times], [])
+
+    def test_budget(self):
+        times = self.import_times("mrbob.cli")
+        self.assertTrue(
+            times["mrbob.cli"] < self.budget,
+            "importing mrbob.cli took %sus" % times["mrbob.cli"],
+        )
@@ -124,25 +124,61 @@ class parse_templateTest(unittest.TestCase):
 
         self.assertRaises(ConfigurationError, self.call_FUT, "foo_bar")
 
-    @mock.patch("mrbob.configurator.urlretrieve")
+    def listdir(self, path):
+        from ..sources import open_source
+
+        return set(next(open_source(path).walk())[2])
+
+    @mock.patch("mrbob.downloading.urlretrieve")
     def test_zipfile(self, mock_urlretrieve):
         mock_urlretrieve.side_effect = self.fake_zip
         abs_path = self.call_FUT("http://foobar.com/bla.zip")
-        self.assertEqual(set(os.listdir(abs_path[0])), set(["test", ".mrbob.ini"]))
+        self.addCleanup(shutil.rmtree, os.path.dirname(abs_path[0]))
+        self.assertTrue(abs_path[1])
+        self.assertEqual(self.listdir(abs_path[0]), set(["test", ".mrbob.ini"]))
 
-    @mock.patch("mrbob.configurator.urlretrieve")
+    @mock.patch("mrbob.downloading.urlretrieve")
     def test_zipfile_base_path(self, mock_urlretrieve):
         mock_urlretrieve.side_effect = self.fake_zip_base_path
         abs_path = self.call_FUT("http://foobar.com/bla.zip#some/dir")
-        self.assertEqual(set(os.listdir(abs_path[0])), set(["test", ".mrbob.ini"]))
-
-    @mock.patch("mrbob.configurator.urlretrieve")
+        self.addCleanup(shutil.rmtree, os.path.dirname(abs_path[0].split(".zip")[0]))
+        self.assertTrue(abs_path[0].endswith(os.path.join(".zip", "some", "dir")))
+        self.assertEqual(self.listdir(abs_path[0]), set(["test", ".mrbob.ini"]))
+
+    def test_local_zipfile(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        fs_zip = os.path.join(tmpdir, "template.zip")
+        self.fake_zip_base_path(None, fs_zip)
+        abs_path = self.call_FUT(os.path.join(fs_zip, "some", "dir"))
+        self.assertEqual(abs_path, (os.path.join(fs_zip, "some", "dir"), False))
+        self.assertEqual(self.listdir(abs_path[0]), set(["test", ".mrbob.ini"]))
+
+    def test_local_tarfile(self):
+        import tarfile
+
+        from ..configurator import temporary_root
+
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        os.makedirs(os.path.join(tmpdir, "some", "dir"))
+        with open(os.path.join(tmpdir, "some", "dir", "test"), "w") as f:
+            f.write("test")
+        fs_tar = os.path.join(tmpdir, "template.tar.xz")
+        with tarfile.open(fs_tar, "w:xz") as tar:
+            tar.add(os.path.join(tmpdir, "some"), "some")
+        path, is_tempdir = self.call_FUT(os.path.join(fs_tar, "some", "dir"))
+        self.addCleanup(shutil.rmtree, temporary_root(path))
+        self.assertTrue(is_tempdir)
+        self.assertEqual(os.listdir(path), ["test"])
+
+    @mock.patch("mrbob.downloading.urlretrieve")
     def test_zipfile_not_zipfile(self, mock_urlretrieve):
         from ..bobexceptions import ConfigurationError
 
         mock_urlretrieve.side_effect = self.fake_wrong_zip
         self.assertRaises(
-            ConfigurationError, self.call_FUT, "http://foobar.com/bla.tar#some/dir"
+            ConfigurationError, self.call_FUT, "http://foobar.com/bla.rar#some/dir"
         )
 
     def fake_wrong_zip(self, url, path):
@@ -193,6 +229,76 @@ class ConfiguratorTest(unittest.TestCase):
             {},
         )
 
+    def test_update_converts_answers(self):
+        fs_template = os.path.join(self.target_dir, "template")
+        fs_target = os.path.join(self.target_dir, "out")
+        os.mkdir(fs_template)
+        with open(os.path.join(fs_template, ".mrbob.ini"), "w") as f:
+            f.write(
+                "[questions]\n"
+                "flag.question = Flag?\n"
+                "flag.default = no\n"
+                "flag.post_ask_question = mrbob.hooks:to_boolean\n"
+                "count.question = Count?\n"
+                "count.default = 3\n"
+                "count.post_ask_question = mrbob.hooks:to_integer\n"
+                "desc.question = Description?\n"
+            )
+        with open(os.path.join(fs_template, "out.bob"), "w") as f:
+            f.write("{{% if flag %}}FLAG{{% endif %}} {{{count + 1}}} {{{desc}}}\n")
+
+        def run(desc, update=False):
+            c = self.call_FUT(
+                fs_template,
+                fs_target,
+                {"non_interactive": "True", "remember_answers": "True"},
+                {"desc": desc},
+            )
+            if update:
+                c.load_answers()
+                c.ask_questions()
+                c.update()
+            else:
+                c.ask_questions()
+                c.render()
+            with open(os.path.join(fs_target, "out")) as f:
+                return c, f.read()
+
+        self.assertEqual(run("one")[1], " 4 one\n")
+        c, content = run("two", update=True)
+        self.assertEqual(content, " 4 two\n")
+        self.assertEqual(c.previous_variables["flag"], False)
+        self.assertEqual(c.render_stats["written"], 1)
+
+    def test_load_answers_invalid(self):
+        from ..configurator import Question
+
+        c = self.call_FUT("mrbob.tests:templates/questions1", self.target_dir, {})
+        with open(os.path.join(self.target_dir, ".mrbob.ini"), "w") as f:
+            f.write("[variables]\nfoo = maybe\nfoo.bar.car.dar = True\n")
+        c.questions = [
+            Question("foo", "Foo?", post_ask_question="mrbob.hooks:to_boolean"),
+            Question("foo.bar.car.dar", "Dar?"),
+        ]
+        c.load_answers()
+        self.assertEqual(
+            c.previous_variables, {"foo": "maybe", "foo.bar.car.dar": True}
+        )
+        self.assertFalse("foo" in c.variables)
+        self.assertEqual(c.variables["foo.bar.car.dar"], True)
+
+    def test_given_configs_not_changed(self):
+        bobconfig = {"verbose": "True"}
+        variables = {"foo": "bar"}
+        c = self.call_FUT(
+            "mrbob.tests:templates/questions1", self.target_dir, bobconfig, variables
+        )
+        c.variables["foo.bar.car.dar"] = "answer"
+        self.assertEqual(bobconfig, {"verbose": "True"})
+        self.assertEqual(variables, {"foo": "bar"})
+        self.assertEqual(c.bobconfig.source("verbose"), "given")
+        self.assertEqual(c.variables["foo"], "bar")
+
     def test_parse_questions_basic(self):
         c = self.call_FUT("mrbob.tests:templates/questions1", self.target_dir, {})
         self.assertEqual(len(c.questions), 2)
@@ -221,6 +327,52 @@ class ConfiguratorTest(unittest.TestCase):
         self.assertEqual(c.questions[0].help, six.u("Blabla blabal balasd a a sd"))
         self.assertEqual(c.questions[0].command_prompt, dummy_prompt)
 
+    def make_tar(self, tmpdir):
+        import tarfile
+
+        fs_template = os.path.join(tmpdir, "template")
+        os.mkdir(fs_template)
+        with open(os.path.join(fs_template, ".mrbob.ini"), "w") as f:
+            f.write("[mr.bob]\ncopy_mode = symlink\n")
+        with open(os.path.join(fs_template, "static.txt"), "w") as f:
+            f.write("static")
+        fs_tar = os.path.join(tmpdir, "template.tar.gz")
+        with tarfile.open(fs_tar, "w:gz") as tar:
+            tar.add(fs_template, "template")
+        return fs_tar, fs_template
+
+    def test_symlink_extracted_tar(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        fs_tar, fs_template = self.make_tar(tmpdir)
+        c = self.call_FUT(os.path.join(fs_tar, "template"), self.target_dir)
+        self.addCleanup(shutil.rmtree, c.tempdir)
+        self.assertTrue(c.is_extracted)
+        self.assertEqual(c.copy_mode, "copy")
+        c.render()
+        fs_static = os.path.join(self.target_dir, "static.txt")
+        self.assertFalse(os.path.islink(fs_static))
+        # a plain directory is still linked to
+        c = self.call_FUT(fs_template, self.target_dir)
+        self.assertFalse(c.is_extracted)
+        self.assertEqual(c.copy_mode, "symlink")
+
+    @mock.patch("mrbob.downloading.cached_untar")
+    def test_symlink_cached_tar(self, mock_cached_untar):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        fs_tar, fs_template = self.make_tar(tmpdir)
+        mock_cached_untar.return_value = fs_template
+        fs_cache = os.path.join(tmpdir, "cache")
+        os.makedirs(os.path.join(fs_cache, "templates"))
+        c = self.call_FUT(
+            "http://example.com/template.tar.gz",
+            self.target_dir,
+            {"cache_dir": fs_cache},
+        )
+        self.assertFalse(c.is_tempdir)
+        self.assertEqual(c.copy_mode, "copy")
+
     def test_ask_questions_empty(self):
         args = ["mrbob.tests:templates/questions1", self.target_dir, {}]
         c = self.call_FUT(*args)
@@ -253,7 +405,7 @@ class ConfiguratorTest(unittest.TestCase):
         c.ask_questions()
         self.assertEqual(c.variables, {"foo.bar": "answer", "moo": "moo."})
 
-    @mock.patch("mrbob.configurator.render_structure")
+    @mock.patch("mrbob.rendering.render_structure")
     def test_remember_answers(self, mock_render_structure):
         args = [
             "mrbob.tests:templates/questions1",
@@ -266,7 +418,7 @@ class ConfiguratorTest(unittest.TestCase):
         with open(os.path.join(self.target_dir, ".mrbob.ini")) as f:
             self.assertEqual(f.read().strip(), """[variables]\nfoo.bar = 3""".strip())
 
-    @mock.patch("mrbob.configurator.render_structure")
+    @mock.patch("mrbob.rendering.render_structure")
     def test_remember_answers_default(self, mock_render_structure):
         c = self.call_FUT(
             "mrbob.tests:templates/questions1",
@@ -297,6 +449,211 @@ class ConfiguratorTest(unittest.TestCase):
         c.render()
         self.assertEqual(mocked_render_hook.mock_calls, [mock.call(c), mock.call(c)])
 
+    def test_hooks_resolved_lazily(self):
+        from ..bobexceptions import ConfigurationError
+
+        template_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, template_dir)
+        with open(os.path.join(template_dir, ".mrbob.ini"), "w") as f:
+            f.write(
+                "[template]\n"
+                "pre_render = mrbob.tests.nosuchmodule:hook\n"
+                "renderer = mrbob.rendering:nosuchrenderer\n"
+                "[questions]\n"
+                "foo.question = Foo\n"
+                "foo.post_ask_question = mrbob.tests.nosuchmodule:hook\n"
+            )
+        c = self.call_FUT(template_dir, self.target_dir, {})
+        self.assertEqual(c.post_render, [])
+        self.assertRaises(ImportError, c.validate_hooks)
+        c.pre_render = [dummy_render_hook]
+        self.assertRaises(ConfigurationError, c.validate_hooks)
+        c.renderer = dummy_renderer
+        self.assertRaises(ImportError, c.validate_hooks)
+        c.questions[0].post_ask_question = []
+        c.validate_hooks()
+
+    def test_hooks_resolved_once(self):
+        from .. import configurator
+
+        c = self.call_FUT("mrbob.tests:templates/render_hooks", self.target_dir, {})
+        c.validate_hooks()
+        c2 = self.call_FUT("mrbob.tests:templates/render_hooks", self.target_dir, {})
+        with mock.patch("mrbob.configurator.import_module") as import_module:
+            self.assertEqual(c2.pre_render, c.pre_render)
+        self.assertFalse(import_module.called)
+        self.assertTrue(
+            "mrbob.tests.test_configurator:dummy_render_hook"
+            in configurator.resolved_funcs
+        )
+
+    @mock.patch("mrbob.rendering.render_structure")
+    def test_jobs(self, mock_render_structure):
+        c = self.call_FUT(
+            "mrbob.tests:templates/empty",
+            self.target_dir,
+            {"jobs": "4", "executor": "process"},
+        )
+        c.render()
+        self.assertEqual(mock_render_structure.call_args[1]["jobs"], 4)
+        self.assertEqual(mock_render_structure.call_args[1]["executor"], "process")
+
+    @mock.patch("mrbob.rendering.render_structure")
+    def test_stream_output(self, mock_render_structure):
+        c = self.call_FUT(
+            "mrbob.tests:templates/empty",
+            self.target_dir,
+            {"stream_output": "True"},
+        )
+        c.render()
+        self.assertEqual(mock_render_structure.call_args[1]["stream"], True)
+
+    def test_copy_mode_invalid(self):
+        from ..bobexceptions import ConfigurationError
+
+        self.assertRaises(
+            ConfigurationError,
+            self.call_FUT,
+            "mrbob.tests:templates/empty",
+            self.target_dir,
+            {"copy_mode": "teleport"},
+        )
+
+    @mock.patch("mrbob.rendering.render_structure")
+    def test_copy_mode(self, mock_render_structure):
+        c = self.call_FUT(
+            "mrbob.tests:templates/empty",
+            self.target_dir,
+            {"copy_mode": "hardlink"},
+        )
+        c.render()
+        self.assertEqual(mock_render_structure.call_args[1]["copy_mode"], "hardlink")
+
+    def test_skip_unchanged(self):
+        variables = dict(
+            only_global="1",
+            only_file="2",
+            overriden_by_file="3",
+            only_global_2="4",
+            only_file_2="5",
+            overriden_by_file_2="6",
+        )
+        c = self.call_FUT(
+            "mrbob.tests:templates/multiconfig",
+            self.target_dir,
+            {"skip_unchanged": "True"},
+            variables=variables,
+        )
+        c.render()
+        self.assertEqual(c.render_stats, {"created": 1})
+        c.render()
+        self.assertEqual(c.render_stats, {"unchanged": 1})
+
+    def test_plan(self):
+        target_dir = os.path.join(self.target_dir, "new")
+        c = self.call_FUT(
+            "mrbob.tests:templates/render_hooks",
+            target_dir,
+            {},
+        )
+        mocked_render_hook.reset_mock()
+        self.assertEqual(c.plan(), dict(operations=[], collisions=[]))
+        self.assertFalse(mocked_render_hook.called)
+        self.assertFalse(os.path.exists(target_dir))
+
+    def test_render_many(self):
+        c = self.call_FUT(
+            "mrbob.tests:templates/multiconfig",
+            self.target_dir,
+            variables=dict(only_global="g", only_file="f", overriden_by_file="o"),
+        )
+        targets = [
+            (
+                os.path.join(self.target_dir, str(i)),
+                dict(only_global_2=str(i), only_file_2="x"),
+            )
+            for i in range(4)
+        ]
+        rendered = c.render_many(targets, jobs=2)
+        self.assertEqual(
+            [r.target_directory for r in rendered], [t[0] for t in targets]
+        )
+        for i in range(4):
+            with open(os.path.join(self.target_dir, str(i), "vars")) as f:
+                self.assertEqual(f.read(), "g\nf\no\n%s\nx\n" % i)
+        self.assertEqual(
+            c.variables, dict(only_global="g", only_file="f", overriden_by_file="o")
+        )
+
+    def test_render_many_target_inside_template(self):
+        from ..bobexceptions import ConfigurationError
+
+        c = self.call_FUT("mrbob.tests:templates/questions1", self.target_dir, {})
+        self.assertRaises(
+            ConfigurationError,
+            c.render_many,
+            [(os.path.join(c.template_dir, "foo"), {})],
+        )
+
+    def test_jobs_invalid(self):
+        from ..bobexceptions import ConfigurationError
+
+        self.assertRaises(
+            ConfigurationError,
+            self.call_FUT,
+            "mrbob.tests:templates/empty",
+            self.target_dir,
+            {"jobs": "many"},
+        )
+        self.assertRaises(
+            ConfigurationError,
+            self.call_FUT,
+            "mrbob.tests:templates/empty",
+            self.target_dir,
+            {"jobs": "-1"},
+        )
+
+    def test_executor_invalid(self):
+        from ..bobexceptions import ConfigurationError
+
+        self.assertRaises(
+            ConfigurationError,
+            self.call_FUT,
+            "mrbob.tests:templates/empty",
+            self.target_dir,
+            {"executor": "fork"},
+        )
+
+    def test_cache_dir(self):
+        from ..rendering import (
+            compiled_templates,
+            configure_bytecode_cache,
+            render_plans,
+        )
+
+        compiled_templates.clear()
+        render_plans.clear()
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.addCleanup(configure_bytecode_cache, None)
+        c = self.call_FUT(
+            "mrbob.tests:templates/multiconfig",
+            self.target_dir,
+            {"cache_dir": cache_dir, "cache_max_size": "1M"},
+            variables=dict(
+                only_global="1",
+                only_file="2",
+                overriden_by_file="3",
+                only_global_2="4",
+                only_file_2="5",
+                overriden_by_file_2="6",
+            ),
+        )
+        self.assertEqual(c.cache_max_size, 1024 * 1024)
+        c.render()
+        self.assertEqual(len(os.listdir(os.path.join(cache_dir, "bytecode"))), 1)
+        self.assertEqual(len(os.listdir(os.path.join(cache_dir, "plans"))), 1)
+
     def test_ignored_files(self):
         c = self.call_FUT("mrbob.tests:templates/ignored", self.target_dir, {})
         self.assertEqual(len(c.ignored_files), 2)
@@ -310,6 +667,109 @@ class ConfiguratorTest(unittest.TestCase):
         self.assertTrue("*_stuff" in c.ignored_directories)
 
 
+class prefetch_questionsTest(unittest.TestCase):
+    def setUp(self):
+        from ..configurator import Configurator
+
+        self.target_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.target_dir)
+        self.configurator = Configurator(
+            "mrbob.tests:templates/questions1",
+            self.target_dir,
+            {"non_interactive": "True"},
+        )
+        self.calls = []
+
+    def make_hook(self, default, barrier=None, skip=False):
+        from ..bobexceptions import SkipQuestion
+
+        def hook(configurator, question):
+            self.calls.append(question.name)
+            if barrier is not None:
+                barrier.wait(timeout=5)
+            if skip:
+                raise SkipQuestion
+            question.default = default
+
+        hook.prefetch = True
+        return hook
+
+    def make_question(self, name, *hooks, **kw):
+        from ..configurator import Question
+
+        question = Question(name, name + "?", **kw)
+        question.pre_ask_question = list(hooks)
+        return question
+
+    def test_concurrent(self):
+        import threading
+
+        # both hooks only return once they run at the same time
+        barrier = threading.Barrier(2)
+        c = self.configurator
+        c.questions = [
+            self.make_question("a", self.make_hook("1", barrier)),
+            self.make_question("b", self.make_hook("2", barrier)),
+        ]
+        c.variables = {}
+        c.ask_questions()
+        self.assertEqual(c.variables, {"a": "1", "b": "2"})
+        self.assertEqual(sorted(self.calls), ["a", "b"])
+
+    def test_answered_not_prefetched(self):
+        c = self.configurator
+        c.questions = [self.make_question("a", self.make_hook("1"))]
+        c.variables = {"a": "given"}
+        c.ask_questions()
+        self.assertEqual(self.calls, [])
+
+    def test_skip_question(self):
+        c = self.configurator
+        c.questions = [self.make_question("a", self.make_hook("1", skip=True))]
+        c.variables = {}
+        c.ask_questions()
+        self.assertEqual(c.variables, {"a": None})
+
+    def test_hook_overrides_defaults(self):
+        c = self.configurator
+        c.defaults = {"a": "default", "b": "default"}
+        c.questions = [
+            self.make_question("a", self.make_hook("hooked")),
+            self.make_question("b"),
+        ]
+        c.variables = {}
+        c.ask_questions()
+        self.assertEqual(c.variables, {"a": "hooked", "b": "default"})
+
+    def test_reasked_once(self):
+        from ..bobexceptions import ValidationError
+        from ..configurator import Question
+
+        answers = ["wrong", "right"]
+
+        def validate(configurator, question, answer):
+            if answer == "wrong":
+                raise ValidationError("wrong")
+            return answer
+
+        q = Question("a", "a?", command_prompt=lambda x: answers.pop(0))
+        q.pre_ask_question = [self.make_hook("1")]
+        q.post_ask_question = [validate]
+        c = DummyConfigurator()
+        with mock.patch("sys.stdout"):
+            self.assertEqual(q.ask(c, q.prefetch(c, ImmediateExecutor())), "right")
+        self.assertEqual(self.calls, ["a"])
+
+
+class ImmediateExecutor(object):
+    def submit(self, func, *args):
+        from concurrent.futures import Future
+
+        future = Future()
+        future.set_result(func(*args))
+        return future
+
+
 class QuestionTest(unittest.TestCase):
     def call_FUT(self, *args, **kw):
         from ..configurator import Question
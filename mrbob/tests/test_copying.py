@@ -0,0 +1,123 @@
+import errno
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+
+class copy_fileTest(unittest.TestCase):
+    def setUp(self):
+        self.fs_tempdir = tempfile.mkdtemp()
+        self.fs_source = os.path.join(self.fs_tempdir, "source.bin")
+        self.fs_target = os.path.join(self.fs_tempdir, "target.bin")
+        with open(self.fs_source, "wb") as f:
+            f.write(b"\x00binary" * 1000)
+        os.chmod(self.fs_source, 0o640)
+        os.utime(self.fs_source, (1000000000, 1000000000))
+
+    def tearDown(self):
+        shutil.rmtree(self.fs_tempdir)
+
+    def call_FUT(self, mode="copy"):
+        from ..copying import copy_file
+
+        return copy_file(self.fs_source, self.fs_target, mode)
+
+    def assertCopied(self):
+        with open(self.fs_source, "rb") as f1, open(self.fs_target, "rb") as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    def test_copy(self):
+        method = self.call_FUT()
+        self.assertTrue(method in ("reflink", "copy_file_range", "sendfile", "copy"))
+        self.assertCopied()
+        st = os.stat(self.fs_target)
+        self.assertEqual(stat.S_IMODE(st.st_mode), 0o640)
+        self.assertEqual(st.st_mtime, 1000000000)
+        self.assertFalse(os.path.samefile(self.fs_source, self.fs_target))
+
+    @mock.patch("mrbob.copying.reflink", return_value=False)
+    def test_copy_file_range_unsupported(self, mock_reflink):
+        def unsupported(*args):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+        with mock.patch("os.copy_file_range", unsupported, create=True):
+            self.assertEqual(self.call_FUT(), "sendfile")
+        self.assertCopied()
+
+    def test_hardlink(self):
+        self.assertEqual(self.call_FUT("hardlink"), "hardlink")
+        self.assertTrue(os.path.samefile(self.fs_source, self.fs_target))
+
+    @mock.patch("mrbob.copying.os.link")
+    def test_hardlink_other_filesystem(self, mock_link):
+        mock_link.side_effect = OSError(errno.EXDEV, "Invalid cross-device link")
+        self.assertNotEqual(self.call_FUT("hardlink"), "hardlink")
+        self.assertCopied()
+
+    def test_symlink(self):
+        self.assertEqual(self.call_FUT("symlink"), "symlink")
+        self.assertEqual(os.readlink(self.fs_target), self.fs_source)
+
+    def test_copy_over_link_keeps_source(self):
+        self.call_FUT("hardlink")
+        with open(self.fs_source + ".new", "wb") as f:
+            f.write(b"new")
+        from ..copying import copy_file
+
+        copy_file(self.fs_source + ".new", self.fs_target)
+        with open(self.fs_source, "rb") as f:
+            self.assertTrue(f.read().startswith(b"\x00binary"))
+        with open(self.fs_target, "rb") as f:
+            self.assertEqual(f.read(), b"new")
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, self.call_FUT, "teleport")
+
+
+class is_copiedTest(unittest.TestCase):
+    def setUp(self):
+        self.fs_tempdir = tempfile.mkdtemp()
+        self.fs_source = os.path.join(self.fs_tempdir, "source")
+        self.fs_target = os.path.join(self.fs_tempdir, "target")
+        with open(self.fs_source, "wb") as f:
+            f.write(b"source")
+
+    def tearDown(self):
+        shutil.rmtree(self.fs_tempdir)
+
+    def call_FUT(self, mode="copy"):
+        from ..copying import is_copied
+
+        return is_copied(self.fs_source, self.fs_target, mode)
+
+    def write_target(self, data):
+        with open(self.fs_target, "wb") as f:
+            f.write(data)
+
+    def test_missing(self):
+        self.assertFalse(self.call_FUT())
+
+    def test_same(self):
+        self.write_target(b"source")
+        self.assertTrue(self.call_FUT())
+
+    def test_different_size(self):
+        self.write_target(b"sourcecode")
+        self.assertFalse(self.call_FUT())
+
+    def test_different_content(self):
+        self.write_target(b"SOURCE")
+        self.assertFalse(self.call_FUT())
+
+    def test_links(self):
+        from ..copying import copy_file
+
+        copy_file(self.fs_source, self.fs_target, "symlink")
+        self.assertTrue(self.call_FUT("symlink"))
+        self.assertFalse(self.call_FUT("copy"))
+        copy_file(self.fs_source, self.fs_target, "hardlink")
+        self.assertTrue(self.call_FUT("hardlink"))
+        self.assertFalse(self.call_FUT("copy"))
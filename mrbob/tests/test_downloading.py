@@ -0,0 +1,412 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class ConfigHandler(BaseHTTPRequestHandler):
+    body = b"[variables]\nfoo = bar\n"
+    etag = '"v1"'
+    last_modified = "Sat, 01 Jan 2000 00:00:00 GMT"
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Last-Modified", self.last_modified)
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_zip(files):
+    import io
+    import zipfile
+
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+    return data.getvalue()
+
+
+class TemplateHandler(ConfigHandler):
+    body = make_zip({"some/dir/.mrbob.ini": "[questions]\n", "some/dir/test": "test"})
+
+
+def make_tar(files, mode="w:gz"):
+    import io
+    import tarfile
+
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode=mode) as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(content))
+    return data.getvalue()
+
+
+class TarHandler(ConfigHandler):
+    body = make_tar({"some/dir/.mrbob.ini": b"[questions]\n", "some/dir/test": b"test"})
+
+
+class SlowTarHandler(ConfigHandler):
+    """Sends the first half of the archive and waits for its first member
+    to be extracted before sending the rest.
+    """
+
+    second = os.urandom(256 * 1024)
+    body = make_tar({"first": b"first", "second": second})
+
+    def do_GET(self):
+        import time
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        half = len(self.body) // 2
+        self.wfile.write(self.body[:half])
+        self.wfile.flush()
+        deadline = time.time() + 5
+        fs_first = os.path.join(self.server.target, "first")
+        while not os.path.exists(fs_first) and time.time() < deadline:
+            time.sleep(0.01)
+        self.server.overlapped = os.path.exists(fs_first)
+        self.wfile.write(self.body[half:])
+
+
+class ServerTestCase(unittest.TestCase):
+    handler = ConfigHandler
+    path = "/mrbob.ini"
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), self.handler)
+        self.server.requests = []
+        thread = threading.Thread(
+            target=self.server.serve_forever, kwargs={"poll_interval": 0.01}
+        )
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = "http://127.0.0.1:%s%s" % (self.server.server_port, self.path)
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+
+class cached_downloadTest(ServerTestCase):
+    def call_FUT(self, max_age=0):
+        from ..downloading import cached_download
+
+        return cached_download(self.url, self.cache_dir, max_age)
+
+    def test_download(self):
+        fs_body = self.call_FUT()
+        with open(fs_body, "rb") as f:
+            self.assertEqual(f.read(), ConfigHandler.body)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertFalse("If-None-Match" in self.server.requests[0])
+
+    def test_revalidate(self):
+        self.call_FUT()
+        fs_body = self.call_FUT()
+        self.assertEqual(len(self.server.requests), 2)
+        headers = self.server.requests[1]
+        self.assertEqual(headers["If-None-Match"], '"v1"')
+        self.assertEqual(headers["If-Modified-Since"], ConfigHandler.last_modified)
+        with open(fs_body, "rb") as f:
+            self.assertEqual(f.read(), ConfigHandler.body)
+
+    def test_max_age(self):
+        self.call_FUT(max_age=3600)
+        self.call_FUT(max_age=3600)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_missing_body(self):
+        fs_body = self.call_FUT()
+        os.remove(fs_body)
+        self.call_FUT(max_age=3600)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertFalse("If-None-Match" in self.server.requests[1])
+        self.assertTrue(os.path.exists(fs_body))
+
+    def test_parse_config(self):
+        from ..parsing import parse_config
+
+        c = parse_config(self.url, cache_dir=self.cache_dir, max_age=3600)
+        self.assertEqual(c["variables"], {"foo": "bar"})
+        c = parse_config(self.url, cache_dir=self.cache_dir, max_age=3600)
+        self.assertEqual(c["variables"], {"foo": "bar"})
+        self.assertEqual(len(self.server.requests), 1)
+
+
+class cached_download_interruptedTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def test_no_leftovers(self):
+        import io
+        from unittest import mock
+
+        from ..downloading import cached_download
+
+        class Response(io.BytesIO):
+            def read(self, size=-1):
+                raise ConnectionResetError("reset by peer")
+
+        response = Response()
+        with mock.patch("mrbob.downloading.revalidate", return_value=response):
+            self.assertRaises(
+                ConnectionResetError,
+                cached_download,
+                "http://example.com/mrbob.ini",
+                self.cache_dir,
+            )
+        self.assertEqual(os.listdir(self.cache_dir), [])
+        self.assertTrue(response.closed)
+
+
+class cached_templateTest(ServerTestCase):
+    handler = TemplateHandler
+
+    def call_FUT(self, max_age=0, refresh=False, max_size=10 * 1024 * 1024):
+        from ..configurator import parse_template
+
+        return parse_template(
+            self.url + "#some/dir",
+            cache_dir=self.cache_dir,
+            max_age=max_age,
+            refresh=refresh,
+            max_size=max_size,
+        )
+
+    def listdir(self, path):
+        from ..sources import open_source
+
+        return set(next(open_source(path).walk())[2])
+
+    def test_download(self):
+        path, is_tempdir = self.call_FUT()
+        self.assertFalse(is_tempdir)
+        self.assertTrue(path.startswith(self.cache_dir))
+        self.assertEqual(self.listdir(path), set(["test", ".mrbob.ini"]))
+
+    def test_revalidate(self):
+        path, _ = self.call_FUT()
+        self.assertEqual(self.call_FUT(), (path, False))
+        self.assertEqual(self.server.requests[1]["If-None-Match"], '"v1"')
+
+    def test_max_age(self):
+        self.call_FUT(max_age=3600)
+        self.call_FUT(max_age=3600)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_refresh(self):
+        self.call_FUT(max_age=3600)
+        path, _ = self.call_FUT(max_age=3600, refresh=True)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertFalse("If-None-Match" in self.server.requests[1])
+        self.assertEqual(self.listdir(path), set(["test", ".mrbob.ini"]))
+
+    def test_evicts_old_templates(self):
+        fs_old = os.path.join(self.cache_dir, "old.body")
+        with open(fs_old, "wb") as f:
+            f.write(b"x" * 4096)
+        os.utime(fs_old, (0, 0))
+        path, _ = self.call_FUT(max_size=2048)
+        self.assertFalse(os.path.exists(fs_old))
+        self.assertEqual(self.listdir(path), set(["test", ".mrbob.ini"]))
+
+    def test_not_a_zip(self):
+        from ..bobexceptions import ConfigurationError
+
+        self.server.RequestHandlerClass = ConfigHandler
+        self.assertRaises(ConfigurationError, self.call_FUT)
+
+
+class cached_tarTest(ServerTestCase):
+    handler = TarHandler
+    path = "/template.tar.gz"
+
+    def call_FUT(self, max_age=0, refresh=False, cache_dir=True):
+        from ..configurator import parse_template
+
+        return parse_template(
+            self.url + "#some/dir",
+            cache_dir=self.cache_dir if cache_dir else None,
+            max_age=max_age,
+            refresh=refresh,
+        )
+
+    def test_temporary(self):
+        from ..configurator import temporary_root
+
+        path, is_tempdir = self.call_FUT(cache_dir=False)
+        self.addCleanup(shutil.rmtree, temporary_root(path))
+        self.assertTrue(is_tempdir)
+        self.assertEqual(set(os.listdir(path)), set(["test", ".mrbob.ini"]))
+
+    def test_cached(self):
+        path, is_tempdir = self.call_FUT(max_age=3600)
+        self.assertFalse(is_tempdir)
+        self.assertTrue(path.startswith(self.cache_dir))
+        self.assertEqual(self.call_FUT(max_age=3600), (path, False))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(set(os.listdir(path)), set(["test", ".mrbob.ini"]))
+
+    def test_revalidate(self):
+        path, _ = self.call_FUT()
+        fs_test = os.path.join(path, "test")
+        os.utime(fs_test, (0, 0))
+        self.assertEqual(self.call_FUT(), (path, False))
+        self.assertEqual(self.server.requests[1]["If-None-Match"], '"v1"')
+        self.assertEqual(os.stat(fs_test).st_mtime, 0)
+
+    def test_refresh(self):
+        path, _ = self.call_FUT(max_age=3600)
+        os.remove(os.path.join(path, "test"))
+        self.call_FUT(max_age=3600, refresh=True)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(set(os.listdir(path)), set(["test", ".mrbob.ini"]))
+        self.assertEqual(
+            [name for name in os.listdir(self.cache_dir) if name.startswith("tmp")], []
+        )
+
+    def test_not_a_tar(self):
+        from ..bobexceptions import ConfigurationError
+
+        self.server.RequestHandlerClass = ConfigHandler
+        self.assertRaises(ConfigurationError, self.call_FUT)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+
+class download_tarTest(ServerTestCase):
+    handler = SlowTarHandler
+    path = "/template.tar.gz"
+
+    def test_overlaps_download(self):
+        from ..downloading import download_tar
+
+        self.server.target = self.cache_dir
+        download_tar(self.url, self.cache_dir)
+        self.assertTrue(self.server.overlapped)
+        with open(os.path.join(self.cache_dir, "second"), "rb") as f:
+            self.assertEqual(f.read(), SlowTarHandler.second)
+
+
+class extract_tarTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def call_FUT(self, data):
+        import io
+
+        from ..downloading import extract_tar
+
+        return extract_tar(io.BytesIO(data), self.directory)
+
+    def test_compressions(self):
+        for mode in ("w", "w:gz", "w:bz2", "w:xz"):
+            self.call_FUT(make_tar({mode: b"content"}, mode))
+        self.assertEqual(
+            sorted(os.listdir(self.directory)), ["w", "w:bz2", "w:gz", "w:xz"]
+        )
+
+    def test_unsafe_path(self):
+        import tarfile
+
+        from ..bobexceptions import ConfigurationError
+
+        self.assertRaises(
+            (tarfile.TarError, ConfigurationError),
+            self.call_FUT,
+            make_tar({"../escaped": b"x"}),
+        )
+        self.assertFalse(
+            os.path.exists(os.path.join(os.path.dirname(self.directory), "escaped"))
+        )
+
+    def test_not_a_tar(self):
+        from ..bobexceptions import ConfigurationError
+
+        self.assertRaises(ConfigurationError, self.call_FUT, b"boo" * 1000)
+
+
+class PrefetchReaderTest(unittest.TestCase):
+    def make_one(self, data, chunk_size=4):
+        import io
+
+        from ..downloading import PrefetchReader
+
+        reader = PrefetchReader(io.BytesIO(data), chunk_size=chunk_size)
+        self.addCleanup(reader.close)
+        return reader
+
+    def test_read_all(self):
+        self.assertEqual(self.make_one(b"0123456789").read(), b"0123456789")
+
+    def test_read_sizes(self):
+        reader = self.make_one(b"0123456789")
+        data = b""
+        while True:
+            chunk = reader.read(3)
+            self.assertTrue(len(chunk) <= 3)
+            if not chunk:
+                break
+            data += chunk
+        self.assertEqual(data, b"0123456789")
+
+    def test_error(self):
+        from unittest import mock
+
+        from ..downloading import PrefetchReader
+
+        fileobj = mock.Mock()
+        fileobj.read1.side_effect = IOError("connection reset")
+        reader = PrefetchReader(fileobj)
+        self.addCleanup(reader.close)
+        self.assertRaises(IOError, reader.read)
+
+    def test_close_stalled(self):
+        import time
+
+        from ..downloading import PrefetchReader
+
+        reading = threading.Event()
+
+        class Stalled(object):
+            """Connection whose reads block, even once it is closed."""
+
+            closed = False
+
+            def read1(self, size):
+                reading.set()
+                threading.Event().wait(10)
+                return b""
+
+            read = read1
+
+            def close(self):
+                self.closed = True
+
+        fileobj = Stalled()
+        reader = PrefetchReader(fileobj)
+        reader.join_timeout = 0.1
+        self.assertTrue(reading.wait(5))
+        start = time.time()
+        reader.close()
+        self.assertTrue(time.time() - start < 5)
+        self.assertTrue(fileobj.closed)
@@ -146,6 +146,167 @@ class validate_regexTest(TestCase):
         self.assertEqual(self.call_FUT("abc123", question=q), "abc123")
 
 
+class compiled_validatorsTest(TestCase):
+    def make_question(self, post_ask_question, **extra):
+        return Question(
+            name="dummy",
+            question="dummy",
+            post_ask_question=post_ask_question,
+            **extra,
+        )
+
+    def validate(self, question, answer):
+        for f in question.post_ask_question:
+            answer = f(DummyConfigurator(), question, answer)
+        return answer
+
+    def test_regex_compiled_once(self):
+        import re
+
+        from ..bobexceptions import ValidationError
+
+        q = self.make_question("mrbob.hooks:validate_regex", regex="^[a-z]+$")
+        with mock.patch("mrbob.hooks.re.compile", wraps=re.compile) as compile:
+            for answer in ["abc", "def", "ghi"]:
+                self.assertEqual(self.validate(q, answer), answer)
+            self.assertRaises(ValidationError, self.validate, q, "ABC")
+        self.assertEqual(compile.call_count, 1)
+
+    def test_pipeline(self):
+        from ..bobexceptions import ValidationError
+
+        q = self.make_question(
+            "mrbob.hooks:validate_choices mrbob.hooks:to_boolean", choices="yes no"
+        )
+        self.assertEqual(self.validate(q, "YES"), True)
+        self.assertEqual(self.validate(q, "no"), False)
+        self.assertRaises(ValidationError, self.validate, q, "y")
+
+    def test_choices_shared(self):
+        from ..hooks import parse_choices
+
+        parse_choices.cache_clear()
+        for _ in range(3):
+            q = self.make_question("mrbob.hooks:validate_choices", choices="a b c")
+            self.assertEqual(self.validate(q, "b"), "b")
+        self.assertEqual(parse_choices.cache_info().misses, 1)
+
+    def test_datetime(self):
+        from ..bobexceptions import ValidationError
+
+        q = self.make_question("mrbob.hooks:validate_datetime", datetime_format="%Y")
+        self.assertEqual(self.validate(q, "2014"), "2014")
+        self.assertRaises(ValidationError, self.validate, q, "14-1")
+
+    def test_copied_question(self):
+        import copy
+
+        q = self.make_question("mrbob.hooks:validate_regex", regex="^a$")
+        # questions copied by Configurator.render_many share the validators
+        q.post_ask_question
+        self.assertTrue(copy.copy(q).post_ask_question is q.post_ask_question)
+
+
+class ChoicesTest(TestCase):
+    def make_one(self, choices, case_sensitive=False):
+        from ..hooks import Choices
+
+        return Choices(choices, case_sensitive)
+
+    def test_lookup(self):
+        choices = self.make_one(["MIT", "BSD-3-Clause", "Apache-2.0"])
+        self.assertTrue("bsd-3-clause" in choices)
+        self.assertFalse("BSD" in choices)
+        self.assertFalse("mit" in self.make_one(["MIT"], case_sensitive=True))
+
+    def test_complete(self):
+        choices = self.make_one(["BSD-3-Clause", "Apache-2.0", "BSD-2-Clause", "MIT"])
+        self.assertEqual(choices.complete("bsd"), ["BSD-2-Clause", "BSD-3-Clause"])
+        self.assertEqual(choices.complete("BSD-3"), ["BSD-3-Clause"])
+        self.assertEqual(choices.complete("GPL"), [])
+        self.assertEqual(len(choices.complete("")), 4)
+        sensitive = self.make_one(["MIT", "mit-0"], case_sensitive=True)
+        self.assertEqual(sensitive.complete("m"), ["mit-0"])
+
+    def test_message(self):
+        self.assertEqual(
+            self.make_one(["a", "b", "c"]).message, "Value must be a, b or c"
+        )
+        many = self.make_one(str(i) for i in range(1000))
+        self.assertEqual(many.message, "Value must be one of 1000 choices")
+
+
+class choices_fileTest(TestCase):
+    def setUp(self):
+        import os
+        import shutil
+        import tempfile
+
+        from .. import hooks
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        with open(os.path.join(self.tmpdir, "licenses.txt"), "w") as f:
+            f.write("# SPDX identifiers\nMIT\n\n  Apache-2.0 \nBSD-3-Clause\n")
+        patcher = mock.patch.object(hooks, "loaded_choices", {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.configurator = DummyConfigurator()
+        self.configurator.template_dir = self.tmpdir
+
+    def make_question(self, **extra):
+        return Question(
+            name="license",
+            question="License",
+            post_ask_question="mrbob.hooks:validate_choices",
+            choices_file="licenses.txt",
+            **extra,
+        )
+
+    def validate(self, question, answer):
+        for f in question.post_ask_question:
+            answer = f(self.configurator, question, answer)
+        return answer
+
+    def test_validate(self):
+        from ..bobexceptions import ValidationError
+
+        q = self.make_question()
+        self.assertEqual(self.validate(q, "apache-2.0"), "apache-2.0")
+        self.assertRaises(ValidationError, self.validate, q, "# SPDX identifiers")
+        self.assertRaises(ValidationError, self.validate, q, "")
+
+    def test_loaded_once(self):
+        from ..hooks import question_choices
+
+        choices = question_choices(self.configurator, self.make_question())
+        self.assertEqual(choices.choices, ("MIT", "Apache-2.0", "BSD-3-Clause"))
+        with mock.patch("mrbob.sources.DirectorySource.read_text") as read_text:
+            self.assertEqual(self.validate(self.make_question(), "MIT"), "MIT")
+            other = question_choices(self.configurator, self.make_question())
+        self.assertFalse(read_text.called)
+        self.assertTrue(other is choices)
+
+    def test_absolute_path(self):
+        import os
+
+        q = self.make_question()
+        q.extra["choices_file"] = os.path.join(self.tmpdir, "licenses.txt")
+        del self.configurator.template_dir
+        self.assertEqual(self.validate(q, "MIT"), "MIT")
+
+    def test_completion(self):
+        import readline
+
+        def prompt(question):
+            return readline.get_completer()("apa", 0)
+
+        previous = readline.get_completer()
+        q = self.make_question(command_prompt=prompt)
+        self.assertEqual(q.ask(self.configurator), "Apache-2.0")
+        self.assertTrue(readline.get_completer() is previous)
+
+
 class set_current_datetimeTest(TestCase):
     def call_FUT(self, configurator=None, question=None):
         from ..hooks import set_current_datetime
@@ -0,0 +1,65 @@
+import unittest
+
+
+class IgnoreMatcherTest(unittest.TestCase):
+    def call_FUT(self, patterns, relpath):
+        from ..matching import IgnoreMatcher
+
+        return IgnoreMatcher(patterns)(relpath)
+
+    def test_no_patterns(self):
+        self.assertFalse(self.call_FUT([], "foo"))
+
+    def test_name_patterns(self):
+        patterns = ["*.swp", ".git", "build?", "[!a]bc"]
+        self.assertTrue(self.call_FUT(patterns, "foo.swp"))
+        self.assertTrue(self.call_FUT(patterns, "docs/.foo.swp"))
+        self.assertTrue(self.call_FUT(patterns, ".git"))
+        self.assertTrue(self.call_FUT(patterns, "build1"))
+        self.assertTrue(self.call_FUT(patterns, "sub/xbc"))
+        self.assertFalse(self.call_FUT(patterns, "abc"))
+        self.assertFalse(self.call_FUT(patterns, "foo.swp.txt"))
+        self.assertFalse(self.call_FUT(patterns, ".gitignore"))
+
+    def test_name_pattern_does_not_match_directories(self):
+        self.assertFalse(self.call_FUT(["foo*"], "foo/bar"))
+
+    def test_same_as_fnmatch(self):
+        import fnmatch
+
+        names = ["a.txt", "b.py", "[x]", "c", ".hidden", "a.txt.bob"]
+        for pattern in ["*.txt", "?", "[ab].*", "*", ".*", "[", "*.bob"]:
+            for name in names:
+                self.assertEqual(
+                    self.call_FUT([pattern], name),
+                    fnmatch.fnmatch(name, pattern),
+                    (pattern, name),
+                )
+
+    def test_path_patterns(self):
+        patterns = ["docs/**/*.png", "/build/tmp", "**/cache"]
+        self.assertTrue(self.call_FUT(patterns, "docs/a.png"))
+        self.assertTrue(self.call_FUT(patterns, "docs/img/logo/a.png"))
+        self.assertTrue(self.call_FUT(patterns, "build/tmp"))
+        self.assertTrue(self.call_FUT(patterns, "cache"))
+        self.assertTrue(self.call_FUT(patterns, "src/deep/cache"))
+        self.assertFalse(self.call_FUT(patterns, "a.png"))
+        self.assertFalse(self.call_FUT(patterns, "src/docs/a.png"))
+        self.assertFalse(self.call_FUT(patterns, "src/build/tmp"))
+
+    def test_double_star_suffix(self):
+        self.assertTrue(self.call_FUT(["vendor/**"], "vendor/a/b"))
+        self.assertFalse(self.call_FUT(["vendor/**"], "vendor"))
+
+    def test_negation(self):
+        patterns = ["*.png", "!logo.png", "docs/*.png"]
+        self.assertTrue(self.call_FUT(patterns, "a.png"))
+        self.assertFalse(self.call_FUT(patterns, "img/logo.png"))
+        self.assertTrue(self.call_FUT(patterns, "docs/logo.png"))
+
+
+class compile_patternsTest(unittest.TestCase):
+    def test_cached(self):
+        from ..matching import compile_patterns
+
+        self.assertTrue(compile_patterns(("*.txt",)) is compile_patterns(("*.txt",)))
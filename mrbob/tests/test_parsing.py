@@ -98,7 +98,7 @@ class parse_configTest(unittest.TestCase):
         c = self.call_FUT("question_order.ini")
         self.assertEqual(c["questions_order"], ["foo"])
 
-    @mock.patch("mrbob.parsing.urlretrieve")
+    @mock.patch("mrbob.downloading.urlretrieve")
     def test_parse_remote_config(self, urlretrieve):
 
         def write(url, filename):
@@ -112,6 +112,89 @@ class parse_configTest(unittest.TestCase):
         self.assertEqual(c["variables"]["foo"], "bar")
 
 
+class parse_config_cacheTest(unittest.TestCase):
+    def setUp(self):
+        import shutil
+
+        from ..parsing import parsed_configs
+
+        parsed_configs.clear()
+        self.addCleanup(parsed_configs.clear)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.fs_config = os.path.join(self.tmpdir, "bob.ini")
+        self.write("[variables]\nfoo = bar\n")
+
+    def write(self, content, mtime=1000000000):
+        with open(self.fs_config, "w") as f:
+            f.write(content)
+        os.utime(self.fs_config, (mtime, mtime))
+
+    def call_FUT(self, **kw):
+        from ..parsing import parse_config
+
+        return parse_config(self.fs_config, **kw)
+
+    def test_memory_cache(self):
+        self.call_FUT()
+        with mock.patch("mrbob.parsing.read_config") as read_config:
+            c = self.call_FUT()
+        self.assertFalse(read_config.called)
+        self.assertEqual(c["variables"], {"foo": "bar"})
+
+    def test_returns_copy(self):
+        c = self.call_FUT()
+        c["variables"]["foo"] = "changed"
+        self.assertEqual(self.call_FUT()["variables"], {"foo": "bar"})
+
+    def test_changed_file(self):
+        self.call_FUT()
+        self.write("[variables]\nfoo = baz\n", mtime=1000000001)
+        self.assertEqual(self.call_FUT()["variables"], {"foo": "baz"})
+
+    def test_disk_cache(self):
+        from ..parsing import parsed_configs
+
+        cache_dir = os.path.join(self.tmpdir, "cache")
+        self.call_FUT(cache_dir=cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        parsed_configs.clear()
+        with mock.patch("mrbob.parsing.read_config") as read_config:
+            c = self.call_FUT(cache_dir=cache_dir)
+        self.assertFalse(read_config.called)
+        self.assertEqual(c["variables"], {"foo": "bar"})
+
+    def test_disk_cache_stale(self):
+        from ..parsing import parsed_configs
+
+        cache_dir = os.path.join(self.tmpdir, "cache")
+        self.call_FUT(cache_dir=cache_dir)
+        parsed_configs.clear()
+        self.write("[variables]\nfoo = baz\n", mtime=1000000001)
+        c = self.call_FUT(cache_dir=cache_dir)
+        self.assertEqual(c["variables"], {"foo": "baz"})
+
+    def test_disk_cache_unusable(self):
+        from ..parsing import parsed_configs
+
+        cache_dir = os.path.join(self.tmpdir, "cache")
+        self.call_FUT(cache_dir=cache_dir)
+        (name,) = os.listdir(cache_dir)
+        with open(os.path.join(cache_dir, name), "wb") as f:
+            f.write(b"cmrbob.parsing\nno_such_name\n.")
+        parsed_configs.clear()
+        c = self.call_FUT(cache_dir=cache_dir)
+        self.assertEqual(c["variables"], {"foo": "bar"})
+
+    def test_missing_file(self):
+        from ..bobexceptions import ConfigurationError
+        from ..parsing import parse_config
+
+        self.assertRaises(
+            ConfigurationError, parse_config, os.path.join(self.tmpdir, "nope.ini")
+        )
+
+
 class update_configTest(unittest.TestCase):
     def call_FUT(self, config, newconfig):
         from ..parsing import update_config
@@ -256,3 +339,61 @@ class nest_variablesTest(unittest.TestCase):
 
         d = OrderedDict([("foo", "2"), ("foo.bar", "1")])
         self.assertRaises(ConfigurationError, self.call_FUT, d)
+
+
+class LayeredConfigTest(unittest.TestCase):
+    def make_one(self):
+        from ..parsing import LayeredConfig
+
+        return LayeredConfig(
+            [
+                ("global", {"foo": "bar", "nested": {"a": "1", "b": "2"}}),
+                ("file", {"foo1": "mar", "nested": {"b": "3"}}),
+                ("cli", {"foo1": "moo"}),
+            ]
+        )
+
+    def test_lookup(self):
+        config = self.make_one()
+        self.assertEqual(config["foo"], "bar")
+        self.assertEqual(config["foo1"], "moo")
+        self.assertEqual(config.get("missing"), None)
+        self.assertRaises(KeyError, lambda: config["missing"])
+        self.assertEqual(sorted(config), ["foo", "foo1", "nested"])
+        self.assertEqual(len(config), 3)
+
+    def test_nested(self):
+        config = self.make_one()
+        self.assertEqual(dict(config["nested"]), {"a": "1", "b": "3"})
+        self.assertEqual(config["nested"].source("a"), "global")
+        self.assertEqual(config["nested"].source("b"), "file")
+
+    def test_source(self):
+        config = self.make_one()
+        self.assertEqual(config.source("foo"), "global")
+        self.assertEqual(config.source("foo1"), "cli")
+
+    def test_read_only(self):
+        config = self.make_one()
+        child = config.new_child({"foo": "baz"}, "template")
+        self.assertEqual(child["foo"], "baz")
+        self.assertEqual(config["foo"], "bar")
+        self.assertEqual(config.layers[0][1]["foo"], "bar")
+
+        def assign():
+            config["foo"] = "baz"
+
+        self.assertRaises(TypeError, assign)
+
+    def test_pretty_format_config(self):
+        from ..parsing import pretty_format_config
+
+        self.assertEqual(
+            pretty_format_config(self.make_one(), sources=True),
+            [
+                "foo = bar (from global)",
+                "foo1 = moo (from cli)",
+                "nested.a = 1 (from global)",
+                "nested.b = 3 (from file)",
+            ],
+        )
@@ -0,0 +1,144 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+
+class RegistryTestCase(unittest.TestCase):
+    """Installs distribution ``bobtemplates.fake`` registering the template
+    ``fake`` into a temporary :data:`sys.path` entry. Importing its
+    package fails, so tests notice if it is imported.
+    """
+
+    def setUp(self):
+        self.site = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.site)
+        fs_template = os.path.join(self.site, "fakebob", "sub", "tmpl")
+        os.makedirs(fs_template)
+        for package in ["fakebob", os.path.join("fakebob", "sub")]:
+            with open(os.path.join(self.site, package, "__init__.py"), "w") as f:
+                f.write('raise ImportError("must not be imported")\n')
+        with open(os.path.join(fs_template, ".mrbob.ini"), "w") as f:
+            f.write("[variables]\nfoo = bar\n")
+        self.fs_template = fs_template
+        fs_dist = os.path.join(self.site, "bobtemplates.fake-1.0.dist-info")
+        os.mkdir(fs_dist)
+        with open(os.path.join(fs_dist, "METADATA"), "w") as f:
+            f.write("Metadata-Version: 2.1\nName: bobtemplates.fake\nVersion: 1.0\n")
+        with open(os.path.join(fs_dist, "entry_points.txt"), "w") as f:
+            f.write("[mrbob.templates]\nfake = fakebob.sub:tmpl\n")
+        patcher = mock.patch.object(sys, "path", [self.site] + sys.path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+
+class find_package_dirTest(RegistryTestCase):
+    def call_FUT(self, module_name):
+        from ..registry import find_package_dir
+
+        return find_package_dir(module_name)
+
+    def test_package(self):
+        fs_package = os.path.join(self.site, "fakebob", "sub")
+        self.assertEqual(self.call_FUT("fakebob.sub"), fs_package)
+        self.assertFalse("fakebob" in sys.modules)
+
+    def test_module(self):
+        with open(os.path.join(self.site, "fakebob", "mod.py"), "w") as f:
+            f.write("")
+        fs_package = os.path.join(self.site, "fakebob")
+        self.assertEqual(self.call_FUT("fakebob.mod"), fs_package)
+        self.assertEqual(self.call_FUT("fakebob.mod.nested"), None)
+
+    def test_missing(self):
+        self.assertEqual(self.call_FUT("fakebob.missing"), None)
+        self.assertEqual(self.call_FUT("foobar.blabla"), None)
+
+    def test_resolve_dotted_path(self):
+        from ..configurator import resolve_dotted_path
+
+        self.assertEqual(resolve_dotted_path("fakebob.sub:tmpl"), self.fs_template)
+
+
+class load_registryTest(RegistryTestCase):
+    def call_FUT(self, cache_dir=None):
+        from ..registry import load_registry
+
+        return load_registry(cache_dir)
+
+    def test_scan(self):
+        templates = self.call_FUT()
+        self.assertEqual(
+            templates["fake"],
+            {"target": "fakebob.sub:tmpl", "distribution": "bobtemplates.fake"},
+        )
+
+    def test_index(self):
+        templates = self.call_FUT(self.cache_dir)
+        self.assertTrue(os.path.isfile(os.path.join(self.cache_dir, "templates.json")))
+        with mock.patch("mrbob.registry.scan_templates") as scan_templates:
+            self.assertEqual(self.call_FUT(self.cache_dir), templates)
+        self.assertFalse(scan_templates.called)
+
+    def test_index_outdated(self):
+        self.call_FUT(self.cache_dir)
+        # installing a distribution changes the sys.path entry
+        os.utime(self.site, ns=(0, 0))
+        with mock.patch("mrbob.registry.scan_templates") as scan_templates:
+            scan_templates.return_value = {}
+            self.assertEqual(self.call_FUT(self.cache_dir), {})
+        self.assertTrue(scan_templates.called)
+
+    def test_format_templates(self):
+        from ..registry import format_templates
+
+        lines = format_templates(
+            {
+                "fake": {"target": "fakebob.sub:tmpl", "distribution": "fake"},
+                "longer": {"target": "a:b", "distribution": None},
+            }
+        )
+        self.assertEqual(lines, ["fake    fakebob.sub:tmpl (fake)", "longer  a:b"])
+
+
+class parse_templateTest(RegistryTestCase):
+    def call_FUT(self, template_name):
+        from ..configurator import parse_template
+
+        return parse_template(template_name, registry_dir=self.cache_dir)
+
+    def test_registered(self):
+        self.assertEqual(self.call_FUT("fake"), (self.fs_template, False))
+
+    def test_unregistered(self):
+        from ..bobexceptions import ConfigurationError
+
+        self.assertRaises(ConfigurationError, self.call_FUT, "unknown")
+
+    def test_configurator(self):
+        from ..configurator import Configurator
+
+        c = Configurator(
+            template="fake",
+            target_directory=self.cache_dir,
+            bobconfig={"cache_dir": self.cache_dir},
+        )
+        self.assertEqual(c.template_dir, self.fs_template)
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.cache_dir, "registry", "templates.json"))
+        )
+
+    def test_list_templates(self):
+        from six import StringIO
+
+        from ..cli import main
+
+        with mock.patch("sys.stdout", StringIO()) as stdout:
+            main(["--list-templates"])
+        self.assertTrue(
+            "fake  fakebob.sub:tmpl (bobtemplates.fake)" in stdout.getvalue()
+        )
@@ -32,6 +32,7 @@ class render_structureTest(unittest.TestCase):
         renderer=None,
         ignored_files=[],
         ignored_directories=[],
+        **kw,
     ):
         from ..rendering import jinja2_renderer, render_structure
 
@@ -41,7 +42,7 @@ class render_structureTest(unittest.TestCase):
         if renderer is None:
             renderer = jinja2_renderer
 
-        render_structure(
+        return render_structure(
             template,
             output_dir,
             variables,
@@ -49,6 +50,7 @@ class render_structureTest(unittest.TestCase):
             renderer,
             ignored_files,
             ignored_directories,
+            **kw,
         )
 
     def test_subdirectories_created(self):
@@ -98,6 +100,28 @@ class render_structureTest(unittest.TestCase):
         self.assertFalse(os.path.exists("%s/%s" % (self.fs_tempdir, "ignored_stuff")))
         self.assertTrue(os.path.exists("%s/%s" % (self.fs_tempdir, "not_ignored")))
 
+    def test_ignored_directory_paths(self):
+        self.call_FUT(
+            os.path.join(self.fs_templates, "ignored_dirs"),
+            dict(),
+            ignored_directories=["ignored/ignored_subdir", "**/*_stuff"],
+        )
+        self.assertTrue(os.path.exists("%s/%s" % (self.fs_tempdir, "ignored")))
+        self.assertFalse(
+            os.path.exists("%s/%s" % (self.fs_tempdir, "ignored/ignored_subdir"))
+        )
+        self.assertFalse(os.path.exists("%s/%s" % (self.fs_tempdir, "ignored_stuff")))
+        self.assertTrue(os.path.exists("%s/%s" % (self.fs_tempdir, "not_ignored")))
+
+    def test_ignored_files_negation(self):
+        self.call_FUT(
+            os.path.join(self.fs_templates, "ignored"),
+            dict(),
+            ignored_files=["ignored*", "!*.txt"],
+        )
+        self.assertFalse(os.path.exists("%s/%s" % (self.fs_tempdir, "ignored")))
+        self.assertTrue(os.path.exists("%s/%s" % (self.fs_tempdir, "ignored.txt")))
+
     def test_encoding_is_utf8(self):
         from ..rendering import python_formatting_renderer
 
@@ -201,6 +225,335 @@ class render_structureTest(unittest.TestCase):
         self.assertTrue(os.path.exists(fs_rendered))
         self.assertTrue("blather = blubber" in open(fs_rendered).read())
 
+    def test_plus_in_target_root(self):
+        from ..rendering import python_formatting_renderer
+
+        output_dir = os.path.join(self.fs_tempdir, "+name+")
+        os.mkdir(output_dir)
+        self.call_FUT(
+            os.path.join(self.fs_templates, "renamed"),
+            dict(name="blubber", module="blather"),
+            output_dir=output_dir,
+            verbose=False,
+            renderer=python_formatting_renderer,
+        )
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(output_dir, "blatherparts/blubber_etc/blubber.conf")
+            )
+        )
+
+    @mock.patch("mrbob.rendering.render_filename")
+    def test_directory_names_rendered_once(self, mock_render_filename):
+        from ..rendering import python_formatting_renderer
+
+        mock_render_filename.side_effect = lambda name, variables: name
+        self.call_FUT(
+            os.path.join(self.fs_templates, "unbound"),
+            dict(ip_addr="192.168.0.1", access_control="10.0.1.0/16 allow"),
+            verbose=False,
+            renderer=python_formatting_renderer,
+        )
+        names = [c[0][0] for c in mock_render_filename.call_args_list]
+        self.assertEqual(
+            sorted(names),
+            sorted(
+                ["etc", "usr", "rc.conf", "local", "etc", "unbound", "unbound.conf"]
+            ),
+        )
+
+    def test_parallel_threads(self):
+        from ..rendering import python_formatting_renderer
+
+        self.call_FUT(
+            os.path.join(self.fs_templates, "renamed"),
+            dict(name="blubber", module="blather"),
+            verbose=False,
+            renderer=python_formatting_renderer,
+            jobs=4,
+        )
+        fs_rendered = os.path.join(
+            self.fs_tempdir, "blatherparts/blubber_etc/blubber.conf"
+        )
+        self.assertTrue("blather = blubber" in open(fs_rendered).read())
+
+    def test_parallel_processes(self):
+        from ..rendering import python_formatting_renderer
+
+        self.call_FUT(
+            os.path.join(self.fs_templates, "unbound"),
+            dict(ip_addr="192.168.0.1", access_control="10.0.1.0/16 allow"),
+            verbose=False,
+            renderer=python_formatting_renderer,
+            jobs=2,
+            executor="process",
+        )
+        fs_unbound_conf = os.path.join(
+            self.fs_tempdir, "usr/local/etc/unbound/unbound.conf"
+        )
+        self.assertTrue("interface: 192.168.0.1" in open(fs_unbound_conf).read())
+        self.assertTrue(os.path.exists(os.path.join(self.fs_tempdir, "etc/rc.conf")))
+
+    def test_parallel_verbose_in_order(self):
+        from six import StringIO
+
+        from ..rendering import python_formatting_renderer
+
+        stdout = StringIO()
+        with mock.patch("sys.stdout", stdout):
+            self.call_FUT(
+                os.path.join(self.fs_templates, "unbound"),
+                dict(ip_addr="192.168.0.1", access_control="10.0.1.0/16 allow"),
+                renderer=python_formatting_renderer,
+                jobs=2,
+            )
+        lines = stdout.getvalue().splitlines()
+        self.assertTrue(lines[-2].startswith("Copying "))
+        self.assertTrue(lines[-1].startswith("Rendering "))
+
+    def test_parallel_error(self):
+        self.assertRaises(
+            KeyError,
+            self.call_FUT,
+            os.path.join(self.fs_templates, "renamed"),
+            dict(module="blather"),
+            verbose=False,
+            jobs=2,
+        )
+
+    def test_unknown_executor(self):
+        self.assertRaises(
+            ValueError,
+            self.call_FUT,
+            os.path.join(self.fs_templates, "unbound"),
+            dict(ip_addr="192.168.0.1", access_control="10.0.1.0/16 allow"),
+            jobs=2,
+            executor="fork",
+        )
+
+    def test_stats(self):
+        from ..rendering import python_formatting_renderer
+
+        stats = self.call_FUT(
+            os.path.join(self.fs_templates, "unbound"),
+            dict(ip_addr="192.168.0.1", access_control="10.0.1.0/16 allow"),
+            verbose=False,
+            renderer=python_formatting_renderer,
+        )
+        self.assertEqual(stats, {"created": 2})
+
+    def test_skip_unchanged(self):
+        from ..rendering import python_formatting_renderer
+
+        variables = dict(ip_addr="192.168.0.1", access_control="10.0.1.0/16 allow")
+        kw = dict(
+            verbose=False, renderer=python_formatting_renderer, skip_unchanged=True
+        )
+        template = os.path.join(self.fs_templates, "unbound")
+        self.call_FUT(template, variables, **kw)
+        fs_conf = os.path.join(self.fs_tempdir, "usr/local/etc/unbound/unbound.conf")
+        fs_rc = os.path.join(self.fs_tempdir, "etc/rc.conf")
+        os.utime(fs_conf, (1000000000, 1000000000))
+        os.utime(fs_rc, (1000000000, 1000000000))
+
+        stats = self.call_FUT(template, variables, **kw)
+        self.assertEqual(stats, {"unchanged": 2})
+        self.assertEqual(os.stat(fs_conf).st_mtime, 1000000000)
+        self.assertEqual(os.stat(fs_rc).st_mtime, 1000000000)
+
+        variables["ip_addr"] = "192.168.0.2"
+        stats = self.call_FUT(template, variables, **kw)
+        self.assertEqual(stats, {"unchanged": 1, "written": 1})
+        self.assertTrue("interface: 192.168.0.2" in open(fs_conf).read())
+
+    def test_skip_unchanged_stream(self):
+        variables = {"foo.bar": "1"}
+        template = os.path.join(self.fs_templates, "missing_namespace_key")
+        kw = dict(verbose=False, stream=True, skip_unchanged=True)
+        self.call_FUT(template, variables, **kw)
+        fs_foo = os.path.join(self.fs_tempdir, "foo_jinja2")
+        os.utime(fs_foo, (1000000000, 1000000000))
+
+        stats = self.call_FUT(template, variables, **kw)
+        self.assertEqual(stats["unchanged"], 2)
+        self.assertEqual(os.stat(fs_foo).st_mtime, 1000000000)
+
+        stats = self.call_FUT(template, {"foo.bar": "2"}, **kw)
+        self.assertEqual(stats, {"unchanged": 1, "written": 1})
+        with open(fs_foo) as f:
+            self.assertEqual(f.read(), "2\n")
+        self.assertEqual(sorted(os.listdir(self.fs_tempdir)), ["foo", "foo_jinja2"])
+
+    def test_skip_unchanged_stream_error(self):
+        from jinja2 import UndefinedError
+
+        template = os.path.join(self.fs_templates, "missing_namespace_key")
+        kw = dict(verbose=False, stream=True, skip_unchanged=True)
+        self.call_FUT(template, {"foo.bar": "1"}, **kw)
+        self.assertRaises(UndefinedError, self.call_FUT, template, {}, **kw)
+        self.assertEqual(sorted(os.listdir(self.fs_tempdir)), ["foo", "foo_jinja2"])
+
+    def test_skip_unchanged_parallel(self):
+        from ..rendering import python_formatting_renderer
+
+        variables = dict(ip_addr="192.168.0.1", access_control="10.0.1.0/16 allow")
+        kw = dict(
+            verbose=False,
+            renderer=python_formatting_renderer,
+            skip_unchanged=True,
+            jobs=2,
+        )
+        template = os.path.join(self.fs_templates, "unbound")
+        self.call_FUT(template, variables, **kw)
+        stats = self.call_FUT(template, variables, **kw)
+        self.assertEqual(stats, {"unchanged": 2})
+
+
+class plan_structureTest(unittest.TestCase):
+    def setUp(self):
+        import mrbob
+
+        self.fs_tempdir = mkdtemp()
+        self.fs_templates = os.path.abspath(
+            os.path.join(os.path.dirname(mrbob.__file__), "tests", "templates")
+        )
+
+    def tearDown(self):
+        rmtree(self.fs_tempdir)
+
+    def call_FUT(self, template, variables, render_content=False):
+        from ..rendering import plan_structure, python_formatting_renderer
+
+        return plan_structure(
+            os.path.join(self.fs_templates, template),
+            self.fs_tempdir,
+            variables,
+            python_formatting_renderer,
+            [],
+            [],
+            render_content=render_content,
+        )
+
+    def test_operations(self):
+        plan = self.call_FUT("renamed", dict(name="blubber", module="blather"))
+        self.assertEqual(
+            [(o["action"], o["target"]) for o in plan["operations"]],
+            [
+                ("mkdir", os.path.join(self.fs_tempdir, "blatherparts")),
+                ("mkdir", os.path.join(self.fs_tempdir, "blatherparts/blubber_etc")),
+                (
+                    "render",
+                    os.path.join(
+                        self.fs_tempdir, "blatherparts/blubber_etc/blubber.conf"
+                    ),
+                ),
+            ],
+        )
+        self.assertEqual(plan["collisions"], [])
+        self.assertEqual(os.listdir(self.fs_tempdir), [])
+
+    def test_render_content(self):
+        plan = self.call_FUT("missing_namespace_key", {"foo.bar": "12345"}, True)
+        sizes = dict((o["source"], o["size"]) for o in plan["operations"])
+        self.assertEqual(sizes["foo.bob"], 6)
+
+    def test_collisions(self):
+        fs_template = mkdtemp()
+        self.addCleanup(rmtree, fs_template)
+        for name in ("+a+", "+b+"):
+            with open(os.path.join(fs_template, name), "w") as f:
+                f.write(name)
+        plan = self.call_FUT(fs_template, dict(a="x", b="x"))
+        self.assertEqual(
+            plan["collisions"],
+            [dict(target=os.path.join(self.fs_tempdir, "x"), sources=["+a+", "+b+"])],
+        )
+
+
+class get_render_planTest(unittest.TestCase):
+    def setUp(self):
+        from ..rendering import render_plans
+
+        render_plans.clear()
+        self.fs_template = mkdtemp()
+        self.fs_cache = mkdtemp()
+        os.makedirs(os.path.join(self.fs_template, "+name+", "sub"))
+        with open(
+            os.path.join(self.fs_template, "+name+", "sub", "a.txt.bob"), "w"
+        ) as f:
+            f.write("{{{name}}}")
+        with open(os.path.join(self.fs_template, "README"), "w") as f:
+            f.write("readme")
+
+    def tearDown(self):
+        rmtree(self.fs_template)
+        rmtree(self.fs_cache)
+
+    def call_FUT(self, cache_dir=None, fingerprint=None):
+        from ..rendering import get_render_plan
+
+        return get_render_plan(
+            self.fs_template, [], [], cache_dir=cache_dir, fingerprint=fingerprint
+        )
+
+    def test_operations(self):
+        plan = self.call_FUT()
+        self.assertEqual(
+            [
+                (o.action, o.source, o.name, o.size, o.has_variables)
+                for o in plan.operations
+            ],
+            [
+                ("copy", "README", "README", 6, False),
+                ("mkdir", "+name+", "+name+", 0, True),
+                ("mkdir", os.path.join("+name+", "sub"), "sub", 0, True),
+                (
+                    "render",
+                    os.path.join("+name+", "sub", "a.txt.bob"),
+                    "a.txt",
+                    10,
+                    True,
+                ),
+            ],
+        )
+
+    def test_resolve(self):
+        plan = self.call_FUT()
+        targets = [t for o, t in plan.resolve("/out", {"name": "foo"})]
+        self.assertEqual(
+            targets,
+            ["/out/README", "/out/foo", "/out/foo/sub", "/out/foo/sub/a.txt"],
+        )
+
+    def test_memory_cache(self):
+        self.assertTrue(self.call_FUT() is self.call_FUT())
+
+    def test_invalidated_by_directory_mtime(self):
+        plan = self.call_FUT()
+        with open(os.path.join(self.fs_template, "+name+", "new"), "w") as f:
+            f.write("new")
+        os.utime(os.path.join(self.fs_template, "+name+"), ns=(0, 0))
+        self.assertFalse(plan.is_fresh())
+        self.assertEqual(len(self.call_FUT().operations), 5)
+
+    def test_fingerprint(self):
+        plan = self.call_FUT(fingerprint="abc")
+        with open(os.path.join(self.fs_template, "new"), "w") as f:
+            f.write("new")
+        self.assertTrue(self.call_FUT(fingerprint="abc") is plan)
+        self.assertFalse(self.call_FUT(fingerprint="def") is plan)
+
+    def test_disk_cache(self):
+        from ..rendering import render_plans
+
+        self.call_FUT(cache_dir=self.fs_cache)
+        self.assertEqual(len(os.listdir(self.fs_cache)), 1)
+        render_plans.clear()
+        with mock.patch("mrbob.rendering.scan_template") as mock_scan:
+            plan = self.call_FUT(cache_dir=self.fs_cache)
+        self.assertFalse(mock_scan.called)
+        self.assertEqual(len(plan.operations), 4)
+
 
 class render_templateTest(unittest.TestCase):
     def setUp(self):
@@ -215,7 +568,7 @@ class render_templateTest(unittest.TestCase):
         rmtree(self.fs_tempdir)
 
     def call_FUT(
-        self, template, variables, output_dir=None, verbose=False, renderer=None
+        self, template, variables, output_dir=None, verbose=False, renderer=None, **kw
     ):
         from ..rendering import python_formatting_renderer, render_template
 
@@ -231,6 +584,7 @@ class render_templateTest(unittest.TestCase):
             variables,
             verbose,
             renderer,
+            **kw,
         )
 
     def test_render_copy(self):
@@ -302,6 +656,61 @@ class render_templateTest(unittest.TestCase):
         with open(filename) as f:
             self.assertEqual(f.read(), "2\n")
 
+    def test_render_stream(self):
+        """output is written as produced by `renderer.generate`"""
+        renderer = mock.Mock()
+        renderer.generate.return_value = iter(["1", "", "2"])
+        t = os.path.join(self.fs_templates, "missing_namespace_key/foo.bob")
+
+        filename = self.call_FUT(t, {"foo.bar": "1"}, renderer=renderer, stream=True)
+        self.assertFalse(renderer.called)
+        with open(filename) as f:
+            self.assertEqual(f.read(), "12\n")
+
+    def test_render_stream_error(self):
+        from jinja2 import UndefinedError
+
+        from ..rendering import jinja2_renderer, render_template
+
+        t = os.path.join(self.fs_templates, "missing_namespace_key/foo_jinja2.bob")
+        fs_target = os.path.join(self.fs_tempdir, "foo_jinja2")
+        with open(fs_target, "w") as f:
+            f.write("old")
+        self.assertRaises(
+            UndefinedError,
+            render_template,
+            t,
+            self.fs_tempdir,
+            {},
+            False,
+            jinja2_renderer,
+            stream=True,
+        )
+        with open(fs_target) as f:
+            self.assertEqual(f.read(), "old")
+        self.assertEqual(os.listdir(self.fs_tempdir), ["foo_jinja2"])
+
+    def test_render_stream_jinja2(self):
+        from ..rendering import jinja2_renderer, render_template
+
+        t = os.path.join(self.fs_templates, "missing_namespace_key/foo_jinja2.bob")
+        filename = render_template(
+            t, self.fs_tempdir, {"foo.bar": "2"}, False, jinja2_renderer, stream=True
+        )
+        with open(filename) as f:
+            self.assertEqual(f.read(), "2\n")
+
+    def test_render_stream_unsupported(self):
+        """renderers without `generate` render the whole output at once"""
+        from ..rendering import render_template
+
+        t = os.path.join(self.fs_templates, "missing_namespace_key/foo.bob")
+        filename = render_template(
+            t, self.fs_tempdir, {"foo.bar": "1"}, False, lambda s, v: s % v, stream=True
+        )
+        with open(filename) as f:
+            self.assertEqual(f.read(), "1\n")
+
     def test_render_namespace_missing_key(self):
         t = os.path.join(self.fs_templates, "missing_namespace_key/foo.bob")
 
@@ -370,6 +779,15 @@ class render_filenameTest(unittest.TestCase):
     def test_missing_key(self):
         self.assertRaises(KeyError, self.call_FUT, "foo+bar+blub", dict())
 
+    def test_tokenize(self):
+        from ..rendering import tokenize_filename
+
+        self.assertEqual(
+            tokenize_filename("em0_+ip_addr+.conf", "/"),
+            ((False, "em0_"), (True, "ip_addr"), (False, ".conf")),
+        )
+        self.assertEqual(tokenize_filename("foobar", "/"), ((False, "foobar"),))
+
 
 class parse_variablesTest(unittest.TestCase):
     def test_complex_example(self):
@@ -397,3 +815,320 @@ class parse_variablesTest(unittest.TestCase):
 
         # there is no such key in this namespace
         self.assertRaises(KeyError, lambda x: vars_["author"][x], "foo")
+
+
+class compile_templateTest(unittest.TestCase):
+    def setUp(self):
+        from ..rendering import compiled_templates
+
+        self.cache_dir = mkdtemp()
+        compiled_templates.clear()
+
+    def tearDown(self):
+        from ..rendering import configure_bytecode_cache
+
+        configure_bytecode_cache(None)
+        rmtree(self.cache_dir)
+
+    def call_FUT(self, source):
+        from ..rendering import compile_template
+
+        return compile_template(source)
+
+    def test_memory_cache(self):
+        t1 = self.call_FUT("{{{foo}}}")
+        t2 = self.call_FUT("{{{foo}}}")
+        self.assertTrue(t1 is t2)
+        self.assertEqual(t1.render(foo="bar"), "bar")
+
+    def test_memory_cache_eviction(self):
+        from ..rendering import compiled_templates
+
+        with mock.patch("mrbob.rendering.TEMPLATE_MEMORY_CACHE_SIZE", 2):
+            for name in ["a", "b", "c"]:
+                self.call_FUT("{{{%s}}}" % name)
+            self.assertEqual(len(compiled_templates), 2)
+            self.assertEqual(self.call_FUT("{{{c}}}").render(c="c"), "c")
+
+    def test_memory_cache_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        from ..rendering import compiled_templates
+
+        sources = ["{{{v%d}}}" % i for i in range(200)]
+        with mock.patch("mrbob.rendering.TEMPLATE_MEMORY_CACHE_SIZE", 4):
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                templates = list(pool.map(self.call_FUT, sources))
+            self.assertTrue(len(compiled_templates) <= 4)
+        self.assertEqual(templates[42].render(v42="x"), "x")
+
+    def test_key_depends_on_environment(self):
+        from jinja2 import Environment
+
+        from ..rendering import jinja2_env, template_cache_key
+
+        self.assertNotEqual(
+            template_cache_key("{{{foo}}}", jinja2_env),
+            template_cache_key("{{{foo}}}", Environment()),
+        )
+
+    def test_bytecode_cache_skips_compilation(self):
+        from ..rendering import (
+            compiled_templates,
+            configure_bytecode_cache,
+            jinja2_env,
+        )
+
+        configure_bytecode_cache(self.cache_dir)
+        self.call_FUT("{{{foo}}}")
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        compiled_templates.clear()
+        with mock.patch.object(jinja2_env, "compile") as mock_compile:
+            template = self.call_FUT("{{{foo}}}")
+        self.assertFalse(mock_compile.called)
+        self.assertEqual(template.render(foo="bar"), "bar")
+
+    def test_bytecode_cache_eviction(self):
+        from ..rendering import configure_bytecode_cache
+
+        configure_bytecode_cache(self.cache_dir, max_size=1)
+        self.call_FUT("{{{foo}}}")
+        self.call_FUT("{{{bar}}}")
+        self.assertTrue(len(os.listdir(self.cache_dir)) <= 1)
+
+    def count_prunes(self, count, max_size):
+        from ..caching import prune_directory
+        from ..rendering import compiled_templates, configure_bytecode_cache
+
+        rmtree(self.cache_dir)
+        compiled_templates.clear()
+        configure_bytecode_cache(self.cache_dir, max_size=max_size)
+        with mock.patch(
+            "mrbob.rendering.prune_directory", wraps=prune_directory
+        ) as prune:
+            for i in range(count):
+                self.call_FUT("{{{v%d}}}" % i)
+        return prune.call_count
+
+    def test_bytecode_cache_prunes(self):
+        self.assertEqual(self.count_prunes(10, 10**9), 1)
+        self.assertEqual(self.count_prunes(200, 10**9), 1)
+        # a full cache is pruned once per quarter of max_size written
+        size = os.path.getsize(
+            os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+        )
+        prunes = self.count_prunes(200, size * 40)
+        self.assertTrue(prunes <= 200 // 10 + 1, prunes)
+        total = sum(
+            os.path.getsize(os.path.join(self.cache_dir, name))
+            for name in os.listdir(self.cache_dir)
+        )
+        self.assertTrue(total <= size * 40)
+
+
+class RenderContextTest(unittest.TestCase):
+    def call_FUT(self, variables):
+        from ..rendering import RenderContext
+
+        return RenderContext(variables)
+
+    def test_mapping(self):
+        context = self.call_FUT({"author.name": "foo", "license": "BSD"})
+        self.assertEqual(dict(context), {"author.name": "foo", "license": "BSD"})
+        self.assertEqual(context["author.name"], "foo")
+        self.assertEqual(len(context), 2)
+        self.assertEqual("%(author.name)s" % context, "foo")
+
+    def test_nested_is_frozen(self):
+        context = self.call_FUT({"author.name": "foo"})
+        self.assertEqual(context.nested["author"]["name"], "foo")
+        with self.assertRaises(TypeError):
+            context.nested["author"]["name"] = "bar"
+
+    def test_conflicting_namespaces(self):
+        from ..bobexceptions import ConfigurationError
+
+        context = self.call_FUT({"author": "foo", "author.name": "bar"})
+        self.assertRaises(ConfigurationError, getattr, context, "nested")
+
+    def test_flat_renderer(self):
+        from ..rendering import python_formatting_renderer
+
+        context = self.call_FUT({"foo": "1", "foo.bar": "2"})
+        self.assertEqual(
+            python_formatting_renderer("%(foo)s %(foo.bar)s", context), "1 2"
+        )
+        self.assertFalse("nested" in context.__dict__)
+
+    def test_pickle(self):
+        import pickle
+
+        context = pickle.loads(pickle.dumps(self.call_FUT({"author.name": "foo"})))
+        self.assertEqual(context.nested["author"]["name"], "foo")
+
+    def test_jinja2_renderer(self):
+        from ..rendering import jinja2_renderer
+
+        context = self.call_FUT({"author.name": "foo"})
+        self.assertEqual(jinja2_renderer("{{{author.name}}}", context), "foo")
+
+    @mock.patch("mrbob.rendering.nest_variables")
+    def test_built_once_per_render(self, mock_nest_variables):
+        import mrbob
+
+        from ..rendering import jinja2_renderer, render_structure
+
+        mock_nest_variables.return_value = {"foo": {"bar": "1"}}
+        fs_tempdir = mkdtemp()
+        self.addCleanup(rmtree, fs_tempdir)
+        render_structure(
+            os.path.join(
+                os.path.dirname(mrbob.__file__),
+                "tests",
+                "templates",
+                "missing_namespace_key",
+            ),
+            fs_tempdir,
+            {"foo.bar": "1"},
+            False,
+            jinja2_renderer,
+            [],
+            [],
+        )
+        self.assertEqual(mock_nest_variables.call_count, 1)
+
+
+class update_structureTest(unittest.TestCase):
+    def setUp(self):
+        self.fs_tempdir = mkdtemp()
+        self.addCleanup(rmtree, self.fs_tempdir)
+        self.template = os.path.join(self.fs_tempdir, "template")
+        self.target = os.path.join(self.fs_tempdir, "target")
+        for name, content in [
+            ("+package+/+module+.py.bob", "# {{{author}}}\n"),
+            ("+package+/static.txt", "static\n"),
+            ("README.bob", "{{{description}}}\n"),
+            ("setup.py.bob", "{{{package}}}\n"),
+        ]:
+            fs_path = os.path.join(self.template, name)
+            if not os.path.isdir(os.path.dirname(fs_path)):
+                os.makedirs(os.path.dirname(fs_path))
+            with open(fs_path, "w") as f:
+                f.write(content)
+        self.previous = dict(package="pkg", module="mod", author="a", description="d")
+        os.mkdir(self.target)
+        self.render(self.previous)
+
+    def render(self, variables):
+        from ..rendering import jinja2_renderer, render_structure
+
+        render_structure(
+            self.template, self.target, variables, False, jinja2_renderer, [], []
+        )
+
+    def call_FUT(self, **changes):
+        from ..analysis import template_dependencies
+        from ..rendering import jinja2_renderer, update_structure
+
+        variables = dict(self.previous, **changes)
+        return update_structure(
+            self.template,
+            self.target,
+            variables,
+            self.previous,
+            template_dependencies(self.template, [], []),
+            False,
+            jinja2_renderer,
+            [],
+            [],
+        )
+
+    def read(self, *names):
+        with open(os.path.join(self.target, *names)) as f:
+            return f.read()
+
+    def test_content_changed(self):
+        fs_static = os.path.join(self.target, "pkg", "static.txt")
+        os.utime(fs_static, (0, 0))
+        stats = self.call_FUT(description="new")
+        self.assertEqual(self.read("README"), "new\n")
+        self.assertEqual(stats["written"], 1)
+        self.assertEqual(stats["kept"], 3)
+        self.assertEqual(os.stat(fs_static).st_mtime, 0)
+
+    def test_nothing_changed(self):
+        stats = self.call_FUT()
+        self.assertEqual(stats, {"kept": 4})
+
+    def test_directory_renamed(self):
+        stats = self.call_FUT(package="other")
+        self.assertEqual(
+            sorted(os.listdir(self.target)), ["README", "other", "setup.py"]
+        )
+        self.assertEqual(self.read("other", "static.txt"), "static\n")
+        self.assertEqual(self.read("setup.py"), "other\n")
+        self.assertEqual(stats["renamed"], 1)
+        # setup.py, and the module as its dependencies include its directory
+        self.assertEqual(stats["written"], 2)
+
+    def test_method_call_dependency(self):
+        from ..analysis import template_dependencies
+        from ..rendering import jinja2_renderer, update_structure
+
+        rmtree(self.template)
+        rmtree(self.target)
+        os.makedirs(self.template)
+        os.mkdir(self.target)
+        with open(os.path.join(self.template, "AUTHORS.bob"), "w") as f:
+            f.write("{{% for k, v in author.items() %}}{{{v}}}{{% endfor %}}\n")
+        previous = {"author.name": "a"}
+        self.render(previous)
+        stats = update_structure(
+            self.template,
+            self.target,
+            {"author.name": "b"},
+            previous,
+            template_dependencies(self.template, [], []),
+            False,
+            jinja2_renderer,
+            [],
+            [],
+        )
+        self.assertEqual(self.read("AUTHORS"), "b\n")
+        self.assertEqual(stats["written"], 1)
+
+    def test_file_renamed(self):
+        stats = self.call_FUT(module="new", author="b")
+        self.assertEqual(
+            os.listdir(os.path.join(self.target, "pkg")).count("mod.py"), 0
+        )
+        self.assertEqual(self.read("pkg", "new.py"), "# b\n")
+        self.assertEqual(stats["renamed"], 1)
+
+    def test_rename_target_exists(self):
+        os.mkdir(os.path.join(self.target, "other"))
+        self.call_FUT(package="other")
+        self.assertEqual(self.read("other", "static.txt"), "static\n")
+        self.assertEqual(self.read("other", "mod.py"), "# a\n")
+
+    def test_missing_file_created(self):
+        os.remove(os.path.join(self.target, "pkg", "static.txt"))
+        stats = self.call_FUT()
+        self.assertEqual(self.read("pkg", "static.txt"), "static\n")
+        self.assertEqual(stats["created"], 1)
+
+    def test_new_variable(self):
+        del self.previous["module"]
+        self.call_FUT(module="mod2")
+        self.assertEqual(self.read("pkg", "mod2.py"), "# a\n")
+
+    def test_changed_variables(self):
+        from ..rendering import changed_variables
+
+        self.assertEqual(
+            changed_variables(
+                {"a": "1", "b": "True", "c": "x"}, {"a": "2", "b": True, "d": "y"}
+            ),
+            set(["a", "c", "d"]),
+        )
@@ -0,0 +1,250 @@
+import os
+import pickle
+import shutil
+import stat
+import tempfile
+import unittest
+import zipfile
+
+
+def write_zip(fs_zip, files, directories=()):
+    """Write `files`, mapping names to ``(content, mode)``, to `fs_zip`."""
+    with zipfile.ZipFile(fs_zip, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name in directories:
+            info = zipfile.ZipInfo(name + "/")
+            info.external_attr = (stat.S_IFDIR | 0o750) << 16
+            zf.writestr(info, "")
+        for name, (content, mode) in files.items():
+            info = zipfile.ZipInfo(name, date_time=(2020, 1, 2, 3, 4, 6))
+            info.external_attr = mode << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+            zf.writestr(info, content)
+
+
+class ZipSourceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.fs_zip = os.path.join(self.tmpdir, "template.zip")
+        write_zip(
+            self.fs_zip,
+            {
+                "root/.mrbob.ini": ("[questions]\n", 0o644),
+                "root/+name+.sh.bob": ("echo {{{name}}}\n", 0o755),
+                "root/static/data.txt": ("data", 0o600),
+                "root/nested/deeper/file": ("", 0o644),
+                "other/file": ("", 0o644),
+            },
+            directories=["root/static"],
+        )
+
+    def make_one(self, subpath="root"):
+        from ..sources import ZipSource
+
+        return ZipSource(self.fs_zip, subpath)
+
+    def test_root(self):
+        self.assertEqual(self.make_one().root, os.path.join(self.fs_zip, "root"))
+        self.assertEqual(self.make_one("").root, self.fs_zip)
+
+    def test_walk(self):
+        walked = list(self.make_one().walk())
+        self.assertEqual(
+            walked,
+            [
+                ("", ["nested", "static"], ["+name+.sh.bob", ".mrbob.ini"]),
+                ("nested", ["deeper"], []),
+                (os.path.join("nested", "deeper"), [], ["file"]),
+                ("static", [], ["data.txt"]),
+            ],
+        )
+
+    def test_walk_pruned(self):
+        walked = []
+        for directory, directories, files in self.make_one().walk():
+            directories[:] = [d for d in directories if d != "nested"]
+            walked.append(directory)
+        self.assertEqual(walked, ["", "static"])
+
+    def test_walk_missing_subpath(self):
+        self.assertEqual(list(self.make_one("nope").walk()), [])
+
+    def test_stat(self):
+        source = self.make_one()
+        st = source.stat(os.path.join(source.root, "+name+.sh.bob"))
+        self.assertEqual(st.mode, 0o755)
+        self.assertEqual(st.size, len("echo {{{name}}}\n"))
+        self.assertEqual(source.stat(os.path.join(source.root, "static")).mode, 0o750)
+        self.assertEqual(source.stat(os.path.join(source.root, "nested")).mode, 0o755)
+
+    def test_isfile(self):
+        source = self.make_one()
+        self.assertTrue(source.isfile(os.path.join(source.root, ".mrbob.ini")))
+        self.assertFalse(source.isfile(os.path.join(source.root, "static")))
+        self.assertFalse(source.isfile(os.path.join(source.root, "missing")))
+
+    def test_read_text(self):
+        source = self.make_one()
+        text = source.read_text(os.path.join(source.root, ".mrbob.ini"))
+        self.assertEqual(text, "[questions]\n")
+
+    def test_copy(self):
+        source = self.make_one()
+        fs_source = os.path.join(source.root, "static", "data.txt")
+        fs_target = os.path.join(self.tmpdir, "data.txt")
+        self.assertFalse(source.is_copied(fs_source, fs_target))
+        source.copy(fs_source, fs_target, "symlink")
+        self.assertFalse(os.path.islink(fs_target))
+        with open(fs_target) as f:
+            self.assertEqual(f.read(), "data")
+        self.assertEqual(stat.S_IMODE(os.stat(fs_target).st_mode), 0o600)
+        self.assertTrue(source.is_copied(fs_source, fs_target))
+        with open(fs_target, "w") as f:
+            f.write("date")
+        self.assertFalse(source.is_copied(fs_source, fs_target))
+
+    def test_missing_file(self):
+        source = self.make_one()
+        self.assertRaises(OSError, source.open, os.path.join(source.root, "missing"))
+
+    def test_pickle(self):
+        source = self.make_one()
+        list(source.walk())
+        copied = pickle.loads(pickle.dumps(source))
+        self.assertEqual(copied.root, source.root)
+        self.assertEqual(len(list(copied.walk())), 4)
+
+
+class unsafe_zipTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.fs_zip = os.path.join(self.tmpdir, "template.zip")
+
+    def make_one(self, name):
+        from ..sources import ZipSource
+
+        write_zip(self.fs_zip, {"ok.txt": ("", 0o644), name: ("escaped", 0o644)})
+        return ZipSource(self.fs_zip)
+
+    def test_unsafe_names(self):
+        from ..bobexceptions import ConfigurationError
+
+        for name in [
+            "../escaped.txt",
+            "a/../../escaped.txt",
+            "/etc/escaped.txt",
+            "a//escaped.txt",
+            "C:/escaped.txt",
+            "C:escaped.txt",
+            "..\\escaped.txt",
+        ]:
+            source = self.make_one(name)
+            with self.assertRaises(ConfigurationError, msg=name):
+                list(source.walk())
+
+    def test_render_structure(self):
+        from ..bobexceptions import ConfigurationError
+        from ..rendering import jinja2_renderer, render_structure
+
+        self.make_one("../escaped.txt")
+        fs_out = os.path.join(self.tmpdir, "out")
+        fs_target = os.path.join(fs_out, "target")
+        os.makedirs(fs_target)
+        self.assertRaises(
+            ConfigurationError,
+            render_structure,
+            self.fs_zip,
+            fs_target,
+            {},
+            False,
+            jinja2_renderer,
+            [],
+            [],
+        )
+        self.assertEqual(os.listdir(fs_out), ["target"])
+
+
+class open_sourceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def call_FUT(self, fs_root):
+        from ..sources import open_source
+
+        return open_source(fs_root)
+
+    def test_directory(self):
+        from ..sources import DirectorySource
+
+        source = self.call_FUT(self.tmpdir)
+        self.assertTrue(isinstance(source, DirectorySource))
+        self.assertTrue(source.local)
+        self.assertTrue(self.call_FUT(source) is source)
+
+    def test_zipfile(self):
+        fs_zip = os.path.join(self.tmpdir, "t.zip")
+        write_zip(fs_zip, {"a/b/c": ("", 0o644)})
+        source = self.call_FUT(os.path.join(fs_zip, "a", "b"))
+        self.assertFalse(source.local)
+        self.assertEqual((source.archive, source.subpath), (fs_zip, "a/b"))
+
+    def test_missing(self):
+        from ..bobexceptions import ConfigurationError
+
+        self.assertRaises(
+            ConfigurationError, self.call_FUT, os.path.join(self.tmpdir, "x", "y")
+        )
+        with open(os.path.join(self.tmpdir, "x"), "w") as f:
+            f.write("not a zip")
+        self.assertRaises(
+            ConfigurationError, self.call_FUT, os.path.join(self.tmpdir, "x", "y")
+        )
+
+
+class render_zipTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.fs_zip = os.path.join(self.tmpdir, "template.zip")
+        self.target = os.path.join(self.tmpdir, "out")
+        write_zip(
+            self.fs_zip,
+            {
+                "t/.mrbob.ini": ("[variables]\nname = bob\n", 0o644),
+                "t/+name+/run.sh.bob": ("echo {{{name}}}\n", 0o755),
+                "t/static.txt": ("static\n", 0o640),
+                "t/ignored.swp": ("", 0o644),
+            },
+        )
+
+    def test_configurator(self):
+        from ..configurator import Configurator
+
+        c = Configurator(
+            template=os.path.join(self.fs_zip, "t"),
+            target_directory=self.target,
+            bobconfig={"ignored_files": "*.swp", "jobs": "2"},
+            variables={"name": "alice"},
+        )
+        c.render()
+        fs_script = os.path.join(self.target, "alice", "run.sh")
+        with open(fs_script) as f:
+            self.assertEqual(f.read(), "echo alice\n")
+        self.assertEqual(stat.S_IMODE(os.stat(fs_script).st_mode), 0o755)
+        fs_static = os.path.join(self.target, "static.txt")
+        self.assertEqual(stat.S_IMODE(os.stat(fs_static).st_mode), 0o640)
+        self.assertEqual(sorted(os.listdir(self.target)), ["alice", "static.txt"])
+        self.assertEqual(c.render_stats["created"], 2)
+
+    def test_skip_unchanged(self):
+        from ..rendering import jinja2_renderer, render_structure
+
+        fs_root = os.path.join(self.fs_zip, "t")
+        options = dict(skip_unchanged=True)
+        args = (fs_root, self.target, {"name": "a"}, False, jinja2_renderer, [], [])
+        os.mkdir(self.target)
+        render_structure(*args, **options)
+        stats = render_structure(*args, **options)
+        self.assertEqual(stats["unchanged"], 3)